@@ -0,0 +1,79 @@
+"""
+<Program Name>
+  benchmark_elaboration.py
+
+<Purpose>
+  Times elaboration of dependencies (see depdata.elaborate_dependencies) with
+  pip's SpecifierSet filtering and with the numpy engine in
+  vectorized_elaboration, and checks that the two agree exactly.
+
+  Usage:
+    python -m depresolve.benchmark_elaboration [<deps json file>]
+
+  The deps file defaults to depdata.DEPENDENCIES_DB_FNAME
+  (data/dependencies.json).
+
+"""
+
+import depresolve
+import depresolve.depdata as depdata
+import depresolve.vectorized_elaboration as vectorized_elaboration
+
+import sys
+import time
+
+
+
+
+def main():
+  if len(sys.argv) > 1:
+    deps_fname = sys.argv[1]
+  else:
+    deps_fname = depdata.DEPENDENCIES_DB_FNAME
+
+  deps = depdata.load_json_db(deps_fname, error_mode='raise')
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+
+  print('Elaborating ' + str(len(deps)) + ' dists of ' +
+      str(len(versions_by_package)) + ' packages.')
+
+  results = benchmark(deps, versions_by_package)
+
+  for (engine, seconds) in results:
+    print('  ' + engine + ': ' + '%.2f' % seconds + 's')
+
+
+
+
+
+def benchmark(deps, versions_by_package, allow_prerelease=False):
+  """
+  Elaborate deps with each engine, raising AssertionError if the results
+  differ. Returns a list of (engine name, seconds taken) pairs.
+  """
+  results = []
+
+  start = time.time()
+  specifierset_edeps = depdata.elaborate_dependencies(deps,
+      versions_by_package, allow_prerelease=allow_prerelease)
+  results.append(('SpecifierSet', time.time() - start))
+
+  if vectorized_elaboration.numpy is None:
+    print('numpy is not available; skipping the vectorized engine.')
+    return results
+
+  start = time.time()
+  vectorized_edeps = vectorized_elaboration.elaborate_dependencies_vectorized(
+      deps, versions_by_package, allow_prerelease=allow_prerelease)
+  results.append(('numpy', time.time() - start))
+
+  assert specifierset_edeps == vectorized_edeps, 'The engines disagree!'
+
+  return results
+
+
+
+
+
+if __name__ == '__main__':
+  main()
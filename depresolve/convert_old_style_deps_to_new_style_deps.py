@@ -28,42 +28,18 @@
   which are much more useful. The switch resolves some bugs and makes things
   easier to code and read.
 
+  The conversion is done by depdata.ingest_raw_deps, which handles a mix of
+  old and new style dependencies, and also normalizes package names.
+
 """
 
 import depresolve.depdata as depdata
-from deptools import spectuples_to_specstring
+import six
 
 
 depdata.ensure_data_loaded()
 
-new_deps = dict()
-
-
-for distkey in depdata.dependencies_by_dist:
-  
-  my_deps = depdata.dependencies_by_dist[distkey]
-  new_deps[distkey] = []
-
-  for dep in my_deps: # for every one of its dependencies,
-    satisfying_packagename = dep[0]
-    spectuples = dep[1]
-    specstring = ''
-
-    # Catch case where there are new style dependencies among the old....
-    if type(spectuples) in [list, tuple]:
-      specstring = spectuples_to_specstring(spectuples)
-    
-    else:
-      assert type(spectuples) in [unicode, str], 'Unexpected dep format!'
-      specstring = spectuples # It's already a specstring.
-
+(depdata.dependencies_by_dist, depdata.versions_by_package) = \
+    depdata.ingest_raw_deps(six.iteritems(depdata.dependencies_by_dist))
 
-    new_deps[distkey].append([satisfying_packagename, specstring])
-
-depdata.dependencies_by_dist = new_deps
 depdata.write_data_to_files()
-
-
-
-
-
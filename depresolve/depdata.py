@@ -185,33 +185,131 @@
 
 
 
+ reverse dependency index (reverse_dependencies.json)
+
+    Dependencies looked up the other way round, to answer questions like
+    "which dists depend on package X?" without scanning all of deps. Built
+    from deps or edeps by build_reverse_dependency_index. 'packages' maps
+    each package name depended on to the distkeys of the dists that depend
+    on it. If built from edeps, 'dists' maps each distkey that satisfies some
+    dependency to the distkeys of the dists whose dependencies it satisfies.
+    Depender lists are sorted. load_reverse_dependency_index rebuilds a
+    missing index from the deps or edeps it is given.
+
+    Example:
+      {
+        'packages': {
+          'six': ['foo(1)', 'foo(2)']
+        },
+        'dists': {
+          'six(1.8.0)': ['foo(1)'],
+          'six(1.9.0)': ['foo(1)', 'foo(2)']
+        }
+      }
+
+
+
+ compact edeps store (elaborated_dependencies.bin)
+
+    A binary encoding of an edeps dictionary, written by write_edeps_compact
+    and read eagerly by load_edeps_compact or lazily through MappedEdeps.
+    Every distinct string (distkeys, package names, version strings,
+    specifier strings) is stored exactly once in a string table, and every
+    distinct list of satisfying versions is stored exactly once in a
+    version-set table. Each edep is then just three integer ids: (package
+    name, version set, specifier string).
+
+    ensure_data_loaded uses the store in place of elaborated_dependencies.json
+    unless the json file is newer (e.g. after a re-elaboration), in which case
+    the store is ignored, with a warning, until it is rewritten.
+
+    All integers are little-endian unsigned 32-bit. Layout:
+
+      magic                          8 bytes, _COMPACT_MAGIC
+      header                         6 uint32s:
+                                       n_strings, blob_len,
+                                       n_vsets, vset_data_len,
+                                       n_dists, dist_data_len
+      string offsets                 n_strings + 1 uint32s, into the blob
+      string blob                    blob_len bytes of utf-8, then zero
+                                     padding to a multiple of 4 bytes
+      version-set offsets            n_vsets + 1 uint32s, into vset data
+      version-set data               vset_data_len uint32s (string ids)
+      distkeys                       n_dists uint32s (string ids), sorted by
+                                     distkey
+      dist offsets                   n_dists + 1 uint32s, into dist data
+      dist data                      dist_data_len uint32s, a run of
+                                     (package, vset, specifier) triples for
+                                     each dist
+
+    PACKAGE_VERSIONS_UNKNOWN is stored like any other version list. Because
+    the distkey table is sorted, it doubles as the distkey-to-offset index
+    MappedEdeps uses to find a single dist's entry without reading the rest.
+
+
+
   List of functions provided in this module:
 
     load_json_db
+    iter_json_db
     ensure_data_loaded
+    await_data
     set_conflict_model_legacy
     old_normalize_version_string
     write_data_to_files
+    load_journaled_db
+    JournaledDict
+    write_edeps_compact
+    load_edeps_compact
+    MappedEdeps
     deps_are_equal
+    diff_deps
+    diff_deps_files
+    DepsChangeSet
+    fingerprint_entry
+    fingerprint_closures
+    fingerprint_dataset
     get_pack_and_version
     get_packname
     get_version
+    Distkey
     distkey_format
     is_valid_distkey
     get_distkey_from_dist
     versions_are_equal
+    parse_version
+    sorted_versions
+    VersionTable
     fix_deps_case
     assume_dep_data_exists_for
     is_dep_valid
     are_deps_valid
+    validate_deps
+    DepsValidationReport
     normalize_distkey
     normalize_package_name
     normalize_version_string
     old_normalize_version_string
     spectuples_to_specset
     spectuples_to_specstring
+    ingest_raw_deps
+    ingest_raw_deps_file
     elaborate_dependencies
+    elaborate_dependencies_incremental
     _elaborate_dependency
+    ElaborationCache
+    LazyEdeps
+    SortedEdepsView
+    sort_versions_by_package
+    PackageVersions
+    VersionRanges
+    write_range_encoded_edeps
+    load_range_encoded_edeps
+    build_reverse_dependency_index
+    write_reverse_dependency_index
+    load_reverse_dependency_index
+    get_dependers_of_package
+    get_dependers_of_dist
 
 """
 
@@ -219,6 +317,7 @@
 import depresolve # for errors and logging
 log = depresolve.logging.getLogger('depresolve')
 import pip._vendor.packaging.version # for version validation
+import pip._vendor.packaging.specifiers # for SpecifierSet
 
 dependencies_by_dist = None
 versions_by_package = None
@@ -230,6 +329,7 @@ conflicts_2_db = None
 conflicts_3_db = None
 elaborated_alpha = None
 elaborated_reverse = None
+version_table = None # VersionTable of versions in versions_by_package
 #conflict_model = None # Not currently used.
 
 # Shouldn't REALLY be in here, since only scrape uses this, but it's tidier
@@ -237,7 +337,30 @@ elaborated_reverse = None
 blacklist = None
 
 import os
+import io
+import re
+import sys
 import json
+import six
+import array # for the compact edeps store
+import struct # for the compact edeps store
+import mmap # for the compact edeps store
+import multiprocessing # for elaborate_dependencies(workers=N)
+import functools
+import hashlib # for diff_deps and fingerprints
+import weakref # for interning Distkeys
+import bisect # for VersionRanges
+
+try:
+  import concurrent.futures # for ensure_data_loaded(background=True)
+except ImportError: # python 2 without the futures package
+  concurrent = None
+
+import collections # for OrderedDict
+try:
+  from collections.abc import Mapping, Sequence
+except ImportError: # python 2
+  from collections import Mapping, Sequence
 
 # Filenames
 WORKING_DIRECTORY = os.path.join(os.getcwd()) #'/Users/s/w/git/depresolve' in my setup
@@ -255,165 +378,544 @@ DEPENDENCIES_DB_FNAME = os.path.join(WORKING_DIRECTORY, 'data',
     'dependencies.json')
 ELABORATED_DEPS_FNAME = os.path.join(WORKING_DIRECTORY, 'data',
     'elaborated_dependencies.json')
-ELABORATED_ALPHA_FNAME = os.path.join(WORKING_DIRECTORY, 'data',
-    'elaborated_alpha.json')
-ELABORATED_REVERSE_FNAME = os.path.join(WORKING_DIRECTORY, 'data',
-    'elaborated_reverse.json')
+ELABORATED_DEPS_COMPACT_FNAME = os.path.join(WORKING_DIRECTORY, 'data',
+    'elaborated_dependencies.bin')
+REVERSE_DEPENDENCY_INDEX_FNAME = os.path.join(WORKING_DIRECTORY, 'data',
+    'reverse_dependencies.json')
+
+# How load_json_db handles missing or unparseable files ('empty', 'raise', or
+# 'prompt'). See load_json_db.
+LOAD_ERROR_MODE = 'empty'
+
+# Whether ensure_data_loaded checks the dependencies it loads with
+# validate_deps (non-thorough, which takes about a second for all of PyPI),
+# logging a warning naming any invalid dists.
+VALIDATE_ON_LOAD = True
+
+# write_data_to_files compacts a db's journal into its snapshot once the
+# journal holds at least this many records and more records than the snapshot
+# has entries. See JournaledDict.
+JOURNAL_COMPACTION_MIN_RECORDS = 10000
+
+# Characters read at a time when streaming a json db. See iter_json_db.
+JSON_STREAM_CHUNK_SIZE = 1 << 16
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_DELIMITERS = ' \t\n\r,:}]'
+
+# Futures for globals being loaded in the background, by global name, and the
+# threads loading them. See ensure_data_loaded.
+_data_loading = dict()
+_data_loader_pool = None
+
+# Parsed pip versions by version string. See parse_version.
+_PARSED_VERSIONS = dict()
+
+# Distkeys in use, by distkey string, weakly referenced. See Distkey.
+_DISTKEYS = weakref.WeakValueDictionary()
 
 # Constants
 PACKAGE_VERSIONS_UNKNOWN = ['----ERROR--UNAVAILABLE-VERSION-INFORMATION----']
 
+# Compact edeps store format (see module docstring).
+_COMPACT_MAGIC = b'DEPEDB01'
+_COMPACT_HEADER = struct.Struct('<6I')
+# array typecode for unsigned 32-bit ints on this platform
+_UINT32_TYPECODE = 'I' if array.array('I').itemsize == 4 else 'L'
+
 
 
 
-def load_json_db(fname):
+def load_json_db(fname, packages=None, key_filter=None, error_mode=None,
+    into=None):
   """
-  Load given filename as a json file. If it's invalid or doesn't exist, load an
-  empty dict and create the file anew. Give the user a chance to control-c if
-  file contents are invalid or file doesn't exist, by prompting for enter.
+  Load given filename as a json file, returning its contents (usually a
+  dictionary, e.g. deps or a conflicts db).
+
+  If the file holds a json object (as all of our databases do), it is read
+  incrementally with iter_json_db(), so peak memory is the resulting
+  dictionary plus a small buffer rather than the whole text plus the
+  dictionary. In that case, optional arguments packages and key_filter can be
+  used to load only part of the file. See iter_json_db().
+
+  If into (an empty dict, or instance of a dict subclass) is given, the
+  members are put straight into it (with dict.__setitem__, bypassing any
+  override) and it is returned, rather than a new dict. A file that doesn't
+  hold a json object is then treated as unparseable.
+
+  If the file doesn't exist or can't be parsed, behavior depends on
+  error_mode (default: the module's LOAD_ERROR_MODE):
+    'empty'   Log a warning and load an empty dict, creating the file (and its
+              directory) if it doesn't exist. Unparseable json will then
+              likely be overwritten by the next write.
+    'raise'   Raise IOError (file doesn't exist) or ValueError (unparseable).
+    'prompt'  As 'empty', but first give the user a chance to control-c, by
+              prompting for enter. Not suitable for batch jobs.
+
+  An empty file is treated as an empty dict regardless of error_mode.
   """
-  # Fill with JSON data from file.
-  db = None
+  if error_mode is None:
+    error_mode = LOAD_ERROR_MODE
 
-  assert(os.path.exists(WORKING_DIRECTORY))
+  if error_mode not in ['empty', 'raise', 'prompt']:
+    raise ValueError('Unknown error_mode for load_json_db: ' + str(error_mode))
 
-  # Python 2/3 compatibility.
-  try:
-    input_ = raw_input # if python 2, override input to be raw_input
-  except NameError:  # if python 3, input changed to replace raw_input
-    input_ = input
+  assert(os.path.exists(WORKING_DIRECTORY))
 
 
   if not os.path.exists(fname):
-    print('  Directed to load ' + fname + ' but file does not exist. Will '
-        'CREATE A NEW FILE AND LOAD AN EMPTY DICTIONARY. ')
+    if error_mode == 'raise':
+      raise IOError('Directed to load ' + fname + ' but file does not exist.')
 
-    input_('  PRESS ENTER TO CONTINUE, CONTROL-C TO KILL AND MANUALLY HANDLE.')
+    log.warning('Directed to load ' + fname + ' but file does not exist. Will '
+        'CREATE A NEW FILE AND LOAD AN EMPTY DICTIONARY.')
+    if error_mode == 'prompt':
+      _input('  PRESS ENTER TO CONTINUE, CONTROL-C TO KILL AND MANUALLY '
+          'HANDLE.')
 
     dirname = os.path.dirname(os.path.abspath(fname))
     if not os.path.exists(dirname):
-      print("Directory check: " + dirname + " does not exist. Making it.")
+      log.info("Directory check: " + dirname + " does not exist. Making it.")
       os.makedirs(dirname)
 
     open(fname, 'a').close()
-    db = dict()
+    return dict() if into is None else into
 
-  else: # File exists
-    fobj = None
 
-    try:
-      fobj = open(fname, "r")
-      db = json.load(fobj)
+  # File exists.
+  try:
+    fobj = io.open(fname, 'r', encoding='utf-8')
+  except IOError:
+    log.error('Directed to load ' + fname + ' but UNABLE TO OPEN file.')
+    raise
+
+  try:
+    first_char = _first_non_whitespace_char(fobj)
+
+  finally:
+    fobj.close()
+
+  if first_char == '':
+    # Empty file, e.g. created by a previous call.
+    return dict() if into is None else into
+
+  try:
+    if into is not None:
+      if first_char != '{':
+        raise ValueError('Expected a json object in ' + fname)
+      db = into
+      dict.update(db, iter_json_db(fname, packages=packages,
+          key_filter=key_filter))
+    elif first_char == '{':
+      db = dict(iter_json_db(fname, packages=packages, key_filter=key_filter))
+    else:
+      # Not a json object. Nothing to stream; just load it.
+      fobj = io.open(fname, 'r', encoding='utf-8')
+      try:
+        db = json.load(fobj)
+      finally:
+        fobj.close()
 
-    except IOError:
-      print('  Directed to load " + filename + " but UNABLE TO OPEN file. '
-          'Crashing.')
+  except ValueError:
+    if error_mode == 'raise':
       raise
 
-    except ValueError:
-      print('  Directed to load ' + fname + '; able to open file, but '
-          'UNABLE TO PARSE JSON DATA from that file. Will load an empty dict '
-          'and ultimately EXPECT TO OVERWRITE UNREADABLE JSON.')
-      input_('  PRESS ENTER TO CONTINUE, CONTROL-C TO KILL AND AVOID '
+    log.warning('Directed to load ' + fname + '; able to open file, but '
+        'UNABLE TO PARSE JSON DATA from that file. Will load an empty dict '
+        'and ultimately EXPECT TO OVERWRITE UNREADABLE JSON.')
+    if error_mode == 'prompt':
+      _input('  PRESS ENTER TO CONTINUE, CONTROL-C TO KILL AND AVOID '
           'POTENTIALLY OVERWRITING SALVAGEABLE DATA.')
-      db = dict() # If it was invalid or the file didn't exist, load empty.
+    if into is None:
+      db = dict()
+    else:
+      db = into
+      dict.clear(db) # of anything read before the parse failed
 
-    finally:
+
+  return db
+
+
+
+
+
+def iter_json_db(fname, packages=None, key_filter=None,
+    chunk_size=JSON_STREAM_CHUNK_SIZE):
+  """
+  Incrementally parse the json object in the given file, yielding a
+  (key, value) pair for each of its top-level members as soon as that member
+  has been read. For our databases, the keys are distkeys and the values are
+  e.g. lists of deps or edeps, or conflict booleans.
+
+  Only one member (plus at most one chunk of unparsed text) is held in memory
+  at a time, so this can be used to start working on a database before it has
+  been completely read, or to load part of a database too large to load
+  whole.
+
+  Optional arguments:
+    packages    a set (or other container) of package names. If provided,
+                only members whose key is a distkey of one of these packages
+                are yielded.
+    key_filter  a function taking a key and returning True if the member
+                should be yielded.
+    chunk_size  the number of characters to read from the file at a time.
+
+  Raises ValueError if the file does not contain a valid json object.
+  """
+  decoder = json.JSONDecoder()
+  fobj = io.open(fname, 'r', encoding='utf-8')
+
+  # Buffer of unconsumed text and our position in it, along with whether or
+  # not we've hit the end of the file. Grouped in a list so that the inner
+  # functions can modify them.
+  state = ['', 0, False] # [buffer, position, eof]
+
+  def _read_more():
+    """Append at least another chunk (more for large members) to the
+    buffer, discarding consumed text first. Return False at end of file."""
+    if state[2]:
+      return False
+    buf = state[0][state[1]:]
+    chunk = fobj.read(max(chunk_size, len(buf)))
+    if not chunk:
+      state[2] = True
+    state[0] = buf + chunk
+    state[1] = 0
+    return bool(chunk)
+
+  def _next_char():
+    """Skip whitespace and return the next character ('' at end of file)."""
+    while True:
+      buf = state[0]
+      pos = _JSON_WHITESPACE.match(buf, state[1]).end()
+      state[1] = pos
+      if pos < len(buf):
+        return buf[pos]
+      if not _read_more():
+        return ''
+
+  def _expect(chars):
+    c = _next_char()
+    if c == '' or c not in chars:
+      raise ValueError('Invalid json object in ' + fname + ': expected one '
+          'of ' + repr(chars) + ' but found ' + repr(c))
+    state[1] += 1
+    return c
+
+  def _decode():
+    """Decode the next json value. A number can't be known to be complete
+    until a delimiter follows it (a chunk may end at '1.' or '1e', which
+    decode as 1), so insist on one."""
+    _next_char()
+    while True:
       try:
-        fobj.close()
-      except:
+        value, end = decoder.raw_decode(state[0], state[1])
+        if end < len(state[0]) and state[0][end] in _JSON_DELIMITERS:
+          state[1] = end
+          return value
+      except ValueError:
         pass
+      if not _read_more():
+        raise ValueError('Invalid or truncated json object in ' + fname)
+
+  try:
+    _expect('{')
+    if _next_char() == '}':
+      return
 
+    while True:
+      key = _decode()
+      _expect(':')
+      value = _decode()
 
-  return db
+      if (packages is None or get_packname(key) in packages) and \
+          (key_filter is None or key_filter(key)):
+        yield key, value
+
+      if _expect(',}') == '}':
+        return
+
+  finally:
+    fobj.close()
+
+
+
+
+
+def _first_non_whitespace_char(fobj):
+  """Return the first non-whitespace character in the open file, or ''."""
+  while True:
+    c = fobj.read(1)
+    if c == '' or not c.isspace():
+      return c
+
+
+
+
+
+def _input(prompt):
+  """input() on python 3, raw_input() on python 2."""
+  try:
+    return raw_input(prompt)
+  except NameError:
+    return input(prompt)
 
 
 
 
 
 def ensure_data_loaded(CONFLICT_MODELS=[1, 2, 3], include_edeps=False,
-    include_sorts=False):
+    include_sorts=False, background=False):
   """
   Ensure that the global dependencies, conflicts, and blacklist dictionaries
   are loaded, importing them now if not.
 
   If the global is not defined yet, load the contents of the json file.
 
-  Use load_json_db() to ensure that user has an opportunity to cancel each of
-  these:
+  Use load_json_db() for each of these, so missing or unparseable files are
+  handled according to LOAD_ERROR_MODE (see load_json_db):
     - If the db file doesn't exist, create it (open in append mode and close)
     - If the json parse fails, create a fresh dictionary.
 
+  If background is True, start the loads that are needed in a pool of
+  threads, and return at once with a dictionary mapping the name of each
+  global being loaded (e.g. 'conflicts_1_db') to a Future. Each global is set
+  when its own load finishes, independently of the others, so use
+  await_data(name) to wait for (and get) just the ones you need. Otherwise,
+  wait for any loads already under way in the background before loading
+  anything else.
+  """
+  if include_sorts:
+    assert include_edeps, 'Will not include sorted edeps without edeps!'
+
+  if background:
+    if concurrent is None:
+      raise ImportError('Loading in the background requires the '
+          'concurrent.futures module (the futures package, in Python 2).')
+
+    global _data_loader_pool
+    if _data_loader_pool is None:
+      _data_loader_pool = concurrent.futures.ThreadPoolExecutor(
+          max_workers=8)
+
+    # Forget finished loads, so that a global whose load failed (or that has
+    # been reset to None since) is loaded again.
+    for future in list(_data_loading.values()):
+      if future.done():
+        _forget_load(future)
+
+    futures = dict()
+    for (names, task) in _needed_loads(CONFLICT_MODELS, include_edeps,
+        include_sorts):
+      # Don't start a load that's already under way.
+      if not [name for name in names if name in _data_loading]:
+        future = _data_loader_pool.submit(task)
+        for name in names:
+          _data_loading[name] = future
+      for name in names:
+        futures[name] = _data_loading[name]
+
+    return futures
+
+
+  # Wait for any loads under way in the background before deciding what is
+  # left to load, so that nothing they load is loaded again.
+  await_data()
+
+  for (names, task) in _needed_loads(CONFLICT_MODELS, include_edeps,
+      include_sorts):
+    task()
+
+
+  # Trivial validation. The dependencies are checked in more detail (with
+  # validate_deps) as they are loaded, if VALIDATE_ON_LOAD is True.
+
+  assert isinstance(dependencies_by_dist, dict)
+
+  if 1 in CONFLICT_MODELS:
+    assert isinstance(conflicts_1_db, dict)
+  if 2 in CONFLICT_MODELS:
+    assert isinstance(conflicts_2_db, dict)
+  if 3 in CONFLICT_MODELS:
+    assert isinstance(conflicts_3_db, dict)
+
+  assert isinstance(blacklist, dict)
+
+
+
+
+
+def _needed_loads(CONFLICT_MODELS, include_edeps, include_sorts):
+  """
+  Return the loads ensure_data_loaded needs to do for the globals that are
+  not yet loaded, as a list of (names of the globals set, load function)
+  pairs.
+  """
+  tasks = []
+
+  if dependencies_by_dist is None or versions_by_package is None or \
+      version_table is None:
+    tasks.append((['dependencies_by_dist', 'versions_by_package',
+        'version_table'], _load_dependencies))
+
+  if pip_solutions_by_dist is None:
+    tasks.append((['pip_solutions_by_dist'], _load_pip_solutions))
+
+  for model in [1, 2, 3]:
+    name = 'conflicts_' + str(model) + '_db'
+    if model in CONFLICT_MODELS and globals()[name] is None:
+      tasks.append(([name], functools.partial(_load_conflicts, model)))
+
+  if blacklist is None:
+    tasks.append((['blacklist'], _load_blacklist))
+
+  if include_edeps and (elaborated_dependencies is None or
+      (include_sorts and elaborated_alpha is None)):
+    names = ['elaborated_dependencies']
+    if include_sorts:
+      names.extend(['elaborated_alpha', 'elaborated_reverse'])
+    tasks.append((names, functools.partial(_load_edeps, include_sorts)))
+
+  return tasks
+
+
+
+
+
+def await_data(name=None):
+  """
+  Wait for a global that ensure_data_loaded(background=True) is loading
+  (e.g. 'elaborated_dependencies') to be loaded, and return it. Exceptions
+  raised in loading it are raised here.
+
+  If no name is given, wait for all loads started in the background.
+
+  Returns the global at once if it isn't being loaded in the background.
+  A load is forgotten once awaited, whether or not it succeeded, so a failed
+  load raises here once, and the next ensure_data_loaded tries it again.
   """
+  if name is None:
+    for future in list(_data_loading.values()):
+      if future in _data_loading.values():
+        _await_load(future)
+    return None
+
+  future = _data_loading.get(name)
+  if future is not None:
+    _await_load(future)
+
+  return globals()[name]
+
+
+
+
+
+def _await_load(future):
+  """Wait for the given background load, then forget it (see await_data)."""
+  try:
+    future.result()
+  finally:
+    _forget_load(future)
+
+
+
+
+
+def _forget_load(future):
+  """Stop tracking the given background load under any of its names."""
+  for name in [name for name in _data_loading
+      if _data_loading[name] is future]:
+    del _data_loading[name]
+
+
+
+
+
+# The loads for ensure_data_loaded. Each may be run in a background thread, and
+# sets only its own globals.
+
+def _load_dependencies():
   global dependencies_by_dist
   global versions_by_package # not KEPT in sync with dependencies_by_dist
-  global elaborated_dependencies # not KEPT in sync with dependencies_by_dist
-  global pip_solutions_by_dist
-  global conflicts_1_db
-  global conflicts_2_db
-  global conflicts_3_db
-  global blacklist
-  global elaborated_alpha
-  global elaborated_reverse
+  global version_table
 
   if dependencies_by_dist is None:
-    dependencies_by_dist = load_json_db(DEPENDENCIES_DB_FNAME)
+    dependencies_by_dist = load_journaled_db(DEPENDENCIES_DB_FNAME)
+    if VALIDATE_ON_LOAD:
+      report = validate_deps(dependencies_by_dist)
+      if not report.valid:
+        log.warning('Invalid dependency data in ' + DEPENDENCIES_DB_FNAME +
+            ': ' + report.summary())
 
   if versions_by_package is None:
     versions_by_package = generate_dict_versions_by_package(
         dependencies_by_dist)
 
-  if pip_solutions_by_dist is None:
-    pip_solutions_by_dist = load_json_db(PIP_SOLUTIONS_DB_FNAME)
+  if version_table is None:
+    version_table = VersionTable.from_versions_by_package(versions_by_package)
 
-  if conflicts_1_db is None and 1 in CONFLICT_MODELS:
-    conflicts_1_db = load_json_db(DEPENDENCY_CONFLICTS1_DB_FNAME)
 
-  if conflicts_2_db is None and 2 in CONFLICT_MODELS:
-    conflicts_2_db = load_json_db(DEPENDENCY_CONFLICTS2_DB_FNAME)
 
-  if conflicts_3_db is None and 3 in CONFLICT_MODELS:
-    conflicts_3_db = load_json_db(DEPENDENCY_CONFLICTS3_DB_FNAME)
+def _load_pip_solutions():
+  global pip_solutions_by_dist
+  pip_solutions_by_dist = load_journaled_db(PIP_SOLUTIONS_DB_FNAME)
 
-  if blacklist is None:
-    blacklist = load_json_db(BLACKLIST_DB_FNAME)
 
-  if include_edeps and elaborated_dependencies is None:
-    elaborated_dependencies = load_json_db(ELABORATED_DEPS_FNAME)
 
-  if include_sorts:
-    assert include_edeps, 'Will not include sorted edeps without edeps!'
-    if elaborated_alpha is None:
-      elaborated_alpha = load_json_db(ELABORATED_ALPHA_FNAME)
-    if elaborated_reverse is None:
-      elaborated_reverse = load_json_db(ELABORATED_REVERSE_FNAME)
+def _load_conflicts(model):
+  fname = {1: DEPENDENCY_CONFLICTS1_DB_FNAME, 2: DEPENDENCY_CONFLICTS2_DB_FNAME,
+      3: DEPENDENCY_CONFLICTS3_DB_FNAME}[model]
+  globals()['conflicts_' + str(model) + '_db'] = load_journaled_db(fname)
 
-    # If the forward and reverse sorted elaborated dependencies dictionaries
-    # are empty, but the elaborated dependencies dictionary is not empty,
-    # then create alpha and reverse alpha dictionaries from the base one.
-    if not elaborated_alpha or not elaborated_reverse:
-      if elaborated_dependencies:
-        for distkey in elaborated_dependencies:
-          elaborated_alpha[distkey] = sorted(elaborated_dependencies[distkey])
-          elaborated_reverse[distkey] = sorted(
-              elaborated_dependencies[distkey], reverse=True)
 
 
-  # Trivial validation.
-  # More detailed validation is now available with are_deps_valid, but it is
-  # very slow even in non-thorough mode, and so I leave it to be manually
-  # called where desired.
+def _load_blacklist():
+  global blacklist
+  blacklist = load_journaled_db(BLACKLIST_DB_FNAME)
 
-  assert type(dependencies_by_dist) is dict
 
-  if 1 in CONFLICT_MODELS:
-    assert type(conflicts_1_db) is dict
-  if 2 in CONFLICT_MODELS:
-    assert type(conflicts_2_db) is dict
-  if 3 in CONFLICT_MODELS:
-    assert type(conflicts_3_db) is dict
 
-  assert type(blacklist) is dict
+def _load_edeps(include_sorts):
+  global elaborated_dependencies # not KEPT in sync with dependencies_by_dist
+  global elaborated_alpha
+  global elaborated_reverse
+
+  if elaborated_dependencies is None:
+    # Prefer the compact store if one has been written since the json was
+    # last written. It is memory-mapped and decoded lazily, so only the dists
+    # actually resolved are paid for.
+    if _compact_edeps_are_current(ELABORATED_DEPS_COMPACT_FNAME,
+        ELABORATED_DEPS_FNAME):
+      elaborated_dependencies = MappedEdeps(ELABORATED_DEPS_COMPACT_FNAME)
+    else:
+      elaborated_dependencies = load_json_db(ELABORATED_DEPS_FNAME)
+
+  if not include_sorts:
+    return
+
+  # Views, rather than sorted copies of edeps. See SortedEdepsView.
+  if elaborated_alpha is None:
+    elaborated_alpha = SortedEdepsView(elaborated_dependencies)
+    elaborated_reverse = elaborated_alpha.reversed()
+
+
+
+def _compact_edeps_are_current(compact_fname, json_fname):
+  """
+  Return True if the compact edeps store compact_fname exists and is not
+  older than the json edeps file json_fname (if there is one), else False.
+  A stale store (e.g. left over from before a re-elaboration) is logged, and
+  should be rewritten with write_edeps_compact.
+  """
+  if not os.path.exists(compact_fname):
+    return False
+
+  if os.path.exists(json_fname) and \
+      os.path.getmtime(compact_fname) < os.path.getmtime(json_fname):
+    log.warning('Ignoring ' + compact_fname + ', which is older than ' +
+        json_fname + '. Rewrite it with write_edeps_compact.')
+    return False
+
+  return True
 
 
 
@@ -447,193 +949,1163 @@ def set_conflict_model_legacy(CONFLICT_MODEL):
 
 
 
-def write_data_to_files(CONFLICT_MODELS=[1, 2, 3]):
-  """"""
-  #global dependencies_by_dist
-  #global pip_solutions_by_dist
-  #global conflicts_1_db
-  #global conflicts_2_db
-  #global conflicts_3_db
-  #global blacklist
-
-  json.dump(dependencies_by_dist, open(DEPENDENCIES_DB_FNAME, 'w'))
-  json.dump(pip_solutions_by_dist, open(PIP_SOLUTIONS_DB_FNAME, 'w'))
-
-  json.dump(blacklist, open(BLACKLIST_DB_FNAME, 'w'))
-
-
+def write_data_to_files(CONFLICT_MODELS=[1, 2, 3], compact=False):
+  """
+  Write the dependencies, pip solutions, blacklist, and given conflict dbs to
+  their files.
+
+  Dbs loaded by ensure_data_loaded are JournaledDicts, and for those only the
+  entries added or changed since the last write are appended to each db's
+  journal, so a write costs time proportional to the new work rather than to
+  the size of the dataset. Journals are compacted into their snapshots when
+  they grow large, or always if compact is True (e.g. at the end of a run, so
+  that the json files are complete for anything reading them directly).
+
+  Any other dicts (e.g. assigned to the globals by a script) are dumped in
+  full.
+  """
+  dbs = [(dependencies_by_dist, DEPENDENCIES_DB_FNAME),
+      (pip_solutions_by_dist, PIP_SOLUTIONS_DB_FNAME),
+      (blacklist, BLACKLIST_DB_FNAME)]
 
   if 1 in CONFLICT_MODELS:
-    json.dump(conflicts_1_db, open(DEPENDENCY_CONFLICTS1_DB_FNAME, 'w'))
+    dbs.append((conflicts_1_db, DEPENDENCY_CONFLICTS1_DB_FNAME))
 
   if 2 in CONFLICT_MODELS:
-    json.dump(conflicts_2_db, open(DEPENDENCY_CONFLICTS2_DB_FNAME, 'w'))
+    dbs.append((conflicts_2_db, DEPENDENCY_CONFLICTS2_DB_FNAME))
 
   if 3 in CONFLICT_MODELS:
-    json.dump(conflicts_3_db, open(DEPENDENCY_CONFLICTS3_DB_FNAME, 'w'))
+    dbs.append((conflicts_3_db, DEPENDENCY_CONFLICTS3_DB_FNAME))
 
 
+  for (db, fname) in dbs:
+    if isinstance(db, JournaledDict) and db.fname == fname:
+      if compact:
+        db.compact()
+      else:
+        db.checkpoint()
 
+    else:
+      _write_json_atomically(db, fname)
+      # A journal left beside the snapshot would be replayed over it on the
+      # next load, so it has to go.
+      if os.path.exists(fname + JournaledDict.JOURNAL_SUFFIX):
+        os.remove(fname + JournaledDict.JOURNAL_SUFFIX)
 
 
-def deps_are_equal(deps_a, deps_b):
+
+
+
+def load_journaled_db(fname, error_mode=None):
   """
-  Returns true if given lists of dependencies that are equivalent
-  (regardless of order).
-  
-  Update: This is now QUITE A BIT simpler. It may not really be necessary
-  anymore. I stripped all the ugliness and replaced it with this line (which
-  didn't work before for unpleasant Reasons explained in comments in previous
-  versions).
+  Load the json db in fname along with any journal written beside it, as a
+  JournaledDict. error_mode is as for load_json_db.
   """
-  return sorted(deps_a) == sorted(deps_b)
+  return JournaledDict(fname, error_mode=error_mode)
 
 
 
 
 
-def get_pack_and_version(distkey):
+class JournaledDict(dict):
   """
-  Convert a distkey, e.g. 'django(1.8.3)', into a package name and
-  version string, e.g. ('django', '1.8.3').
-
-  Reverse: distkey_format()
+  A dict backed by a json snapshot file (fname, in the usual db format) and an
+  append-only journal beside it (fname + '.journal').
+
+  Each key set or deleted since the last checkpoint is remembered, and
+  checkpoint() appends one line per such key to the journal: [key, value] for
+  a key set, or [key] for a key deleted. Loading reads the snapshot and then
+  replays the journal over it. compact() writes the whole dict as the new
+  snapshot (to a temporary file, renamed over the old snapshot) and then
+  removes the journal.
+
+  Since each checkpoint only appends, a process killed partway through one
+  loses at most the records being written; a partial final line is skipped on
+  replay (and the journal then compacted away so that nothing is appended to
+  it). Replaying a journal over a snapshot it has already been compacted into
+  changes nothing, so a kill between the rename and the journal's removal is
+  also safe.
+
+  Changes made in place to values (e.g. appending to a list value) are not
+  seen. Reassign the key, or call mark_dirty(key).
   """
-  packagename = get_packname(distkey)
-  version = get_version(distkey)
-  return (packagename, version)
+  JOURNAL_SUFFIX = '.journal'
 
+  def __init__(self, fname, error_mode=None):
+    dict.__init__(self)
+    self.fname = fname
+    self.journal_fname = fname + self.JOURNAL_SUFFIX
+    self.dirty = set()
+    self.journal_records = 0 # records in the journal file
 
+    # Read straight into self, so that the snapshot isn't held twice.
+    load_json_db(fname, error_mode=error_mode, into=self)
+    self._replay()
 
 
 
-def get_packname(distkey):
-  """The package name ends with the first open parenthesis."""
-  outs = None
-  try:
-    outs = distkey[:distkey.find('(')].lower() 
-  except AttributeError:
-    print('Problematic distkey: ' + str(distkey))
-    import ipdb
-    ipdb.set_trace()
-    raise Exception('POTATO')
+  def __setitem__(self, key, value):
+    dict.__setitem__(self, key, value)
+    self.dirty.add(key)
 
-  finally:
-    return outs
 
-  #return distkey[:distkey.find('(')].lower() # prophylactic lower
 
+  def __delitem__(self, key):
+    dict.__delitem__(self, key)
+    self.dirty.add(key)
 
 
 
+  def update(self, *args, **kwargs):
+    for (key, value) in dict(*args, **kwargs).items():
+      self[key] = value
 
-def get_version(distkey):
-  """
-  Note that the version string may contain parentheses. /:
-  So it's just every character after the first '(' until the last
-  character, which must be ')'.
-  """
-  return distkey[distkey.find('(') + 1 : -1].lower() # paranoid lower
 
 
+  def setdefault(self, key, default=None):
+    if key not in self:
+      self[key] = default
+    return dict.__getitem__(self, key)
 
 
 
-def distkey_format(package_name, version_string):
-  """
-  Combine a package name and version string (e.g. 'django', '1.8.3') into a
-  distkey e.g. 'django(1.8.3)'
+  def pop(self, key, *default):
+    if key in self:
+      self.dirty.add(key)
+    return dict.pop(self, key, *default)
 
-  Reverse: get_pack_and_version()
-  """
-  return package_name.lower() + '(' + version_string.lower() + ')'
 
 
+  def popitem(self):
+    (key, value) = dict.popitem(self)
+    self.dirty.add(key)
+    return (key, value)
 
 
 
-def is_valid_distkey(distkey, thorough=True):
-  """
-  Returns True if distkey is a valid distkey, else False.
-  Data specifications in module docstring.
-  If thorough is True (default), validates the version in the distkey by
-  trying to create a pip version object with it.
-  """
+  def clear(self):
+    self.dirty.update(self)
+    dict.clear(self)
 
-  try:
-    packname = get_packname(distkey)
-    version = get_version(distkey)
-    
-    # The first case here is a little strange because islower() returns False
-    # if given a pure numeric string like '2112', which is actually legal for
-    # package names.
-    if not (distkey.islower() or distkey.lower() == distkey) or \
-        distkey_format(packname, version) != distkey or \
-        not distkey.find('(') + 1 < distkey.find(')') or \
-        distkey[-1] != ')' or \
-        '_' in packname:
-      return False
 
-    if thorough:
-      pipified_version = pip._vendor.packaging.version.parse(version)
 
-  except Exception:
-    return False
+  def mark_dirty(self, key):
+    """Note that the value for key was changed in place."""
+    self.dirty.add(key)
 
-  return True
 
 
+  def checkpoint(self):
+    """
+    Append a record to the journal for each key changed since the last
+    checkpoint, compacting instead if the journal has grown larger than the
+    snapshot (and past JOURNAL_COMPACTION_MIN_RECORDS).
 
+    Returns the number of records written.
+    """
+    if not self.dirty:
+      return 0
 
+    if self.journal_records + len(self.dirty) >= max(
+        JOURNAL_COMPACTION_MIN_RECORDS, len(self)):
+      n_records = len(self.dirty)
+      self.compact()
+      return n_records
 
-def get_distkey_from_dist(dist):
-  """
-  Determines the key for a given distribution to be
-  used in the dependency conflict db and the dependencies db.
-  Splitting into two calls to allow for use on either a dist object or
-  just name and version strings.
+    lines = []
+    for key in sorted(self.dirty):
+      if key in self:
+        lines.append(json.dumps([key, dict.__getitem__(self, key)]))
+      else:
+        lines.append(json.dumps([key]))
 
-  Note that the argument dist here is an object of an internal pip type.
-  (Gotta dig the class back up later.)
+    fobj = open(self.journal_fname, 'a')
+    try:
+      fobj.write('\n'.join(lines) + '\n')
+      fobj.flush()
+      os.fsync(fobj.fileno())
+    finally:
+      fobj.close()
 
-  It doesn't make a TON of sense for this to be here, since this module need
-  not know anything about the dist type (which is a pip internal), but I wasn't
-  sure where else it was worth putting, save in pip.req.req_set itself....
+    self.journal_records += len(lines)
+    self.dirty.clear()
+    return len(lines)
 
-  """
-  return distkey_format(dist.project_name, dist.version)
 
 
+  def compact(self):
+    """
+    Write the whole dict as the new snapshot and discard the journal.
+    """
+    _write_json_atomically(self, self.fname)
+    if os.path.exists(self.journal_fname):
+      os.remove(self.journal_fname)
+    self.journal_records = 0
+    self.dirty.clear()
 
 
 
-def versions_are_equal(v1, v2):
-  """
-  Given two versions, each either strings or pip Version objects
-  (pip._vendor.packaging.version.Version), returns True if both can be
-  interpreted as the same version, within pip's sense of version strings.
+  def _replay(self):
+    """Apply the records in the journal, if there is one."""
+    if not os.path.exists(self.journal_fname):
+      return
 
-  Raises (does not catch) pip._vendor.packaging.version.InvalidVersion if a
-  given version cannot be interpreted by pip (BUT only if the arguments are not
-  trivially identical to begin with, in which case doesn't bother with
-  with conversion to pip Version objects.
-  """
-  # Given objects of same type that are identical.
+    n_bad = 0
+    fobj = open(self.journal_fname, 'r')
+    try:
+      for line in fobj:
+        line = line.strip()
+        if not line:
+          continue
+        try:
+          record = json.loads(line)
+        except ValueError:
+          n_bad += 1
+          continue
+        if len(record) == 2:
+          dict.__setitem__(self, record[0], record[1])
+        else:
+          dict.pop(self, record[0], None)
+        self.journal_records += 1
+    finally:
+      fobj.close()
+
+    if n_bad:
+      # Most likely a checkpoint was interrupted. Fold what we have into the
+      # snapshot so that later records aren't appended after a partial line.
+      log.warning('Skipped ' + str(n_bad) + ' incomplete record(s) in ' +
+          self.journal_fname + '. Compacting.')
+      self.compact()
+
+
+
+
+
+def _write_json_atomically(obj, fname):
+  """
+  Dump obj as json to fname by way of a temporary file renamed over fname, so
+  that fname holds either the old or the new contents, never part of either.
+  """
+  temp_fname = fname + '.tmp'
+  fobj = open(temp_fname, 'w')
+  try:
+    json.dump(obj, fobj)
+    fobj.flush()
+    os.fsync(fobj.fileno())
+  finally:
+    fobj.close()
+
+  try:
+    os.replace(temp_fname, fname)
+  except AttributeError: # Python 2: no os.replace
+    if os.name == 'nt' and os.path.exists(fname):
+      os.remove(fname)
+    os.rename(temp_fname, fname)
+
+
+
+
+
+def write_edeps_compact(edeps, fname=ELABORATED_DEPS_COMPACT_FNAME):
+  """
+  Write the given elaborated dependencies dictionary to fname in the compact
+  binary format described in the module docstring. Package names, version
+  strings and specifier strings are each stored once, and each edep becomes
+  three integer ids.
+
+  Read the result back with load_edeps_compact().
+  """
+  strings = [] # string id -> string
+  string_ids = dict() # string -> string id
+  vsets = [] # vset id -> list of string ids
+  vset_ids = dict() # tuple of string ids -> vset id
+
+  def _intern(s):
+    try:
+      return string_ids[s]
+    except KeyError:
+      string_ids[s] = len(strings)
+      strings.append(s)
+      return string_ids[s]
+
+  def _intern_vset(versions):
+    key = tuple(_intern(v) for v in versions)
+    try:
+      return vset_ids[key]
+    except KeyError:
+      vset_ids[key] = len(vsets)
+      vsets.append(key)
+      return vset_ids[key]
+
+  distkeys = sorted(edeps)
+  dist_key_ids = array.array(_UINT32_TYPECODE)
+  dist_offsets = array.array(_UINT32_TYPECODE, [0])
+  dist_data = array.array(_UINT32_TYPECODE)
+
+  for distkey in distkeys:
+    dist_key_ids.append(_intern(distkey))
+    for edep in edeps[distkey]:
+      dist_data.append(_intern(edep[0]))
+      dist_data.append(_intern_vset(edep[1]))
+      dist_data.append(_intern(edep[2]))
+    dist_offsets.append(len(dist_data))
+
+  # Flatten the string table into one utf-8 blob with offsets.
+  string_offsets = array.array(_UINT32_TYPECODE, [0])
+  encoded_strings = []
+  blob_len = 0
+  for s in strings:
+    encoded = s.encode('utf-8')
+    encoded_strings.append(encoded)
+    blob_len += len(encoded)
+    string_offsets.append(blob_len)
+  blob = b''.join(encoded_strings)
+  blob += b'\0' * (-blob_len % 4) # keep the uint32 sections aligned
+
+  # Flatten the version sets.
+  vset_offsets = array.array(_UINT32_TYPECODE, [0])
+  vset_data = array.array(_UINT32_TYPECODE)
+  for vset in vsets:
+    vset_data.extend(vset)
+    vset_offsets.append(len(vset_data))
+
+  fobj = open(fname, 'wb')
+  try:
+    fobj.write(_COMPACT_MAGIC)
+    fobj.write(_COMPACT_HEADER.pack(len(strings), blob_len, len(vsets),
+        len(vset_data), len(distkeys), len(dist_data)))
+    fobj.write(_uint32_array_to_bytes(string_offsets))
+    fobj.write(blob)
+    for arr in (vset_offsets, vset_data, dist_key_ids, dist_offsets,
+        dist_data):
+      fobj.write(_uint32_array_to_bytes(arr))
+  finally:
+    fobj.close()
+
+  log.info('Wrote compact edeps for ' + str(len(distkeys)) + ' dists to ' +
+      fname + ': ' + str(len(strings)) + ' strings, ' + str(len(vsets)) +
+      ' distinct version lists.')
+
+
+
+
+
+def load_edeps_compact(fname=ELABORATED_DEPS_COMPACT_FNAME):
+  """
+  Load an elaborated dependencies dictionary written by write_edeps_compact().
+
+  The result is an ordinary edeps dictionary (see module docstring), usable
+  anywhere edeps loaded from json are, but much cheaper to build and hold:
+  every package name, version string and specifier string is a single shared
+  object, and edeps with identical satisfying versions share a single list.
+  Callers must therefore not modify the satisfying version lists in place.
+
+  Raises ValueError if fname is not a compact edeps file.
+  """
+  fobj = open(fname, 'rb')
+  try:
+    data = fobj.read()
+  finally:
+    fobj.close()
+
+  layout = _compact_layout(data, fname)
+
+  string_offsets = _uint32_array_from_bytes(data, layout['string_offsets'],
+      layout['n_strings'] + 1)
+  blob = data[layout['blob'] : layout['blob'] + layout['blob_len']]
+  strings = [blob[string_offsets[i] : string_offsets[i + 1]].decode('utf-8')
+      for i in range(layout['n_strings'])]
+
+  vset_offsets = _uint32_array_from_bytes(data, layout['vset_offsets'],
+      layout['n_vsets'] + 1)
+  vset_data = _uint32_array_from_bytes(data, layout['vset_data'],
+      layout['vset_data_len'])
+  vsets = [[strings[i] for i in vset_data[vset_offsets[v]:vset_offsets[v + 1]]]
+      for v in range(layout['n_vsets'])]
+
+  n_dists = layout['n_dists']
+  dist_key_ids = _uint32_array_from_bytes(data, layout['dist_keys'], n_dists)
+  dist_offsets = _uint32_array_from_bytes(data, layout['dist_offsets'],
+      n_dists + 1)
+  dist_data = _uint32_array_from_bytes(data, layout['dist_data'],
+      layout['dist_data_len'])
+
+  edeps = dict()
+  for d in range(n_dists):
+    my_edeps = []
+    for i in range(dist_offsets[d], dist_offsets[d + 1], 3):
+      my_edeps.append([strings[dist_data[i]], vsets[dist_data[i + 1]],
+          strings[dist_data[i + 2]]])
+    edeps[strings[dist_key_ids[d]]] = my_edeps
+
+  return edeps
+
+
+
+
+
+class MappedEdeps(Mapping):
+  """
+  A read-only, lazily decoded view of a compact edeps file (see
+  write_edeps_compact), usable anywhere an edeps dictionary is.
+
+  The file is memory-mapped rather than read, so opening it costs almost
+  nothing regardless of its size, and any number of processes mapping the same
+  file share a single copy of it in the OS page cache.
+
+  The sorted distkey table and the dist offset table in the file together
+  serve as a distkey-to-offset index: edeps[distkey] binary searches the
+  distkey table, then decodes only that dist's entry. Decoded entries (and
+  the strings and version lists they are built from) are cached, so repeat
+  lookups are dictionary lookups and shared values remain shared objects.
+  As with load_edeps_compact, do not modify the returned lists in place.
+
+  Raises ValueError on construction if fname is not a compact edeps file.
+  """
+
+  def __init__(self, fname=ELABORATED_DEPS_COMPACT_FNAME):
+    self.fname = fname
+    self._fobj = open(fname, 'rb')
+    try:
+      self._mm = mmap.mmap(self._fobj.fileno(), 0, access=mmap.ACCESS_READ)
+      self._layout = _compact_layout(self._mm, fname)
+    except:
+      self._fobj.close()
+      raise
+
+    self._strings = dict() # string id -> decoded string
+    self._vsets = dict() # vset id -> decoded list of versions
+    self._decoded = dict() # distkey -> decoded list of edeps
+
+
+
+  def __getitem__(self, distkey):
+    try:
+      return self._decoded[distkey]
+    except KeyError:
+      pass
+
+    index = self._find(distkey)
+    if index is None:
+      raise KeyError(distkey)
+
+    start, end = struct.unpack_from('<2I', self._mm,
+        self._layout['dist_offsets'] + 4 * index)
+    triples = struct.unpack_from('<' + str(end - start) + 'I', self._mm,
+        self._layout['dist_data'] + 4 * start)
+
+    my_edeps = []
+    for i in range(0, len(triples), 3):
+      my_edeps.append([self._string(triples[i]), self._vset(triples[i + 1]),
+          self._string(triples[i + 2])])
+
+    self._decoded[distkey] = my_edeps
+    return my_edeps
+
+
+
+  def __contains__(self, distkey):
+    return distkey in self._decoded or self._find(distkey) is not None
+
+
+
+  def __iter__(self):
+    for index in range(self._layout['n_dists']):
+      yield self._distkey_at(index)
+
+
+
+  def __len__(self):
+    return self._layout['n_dists']
+
+
+
+  def close(self):
+    """Unmap and close the underlying file. Decoded entries remain usable."""
+    self._mm.close()
+    self._fobj.close()
+
+
+
+  def _find(self, distkey):
+    """Binary search the sorted distkey table; return the index or None."""
+    lo = 0
+    hi = self._layout['n_dists']
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self._distkey_at(mid) < distkey:
+        lo = mid + 1
+      else:
+        hi = mid
+    if lo < self._layout['n_dists'] and self._distkey_at(lo) == distkey:
+      return lo
+    return None
+
+
+
+  def _distkey_at(self, index):
+    (string_id,) = struct.unpack_from('<I', self._mm,
+        self._layout['dist_keys'] + 4 * index)
+    return self._string(string_id)
+
+
+
+  def _string(self, string_id):
+    try:
+      return self._strings[string_id]
+    except KeyError:
+      start, end = struct.unpack_from('<2I', self._mm,
+          self._layout['string_offsets'] + 4 * string_id)
+      blob = self._layout['blob']
+      s = self._mm[blob + start : blob + end].decode('utf-8')
+      self._strings[string_id] = s
+      return s
+
+
+
+  def _vset(self, vset_id):
+    try:
+      return self._vsets[vset_id]
+    except KeyError:
+      start, end = struct.unpack_from('<2I', self._mm,
+          self._layout['vset_offsets'] + 4 * vset_id)
+      string_ids = struct.unpack_from('<' + str(end - start) + 'I', self._mm,
+          self._layout['vset_data'] + 4 * start)
+      versions = [self._string(i) for i in string_ids]
+      self._vsets[vset_id] = versions
+      return versions
+
+
+
+
+
+def _compact_layout(data, fname):
+  """
+  Given the contents of a compact edeps file (bytes or mmap), validate the
+  magic and return a dictionary of the header counts and the byte offset of
+  each section. See the module docstring for the layout.
+  """
+  if data[:len(_COMPACT_MAGIC)] != _COMPACT_MAGIC:
+    raise ValueError('File ' + fname + ' is not a compact edeps file.')
+
+  layout = dict(zip(
+      ['n_strings', 'blob_len', 'n_vsets', 'vset_data_len', 'n_dists',
+      'dist_data_len'],
+      _COMPACT_HEADER.unpack_from(data, len(_COMPACT_MAGIC))))
+
+  pos = len(_COMPACT_MAGIC) + _COMPACT_HEADER.size
+  layout['string_offsets'] = pos
+  pos += 4 * (layout['n_strings'] + 1)
+  layout['blob'] = pos
+  pos += layout['blob_len'] + (-layout['blob_len'] % 4)
+  layout['vset_offsets'] = pos
+  pos += 4 * (layout['n_vsets'] + 1)
+  layout['vset_data'] = pos
+  pos += 4 * layout['vset_data_len']
+  layout['dist_keys'] = pos
+  pos += 4 * layout['n_dists']
+  layout['dist_offsets'] = pos
+  pos += 4 * (layout['n_dists'] + 1)
+  layout['dist_data'] = pos
+
+  return layout
+
+
+
+
+
+def _uint32_array_to_bytes(arr):
+  """Serialize an array of uint32s as little-endian bytes."""
+  if sys.byteorder == 'big':
+    arr = array.array(_UINT32_TYPECODE, arr)
+    arr.byteswap()
+  try:
+    return arr.tobytes()
+  except AttributeError: # python 2
+    return arr.tostring()
+
+
+
+
+
+def _uint32_array_from_bytes(data, offset, count):
+  """Read count little-endian uint32s from data, starting at offset."""
+  arr = array.array(_UINT32_TYPECODE)
+  chunk = data[offset : offset + 4 * count]
+  try:
+    arr.frombytes(chunk)
+  except AttributeError: # python 2
+    arr.fromstring(chunk)
+  if sys.byteorder == 'big':
+    arr.byteswap()
+  return arr
+
+
+
+
+
+def deps_are_equal(deps_a, deps_b):
+  """
+  Returns true if given lists of dependencies that are equivalent
+  (regardless of order).
+  
+  Update: This is now QUITE A BIT simpler. It may not really be necessary
+  anymore. I stripped all the ugliness and replaced it with this line (which
+  didn't work before for unpleasant Reasons explained in comments in previous
+  versions).
+  """
+  return sorted(deps_a) == sorted(deps_b)
+
+
+
+
+
+class DepsChangeSet(object):
+  """
+  The differences between two deps (or edeps) datasets, as found by diff_deps
+  or diff_deps_files:
+    added             set of distkeys only in the new dataset
+    removed           set of distkeys only in the old dataset
+    changed           set of distkeys in both, with different dependencies
+    changed_deps      the new dataset's entries for the added and changed
+                      dists, e.g. for elaborate_dependencies_incremental
+    versions_added    {package name: [versions]} of the added dists
+    versions_removed  {package name: [versions]} of the removed dists
+  """
+  __slots__ = ['added', 'removed', 'changed', 'changed_deps',
+      'versions_added', 'versions_removed']
+
+  def __init__(self):
+    self.added = set()
+    self.removed = set()
+    self.changed = set()
+    self.changed_deps = dict()
+    self.versions_added = dict()
+    self.versions_removed = dict()
+
+
+
+  def __bool__(self):
+    return bool(self.added or self.removed or self.changed)
+
+  __nonzero__ = __bool__ # python 2
+
+
+
+  @property
+  def changed_packages(self):
+    """Names of the packages that gained or lost versions."""
+    return set(self.versions_added) | set(self.versions_removed)
+
+
+
+  def apply_to_versions_by_package(self, old_versions_by_package):
+    """
+    Given versions_by_package for the old dataset, return versions_by_package
+    for the new one, without reading it again.
+    """
+    new_versions_by_package = dict(old_versions_by_package)
+
+    for packname in self.changed_packages:
+      removed = set(self.versions_removed.get(packname, ()))
+      versions = [v for v in old_versions_by_package.get(packname, ())
+          if v not in removed] + self.versions_added.get(packname, [])
+      if versions:
+        new_versions_by_package[packname] = versions
+      else:
+        new_versions_by_package.pop(packname, None)
+
+    return new_versions_by_package
+
+
+
+  def to_json(self):
+    """Return the change set as a json-friendly dictionary."""
+    return {
+        'added': sorted(self.added),
+        'removed': sorted(self.removed),
+        'changed': sorted(self.changed),
+        'changed_deps': self.changed_deps,
+        'versions_added': self.versions_added,
+        'versions_removed': self.versions_removed}
+
+
+
+  @classmethod
+  def from_json(cls, data):
+    """Inverse of to_json."""
+    change_set = cls()
+    change_set.added = set(data['added'])
+    change_set.removed = set(data['removed'])
+    change_set.changed = set(data['changed'])
+    change_set.changed_deps = data['changed_deps']
+    change_set.versions_added = data['versions_added']
+    change_set.versions_removed = data['versions_removed']
+    return change_set
+
+
+
+
+
+def diff_deps(old_deps, new_deps):
+  """
+  Return a DepsChangeSet describing the differences between two deps (or two
+  edeps) dictionaries. Dists whose dependencies are listed in a different
+  order are counted as changed.
+  """
+  return _diff_entries(six.iteritems(old_deps),
+      lambda: six.iteritems(new_deps))
+
+
+
+
+
+def diff_deps_files(old_fname, new_fname):
+  """
+  As diff_deps, but for two json files of deps (or edeps), streamed with
+  iter_json_db rather than loaded. Only a digest of each old entry, and the
+  new entries that differ, are kept in memory.
+
+  Raises ValueError if either file does not hold a json object.
+  """
+  return _diff_entries(iter_json_db(old_fname),
+      lambda: iter_json_db(new_fname))
+
+
+
+
+
+def _diff_entries(old_items, get_new_items):
+  """
+  Compare (distkey, entry) pairs, returning a DepsChangeSet. get_new_items
+  is called only once the old pairs have been consumed, so that only one
+  dataset is being read at a time.
+  """
+  old_digests = dict()
+  for (distkey, entry) in old_items:
+    old_digests[distkey] = _entry_hash(entry).digest()
+
+  change_set = DepsChangeSet()
+  for (distkey, entry) in get_new_items():
+    old_digest = old_digests.pop(distkey, None)
+    if old_digest is None:
+      change_set.added.add(distkey)
+    elif old_digest != _entry_hash(entry).digest():
+      change_set.changed.add(distkey)
+    else:
+      continue
+    change_set.changed_deps[distkey] = entry
+
+  # What's left wasn't in the new dataset.
+  change_set.removed = set(old_digests)
+
+  for (distkeys, versions) in [
+      (change_set.added, change_set.versions_added),
+      (change_set.removed, change_set.versions_removed)]:
+    for distkey in sorted(distkeys):
+      (packname, version) = get_pack_and_version(distkey)
+      versions.setdefault(packname, []).append(version)
+
+  return change_set
+
+
+
+
+
+def _entry_hash(entry):
+  """
+  Return a sha1 hash object for the given deps (or edeps) entry, the same for
+  equal entries (whether lists or tuples, or satisfying versions in
+  VersionRanges).
+  """
+  return hashlib.sha1(json.dumps(entry, separators=(',', ':'),
+      default=list).encode('utf-8'))
+
+
+
+
+
+def fingerprint_entry(entry):
+  """
+  Return a fingerprint (a hex string) of a single deps or edeps entry (e.g.
+  deps['django(1.8.3)']), which changes exactly when the entry does. These
+  are the digests diff_deps compares.
+  """
+  return _entry_hash(entry).hexdigest()
+
+
+
+
+
+def fingerprint_closures(deps, is_elaborated=False, versions_by_package=None):
+  """
+  Return a dictionary mapping each distkey in deps (or edeps, if is_elaborated
+  is True) to a fingerprint of the dist's transitive closure: its own entry
+  and those of every dist it could come to depend on, directly or
+  indirectly. A cached result computed for a dist (a resolution, say, or a
+  conflict verdict) is still good so long as the dist's closure fingerprint
+  is the same.
+
+  Fingerprints are computed Merkle-style, from each dist's entry and the
+  fingerprints of the dists it depends on, so that each dist is hashed once.
+  Dists that depend on each other in a cycle share a closure and so share a
+  fingerprint, computed over the whole cycle (strongly connected component).
+
+  With edeps, a dist depends on the satisfying versions listed in its
+  elaborated dependencies. With deps, it is taken to depend on every version
+  of each package it depends on (listed in versions_by_package, which is
+  generated from deps if not given), since a new version of such a package
+  could change how it resolves.
+
+  Dists depended on but not in deps count as having no entry, so adding them
+  later changes the fingerprints of their dependers.
+  """
+  if not is_elaborated and versions_by_package is None:
+    versions_by_package = generate_dict_versions_by_package(deps)
+
+  # Nodes are distkeys and, with deps, packages, as 1-tuples: a dist depends on
+  # packages, each of which depends on all of its versions. (Rather than
+  # each dist depending directly on all versions of its dependencies, which
+  # makes for many times more edges.)
+  def _children(node):
+    if isinstance(node, tuple):
+      return [distkey_format(node[0], v)
+          for v in versions_by_package.get(node[0], ())]
+    if node not in deps:
+      return []
+    if not is_elaborated:
+      return [(dep[0],) for dep in deps[node]]
+    children = []
+    for dep in deps[node]:
+      if dep[1] != PACKAGE_VERSIONS_UNKNOWN:
+        children.extend(distkey_format(dep[0], v) for v in dep[1])
+    return children
+
+  def _member_part(node):
+    if isinstance(node, tuple):
+      return 'package ' + node[0]
+    elif node not in deps:
+      return node + ':missing'
+    return node + ':' + fingerprint_entry(deps[node])
+
+  fingerprints = dict()
+
+  for component in _strongly_connected_components(deps, _children):
+    members = set(component)
+    member_parts = sorted(_member_part(node) for node in component)
+    child_fingerprints = sorted(set(fingerprints[child]
+        for node in component for child in _children(node)
+        if child not in members))
+
+    fingerprint = hashlib.sha1(('|'.join(member_parts) + '>' +
+        ','.join(child_fingerprints)).encode('utf-8')).hexdigest()
+
+    for node in component:
+      fingerprints[node] = fingerprint
+
+  # Packages, and dists depended on but missing from deps, were fingerprinted
+  # along the way.
+  for node in list(fingerprints):
+    if isinstance(node, tuple) or node not in deps:
+      del fingerprints[node]
+
+  return fingerprints
+
+
+
+
+
+def fingerprint_dataset(deps):
+  """
+  Return a fingerprint of a whole deps (or edeps) dataset, which changes
+  exactly when any dist is added, removed, or has its entry changed.
+  """
+  digest = hashlib.sha1()
+  for distkey in sorted(deps):
+    digest.update((distkey + ':' + fingerprint_entry(deps[distkey]) + '|'
+        ).encode('utf-8'))
+  return digest.hexdigest()
+
+
+
+
+
+def _strongly_connected_components(nodes, get_children):
+  """
+  Tarjan's algorithm, without recursion (dependency chains can be deep).
+  Returns the strongly connected components of the graph reachable from the
+  given nodes, as lists of nodes, each component listed after every
+  component reachable from it.
+  """
+  index = dict()
+  lowlink = dict()
+  stack = []
+  on_stack = set()
+  components = []
+
+  for root in nodes:
+    if root in index:
+      continue
+
+    index[root] = lowlink[root] = len(index)
+    stack.append(root)
+    on_stack.add(root)
+    work = [(root, iter(get_children(root)))]
+
+    while work:
+      (node, children) = work[-1]
+
+      for child in children:
+        if child not in index:
+          index[child] = lowlink[child] = len(index)
+          stack.append(child)
+          on_stack.add(child)
+          work.append((child, iter(get_children(child))))
+          break
+        elif child in on_stack:
+          lowlink[node] = min(lowlink[node], index[child])
+
+      else:
+        # All of node's children are done.
+        work.pop()
+        if work:
+          parent = work[-1][0]
+          lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+        if lowlink[node] == index[node]:
+          component = []
+          while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            component.append(member)
+            if member == node:
+              break
+          components.append(component)
+
+  return components
+
+
+
+
+
+def get_pack_and_version(distkey):
+  """
+  Convert a distkey, e.g. 'django(1.8.3)', into a package name and
+  version string, e.g. ('django', '1.8.3').
+
+  Reverse: distkey_format()
+  """
+  if isinstance(distkey, Distkey):
+    return (distkey.packname, distkey.version)
+  return _split_distkey(distkey)
+
+
+
+
+
+def get_packname(distkey):
+  """
+  The package name ends with the first open parenthesis.
+  (A Distkey has it split out already.)
+  """
+  if isinstance(distkey, Distkey):
+    return distkey.packname
+  try:
+    return distkey[:distkey.find('(')].lower() # prophylactic lower
+  except AttributeError:
+    raise TypeError('Expecting a distkey string, got: ' + repr(distkey))
+
+
+
+
+
+def get_version(distkey):
+  """
+  Note that the version string may contain parentheses. /:
+  So it's just every character after the first '(' until the last
+  character, which must be ')'.
+  (A Distkey has it split out already.)
+  """
+  if isinstance(distkey, Distkey):
+    return distkey.version
+  try:
+    return distkey[distkey.find('(') + 1 : -1].lower() # paranoid lower
+  except AttributeError:
+    raise TypeError('Expecting a distkey string, got: ' + repr(distkey))
+
+
+
+
+
+class Distkey(str):
+  """
+  A distkey (see module docstring) that knows its package name, version, and
+  version ordinal (see VersionTable) without re-parsing itself.
+
+  Distkeys are interned while in use: as long as any reference to
+  Distkey('django(1.8.3)') is held, Distkey('django(1.8.3)') returns that
+  same object, and the package name and version are split out only when it
+  is first created. The intern table holds only weak references, so it never
+  keeps a distkey alive. Being a str, a Distkey is interchangeable with the
+  plain string wherever distkeys are used, including as dictionary keys and
+  in json.
+
+  distkey_format() returns Distkeys. get_packname(), get_version(), and
+  get_pack_and_version() read the split from Distkeys, and split plain
+  strings without interning them.
+  """
+  # Python 2's str can't have non-empty __slots__, so there the split lives
+  # in each instance's __dict__.
+  if not six.PY2:
+    __slots__ = ('packname', 'version', '__weakref__')
+
+  def __new__(cls, distkey):
+    interned = _DISTKEYS.get(distkey)
+    if interned is None:
+      (packname, version) = _split_distkey(distkey)
+      interned = str.__new__(cls, distkey)
+      interned.packname = packname
+      interned.version = version
+      # Keyed by the plain string, so that the key doesn't keep it alive.
+      _DISTKEYS[str.__str__(interned)] = interned
+    return interned
+
+
+
+  def __reduce__(self):
+    return (Distkey, (str(self),))
+
+
+
+  @property
+  def ordinal(self):
+    """Ordinal of the version in the global version table, else None."""
+    if version_table is None:
+      return None
+    return version_table.ordinals.get(self.version)
+
+
+
+
+
+def _split_distkey(distkey):
+  """
+  Return the package name and version in the given distkey string.
+  """
+  if not isinstance(distkey, six.string_types):
+    raise TypeError('Expecting a distkey string, got: ' + repr(distkey))
+
+  split_index = distkey.find('(')
+  return (
+      distkey[:split_index].lower(), # prophylactic lower
+      distkey[split_index + 1 : -1].lower()) # paranoid lower
+
+
+
+
+
+def distkey_format(package_name, version_string):
+  """
+  Combine a package name and version string (e.g. 'django', '1.8.3') into a
+  distkey e.g. 'django(1.8.3)'
+
+  Reverse: get_pack_and_version()
+  """
+  return Distkey(package_name.lower() + '(' + version_string.lower() + ')')
+
+
+
+
+
+def is_valid_distkey(distkey, thorough=True):
+  """
+  Returns True if distkey is a valid distkey, else False.
+  Data specifications in module docstring.
+  If thorough is True (default), validates the version in the distkey by
+  trying to create a pip version object with it.
+  """
+
+  try:
+    packname = get_packname(distkey)
+    version = get_version(distkey)
+    
+    # The first case here is a little strange because islower() returns False
+    # if given a pure numeric string like '2112', which is actually legal for
+    # package names.
+    if not (distkey.islower() or distkey.lower() == distkey) or \
+        distkey_format(packname, version) != distkey or \
+        not distkey.find('(') + 1 < distkey.find(')') or \
+        distkey[-1] != ')' or \
+        '_' in packname:
+      return False
+
+    if thorough:
+      parse_version(version)
+
+  except Exception:
+    return False
+
+  return True
+
+
+
+
+
+def get_distkey_from_dist(dist):
+  """
+  Determines the key for a given distribution to be
+  used in the dependency conflict db and the dependencies db.
+  Splitting into two calls to allow for use on either a dist object or
+  just name and version strings.
+
+  Note that the argument dist here is an object of an internal pip type.
+  (Gotta dig the class back up later.)
+
+  It doesn't make a TON of sense for this to be here, since this module need
+  not know anything about the dist type (which is a pip internal), but I wasn't
+  sure where else it was worth putting, save in pip.req.req_set itself....
+
+  """
+  return distkey_format(dist.project_name, dist.version)
+
+
+
+
+
+def versions_are_equal(v1, v2):
+  """
+  Given two versions, each either strings or pip Version objects
+  (pip._vendor.packaging.version.Version), returns True if both can be
+  interpreted as the same version, within pip's sense of version strings.
+
+  Raises (does not catch) pip._vendor.packaging.version.InvalidVersion if a
+  given version cannot be interpreted by pip (BUT only if the arguments are not
+  trivially identical to begin with, in which case doesn't bother with
+  with conversion to pip Version objects.
+  """
+  # Given objects of same type that are identical.
   if type(v1) == type(v2) and v1 == v2:
     return True
 
+  # If both are in the version table, equal versions share an ordinal.
+  if version_table is not None:
+    ordinal1 = version_table.ordinals.get(v1)
+    ordinal2 = version_table.ordinals.get(v2)
+    if ordinal1 is not None and ordinal2 is not None:
+      return ordinal1 == ordinal2
+
   pipified1 = None
   pipified2 = None
 
   if isinstance(v1, pip._vendor.packaging.version._BaseVersion):
     pipified1 = v1
   else:
-    pipified1 = pip._vendor.packaging.version.parse(v1)
+    pipified1 = parse_version(v1)
 
-  if isinstance(v1, pip._vendor.packaging.version._BaseVersion):
+  if isinstance(v2, pip._vendor.packaging.version._BaseVersion):
     pipified2 = v2
   else:
-    pipified2 = pip._vendor.packaging.version.parse(v2)
+    pipified2 = parse_version(v2)
 
   return pipified1 == pipified2
 
@@ -641,6 +2113,108 @@ def versions_are_equal(v1, v2):
 
 
 
+def parse_version(version):
+  """
+  Return pip._vendor.packaging.version.parse(version), parsing each distinct
+  version string only once per process. Parsed versions are immutable, so
+  they are shared by all callers.
+  """
+  try:
+    return _PARSED_VERSIONS[version]
+  except KeyError:
+    parsed = _PARSED_VERSIONS[version] = \
+        pip._vendor.packaging.version.parse(version)
+    return parsed
+
+
+
+
+
+def sorted_versions(versions, reverse=False):
+  """
+  Return the given version strings sorted in pip order (ties between equal
+  versions with different strings, like '2' and '2.0', broken by string).
+
+  If every version is in the global version table (see VersionTable), this
+  is a sort on integers. Otherwise, parse_version is used.
+  """
+  if version_table is not None:
+    try:
+      return sorted(versions, key=version_table.sort_key, reverse=reverse)
+    except KeyError:
+      pass
+
+  return [v for (parsed, v) in sorted(
+      ((parse_version(v), v) for v in versions), reverse=reverse)]
+
+
+
+
+
+class VersionTable(object):
+  """
+  A table of all the version strings in a dataset, assigning each an integer
+  ordinal in pip's sort order, so that comparing or sorting versions in the
+  table needs no pip Version objects. Version strings that pip considers
+  equal (e.g. '2' and '2.0') share an ordinal.
+
+  ensure_data_loaded() sets the global version_table from versions_by_package;
+  versions_are_equal and sorted_versions (and so the resolvers) use it where
+  they can, and parse as before for versions not in it.
+
+    ordinals    dictionary mapping version string to ordinal
+  """
+  __slots__ = ['ordinals']
+
+  def __init__(self, versions=()):
+    self.ordinals = dict()
+
+    ordinal = -1
+    previous = None
+    for (parsed, version) in sorted(
+        (parse_version(v), v) for v in set(versions)):
+      if previous is None or parsed != previous:
+        ordinal += 1
+        previous = parsed
+      self.ordinals[version] = ordinal
+
+
+
+  @classmethod
+  def from_versions_by_package(cls, versions_by_package):
+    """Build a table of every version of every package in versions_by_package.
+    """
+    versions = set()
+    for packname in versions_by_package:
+      versions.update(versions_by_package[packname])
+    return cls(versions)
+
+
+
+  def __contains__(self, version):
+    return version in self.ordinals
+
+
+
+  def __len__(self):
+    return len(self.ordinals)
+
+
+
+  def ordinal(self, version):
+    """Return the ordinal of the given version string. KeyError if unknown."""
+    return self.ordinals[version]
+
+
+
+  def sort_key(self, version):
+    """Sort key for version strings in the table; see sorted_versions."""
+    return (self.ordinals[version], version)
+
+
+
+
+
 def fix_deps_case(deps):
   """
   Lowercase all package names in deps (dependers and depended-on).
@@ -668,6 +2242,9 @@ def assume_dep_data_exists_for(distkey, deps):
   """
   Raises depresolve.MissingDependencyInfoError if the given deps (or edeps)
   dictionary does not have an entry for the given distkey.
+
+  (A LazyEdeps with a provider looks the dist up with its provider before
+  giving up. See depresolve.providers.)
   """
   try:
     deps[distkey]
@@ -736,7 +2313,7 @@ def is_dep_valid(dep, is_elaborated=False, thorough=False):
     if thorough:
       for version in satisfying_versions: # Mind the None if you change this.
         try:
-          pipified_version = pip._vendor.packaging.version.parse(version)
+          parse_version(version)
         except:
           log.debug('dep not valid: thorough: version ' + version +
               ' provided in dependency on ' + satisfying_packname + ' is  not '
@@ -749,7 +2326,7 @@ def is_dep_valid(dep, is_elaborated=False, thorough=False):
 
 
 
-def are_deps_valid(deps, is_elaborated=False, thorough=False):
+def are_deps_valid(deps, is_elaborated=False, thorough=False, workers=None):
   """
   Returns False if the given dependencies dictionary does not match the
   following requirements:
@@ -764,30 +2341,222 @@ def are_deps_valid(deps, is_elaborated=False, thorough=False):
 
    - Each dep is a 2-length list (or, if edeps, a 3-length list).
 
-  Running this on the full dependency data for PyPI takes about 8 seconds if
-  thorough is off. With thorough on, this takes about 5 minutes!
-
+  The checks are those of validate_deps (see there, including for workers),
+  and each problem found is logged at debug level. Use validate_deps directly
+  for the full report.
   """
   if not isinstance(deps, dict):
     log.debug('deps not valid: not a dictionary (or dict subclass)')
     return False
 
-  for distkey in deps:
+  report = validate_deps(deps, is_elaborated, thorough, workers)
 
-    if not is_valid_distkey(distkey, thorough):
-      log.debug('deps not valid: invalid distkey: ' + distkey)
-      return False
+  for distkey in report.problems:
+    log.debug('deps not valid: ' + str(distkey) + ': ' +
+        '; '.join(report.problems[distkey]))
+
+  return report.valid
+
+
+
+
+
+# Distkeys as is_valid_distkey accepts them: a package name without
+# parentheses or underscores, then a nonempty version in parentheses. (Case is
+# checked separately.)
+_DISTKEY_PATTERN = re.compile(r'[^()_]*\([^)].*\)\Z', re.DOTALL)
+
+# specifier string -> whether SpecifierSet accepts it, per process. There are
+# far fewer distinct specifier strings than dependencies.
+_SPECSTRING_VALIDITY = dict()
+
+# Set in each worker process by _init_validation_worker.
+_worker_validation_args = None
+
+
+
+class DepsValidationReport(object):
+  """
+  The result of validate_deps: problems maps each offending distkey to a list
+  of descriptions of what is wrong with it or its dependencies, and n_dists is
+  the number of dists checked.
+  """
+  __slots__ = ['problems', 'n_dists']
+
+  def __init__(self):
+    self.problems = dict()
+    self.n_dists = 0
+
+
+
+  @property
+  def valid(self):
+    return not self.problems
+
+
+
+  def summary(self, max_listed=10):
+    """
+    Return a one-line description of the report, listing up to max_listed
+    offending distkeys.
+    """
+    if self.valid:
+      return 'All ' + str(self.n_dists) + ' dists valid.'
+    offenders = sorted(str(distkey) for distkey in self.problems)
+    return str(len(offenders)) + ' of ' + str(self.n_dists) + ' dists ' + \
+        'invalid, e.g.: ' + ', '.join(offenders[:max_listed])
+
+
+
+
+
+def validate_deps(deps, is_elaborated=False, thorough=False, workers=None):
+  """
+  Check deps (or, if is_elaborated, edeps) against the specifications in the
+  module docstring, and return a DepsValidationReport naming every offending
+  distkey and what is wrong with it, rather than stopping at the first
+  problem.
+
+  Checked:
+    - each distkey's syntax (as is_valid_distkey does, but against a
+      precompiled pattern), and, if thorough, its version
+    - that each dist's dependencies are a list of deps (or edeps)
+    - each dependency's form, lowercase package name, and specifier string
+      (each distinct specifier string is parsed just once per process)
+    - if is_elaborated, that the satisfying versions are a list (or
+      VersionRanges), and, if thorough, that each parses
+
+  Versions are parsed with parse_version, whose cache is shared with the rest
+  of the module.
+
+  If workers is greater than 1, the dists are divided among that many
+  processes. Sending dists to the workers costs more than the quick checks,
+  so this pays mainly for thorough validation of edeps.
+  """
+  if not isinstance(deps, Mapping):
+    raise TypeError('Expecting a deps dictionary, got: ' + str(type(deps)))
+
+  report = DepsValidationReport()
+  report.n_dists = len(deps)
+
+  if workers is None or workers <= 1:
+    report.problems = _validate_dists(six.iteritems(deps), is_elaborated,
+        thorough)
+    return report
+
+  items = list(six.iteritems(deps))
+  # Several chunks per worker, so that a slow chunk doesn't hold up the rest.
+  chunk_size = max(1, -(-len(items) // (workers * 4)))
+  chunks = [items[i : i + chunk_size]
+      for i in range(0, len(items), chunk_size)]
+
+  pool = multiprocessing.Pool(workers, initializer=_init_validation_worker,
+      initargs=(is_elaborated, thorough))
+  try:
+    for chunk_problems in pool.imap(_validate_chunk, chunks):
+      report.problems.update(chunk_problems)
+  finally:
+    pool.close()
+    pool.join()
+
+  return report
 
-    if not isinstance(deps[distkey], list):
-      log.debug('deps not valid: invalid dependency in deps (non-list) value')
-      return False
 
-    for dep in deps[distkey]:
 
-      if not is_dep_valid(dep, is_elaborated, thorough):
-        return False
 
-  return True
+
+def _init_validation_worker(is_elaborated, thorough):
+  global _worker_validation_args
+  _worker_validation_args = (is_elaborated, thorough)
+
+
+
+def _validate_chunk(chunk):
+  """Worker process side of validate_deps."""
+  (is_elaborated, thorough) = _worker_validation_args
+  return _validate_dists(chunk, is_elaborated, thorough)
+
+
+
+def _validate_dists(items, is_elaborated, thorough):
+  """
+  Validate the given (distkey, dependencies) pairs, returning a dictionary
+  mapping each offending distkey to a list of its problems.
+  """
+  problems = dict()
+
+  for (distkey, dependencies) in items:
+    dist_problems = []
+
+    if not isinstance(distkey, six.string_types) or \
+        distkey.lower() != distkey or not _DISTKEY_PATTERN.match(distkey):
+      dist_problems.append('invalid distkey')
+
+    elif thorough:
+      try:
+        parse_version(get_version(distkey))
+      except Exception:
+        dist_problems.append('unparseable version')
+
+    if not isinstance(dependencies, list):
+      dist_problems.append('dependencies are not a list')
+
+    else:
+      for dep in dependencies:
+        problem = _dep_problem(dep, is_elaborated, thorough)
+        if problem is not None:
+          dist_problems.append(problem)
+
+    if dist_problems:
+      problems[distkey] = dist_problems
+
+  return problems
+
+
+
+def _dep_problem(dep, is_elaborated, thorough):
+  """
+  Return a description of what is wrong with the given dep (or edep), or None
+  if nothing is.
+  """
+  if not isinstance(dep, (list, tuple)) or \
+      len(dep) != (3 if is_elaborated else 2):
+    return 'dependency ' + repr(dep) + ' has the wrong form'
+
+  packname = dep[0]
+  specstring = dep[-1]
+
+  if not isinstance(packname, six.string_types) or \
+      packname.lower() != packname:
+    return 'package name ' + repr(packname) + ' is not a lowercase string'
+
+  if not isinstance(specstring, six.string_types):
+    return 'specifier ' + repr(specstring) + ' on ' + packname + \
+        ' is not a string'
+
+  valid = _SPECSTRING_VALIDITY.get(specstring)
+  if valid is None:
+    try:
+      pip._vendor.packaging.specifiers.SpecifierSet(specstring)
+      valid = True
+    except Exception:
+      valid = False
+    _SPECSTRING_VALIDITY[specstring] = valid
+  if not valid:
+    return 'invalid specifier string ' + repr(specstring) + ' on ' + packname
+
+  if is_elaborated:
+    if not isinstance(dep[1], (list, VersionRanges)):
+      return 'satisfying versions of ' + packname + ' are not a list'
+
+    if thorough:
+      for version in dep[1]:
+        try:
+          parse_version(version)
+        except Exception:
+          return 'unparseable version ' + repr(version) + ' of ' + packname
+
+  return None
 
 
 
@@ -819,7 +2588,7 @@ def normalize_version_string(version):
   does. pip employs a regex to handle certain version string components.
   """
   try:
-    normalized = str(pip._vendor.packaging.version.parse(version))
+    normalized = str(parse_version(version))
   
   except pip._vendor.packaging.version.InvalidVersion:
     normalized = old_normalize_version_string(version)
@@ -1137,7 +2906,92 @@ def generate_dict_versions_by_package(deps):
 
 
 
-def elaborate_dependencies(deps, versions_by_package, allow_prerelease=False):
+def ingest_raw_deps(raw_items, normalize_versions=False):
+  """
+  Normalize raw dependency data (e.g. scraper output, or old data) in a
+  single pass, producing deps and versions_by_package together.
+
+  raw_items is an iterable of (distkey, dependencies) pairs, e.g. from
+  iter_json_db or six.iteritems of a dictionary. It is consumed one dist at a
+  time, so nothing is held but the results and the memos below.
+
+  For each dist:
+    - the package names in the distkey and its dependencies are normalized
+      (see normalize_package_name)
+    - the version in the distkey is lowercased, or, if normalize_versions is
+      True, normalized as pip would (see normalize_version_string)
+    - old-style lists of specifier tuples (e.g. [['>=', '2'], ['<', '4']])
+      are converted to specifier strings (see spectuples_to_specstring)
+
+  Each distinct package name, version, and specifier string is normalized
+  once and the result shared by every dist that uses it. If two raw
+  distkeys normalize to the same distkey, the later one's dependencies are
+  kept.
+
+  Returns (deps, versions_by_package), as generate_dict_versions_by_package
+  would give for those deps.
+  """
+  deps = dict()
+  versions_by_package = dict()
+
+  packnames = dict() # raw package name -> normalized
+  versions = dict() # raw version -> normalized
+  specstrings = dict() # specifier string -> the one shared copy
+
+  for (raw_distkey, raw_dependencies) in raw_items:
+    (raw_packname, raw_version) = get_pack_and_version(raw_distkey)
+
+    packname = packnames.get(raw_packname)
+    if packname is None:
+      packname = packnames[raw_packname] = normalize_package_name(raw_packname)
+
+    version = versions.get(raw_version)
+    if version is None:
+      version = versions[raw_version] = (normalize_version_string(raw_version)
+          if normalize_versions else raw_version).lower()
+
+    distkey = distkey_format(packname, version)
+
+    dependencies = []
+    for dep in raw_dependencies:
+      dep_packname = packnames.get(dep[0])
+      if dep_packname is None:
+        dep_packname = packnames[dep[0]] = normalize_package_name(dep[0])
+
+      specstring = dep[1]
+      if not isinstance(specstring, six.string_types): # old style
+        specstring = spectuples_to_specstring(specstring)
+      specstring = specstrings.setdefault(specstring, specstring)
+
+      dependencies.append([dep_packname, specstring])
+
+    if distkey in deps:
+      log.debug('Ingesting ' + raw_distkey + ': replacing the dependencies '
+          'already ingested for ' + distkey)
+    else:
+      versions_by_package.setdefault(packname, []).append(version)
+
+    deps[distkey] = dependencies
+
+  return (deps, versions_by_package)
+
+
+
+
+
+def ingest_raw_deps_file(fname, normalize_versions=False):
+  """
+  As ingest_raw_deps, streaming the raw data from the given json file with
+  iter_json_db.
+  """
+  return ingest_raw_deps(iter_json_db(fname), normalize_versions)
+
+
+
+
+
+def elaborate_dependencies(deps, versions_by_package, allow_prerelease=False,
+    range_encode=False, workers=None, cache=None):
   """
   Converts deps (see description of deps in previous docstrings) into a
   dictionary of all possible means of satisfying each dependency, by using
@@ -1168,6 +3022,8 @@ def elaborate_dependencies(deps, versions_by_package, allow_prerelease=False):
 
   Running this on dependency data (package names and specifier strings) for
   300,000 packages from PyPI takes on the order of 20 minutes.
+  To bring existing edeps up to date after a scrape, see
+  elaborate_dependencies_incremental instead.
 
 
   Argument:
@@ -1187,6 +3043,23 @@ def elaborate_dependencies(deps, versions_by_package, allow_prerelease=False):
        would satisfy a given dependency, allow pre-release versions (e.g.
        1.1.0a0) to satisfy dependencies (e.g. >1.0).
 
+    4. range_encode (default False): if True, the satisfying versions in each
+       edep are a VersionRanges (index ranges into the depended-on package's
+       sorted versions) instead of a list of version strings. See
+       VersionRanges.
+
+    5. workers (default None): if greater than 1, elaborate in this many
+       processes. deps is split into chunks and versions_by_package is sent to
+       each worker process once. The result is identical to that of a serial
+       run, down to the order of deps_elaborated.
+
+    6. cache (default None): an ElaborationCache. Dependencies with the same
+       package name and specifier string are elaborated once, and their edeps
+       all share the one list (or VersionRanges) of satisfying versions. If
+       not given, a new cache is used for this call. Pass one in to see its
+       statistics afterwards, or to reuse it across calls with the same
+       versions_by_package.
+
 
   Returns:
     1. deps_elaborated, a dictionary keyed by distkey with values each equal to
@@ -1220,6 +3093,37 @@ def elaborate_dependencies(deps, versions_by_package, allow_prerelease=False):
        dists which have a dependency which we can't elaborate due to a lack of
        information on the available versions of the satisfying package).
   """
+  if cache is None:
+    cache = ElaborationCache()
+
+  if workers is not None and workers > 1:
+    return _elaborate_dependencies_in_parallel(deps, versions_by_package,
+        allow_prerelease, range_encode, workers, cache)
+
+  # Sorted versions of each package, for range encoding.
+  package_versions = None
+  if range_encode:
+    package_versions = sort_versions_by_package(versions_by_package)
+
+  result = _elaborate_dists(deps, versions_by_package, allow_prerelease,
+      package_versions, cache)
+
+  log.info('Elaboration cache: ' + str(cache.hits) + ' hits, ' +
+      str(cache.misses) + ' misses.')
+
+  return result
+
+
+
+
+
+def _elaborate_dists(deps, versions_by_package, allow_prerelease,
+    package_versions, cache):
+  """
+  The work of elaborate_dependencies, for all of deps or, in a worker
+  process, for a chunk of it. package_versions and cache are as for
+  _elaborate_dependency.
+  """
   deps_elaborated = dict()
 
   # The set of all package names for which we do not have a list of available
@@ -1259,25 +3163,258 @@ def elaborate_dependencies(deps, versions_by_package, allow_prerelease=False):
       # END OF DEBUG SECTION
 
       e_dep = _elaborate_dependency(dep, versions_by_package,
-          allow_prerelease=allow_prerelease)
+          allow_prerelease=allow_prerelease, package_versions=package_versions,
+          cache=cache)
 
       deps_elaborated[distkey].append(e_dep)
 
-      if e_dep[1] == PACKAGE_VERSIONS_UNKNOWN:
-        packages_without_available_version_info.add(dep[0])
+      if e_dep[1] == PACKAGE_VERSIONS_UNKNOWN:
+        packages_without_available_version_info.add(dep[0])
+        dists_with_missing_dependencies.add(distkey)
+
+  return (
+      deps_elaborated,
+      packages_without_available_version_info, 
+      dists_with_missing_dependencies
+  )
+
+
+
+
+
+def _elaborate_dependencies_in_parallel(deps, versions_by_package,
+    allow_prerelease, range_encode, workers, cache):
+  """
+  elaborate_dependencies with workers > 1. Each chunk of deps is elaborated
+  in a worker process and the partial results are merged in chunk order.
+
+  Each worker has its own ElaborationCache. The given cache is used in
+  merging, so that the satisfying versions of identical dependencies from
+  different chunks are again shared.
+  """
+  package_versions = None
+  if range_encode:
+    package_versions = sort_versions_by_package(versions_by_package)
+
+  distkeys = list(deps)
+  # Several chunks per worker, so that a slow chunk doesn't hold up the rest.
+  chunk_size = max(1, -(-len(distkeys) // (workers * 4)))
+  chunks = [dict((distkey, deps[distkey]) for distkey in
+      distkeys[i : i + chunk_size])
+      for i in range(0, len(distkeys), chunk_size)]
+
+  deps_elaborated = dict()
+  packages_without_available_version_info = set()
+  dists_with_missing_dependencies = set()
+
+  pool = multiprocessing.Pool(workers,
+      initializer=_init_elaboration_worker,
+      initargs=(versions_by_package, allow_prerelease, package_versions))
+  try:
+    for (chunk_edeps, chunk_packages, chunk_dists) in \
+        pool.imap(_elaborate_chunk, chunks):
+      deps_elaborated.update(chunk_edeps)
+      packages_without_available_version_info.update(chunk_packages)
+      dists_with_missing_dependencies.update(chunk_dists)
+  finally:
+    pool.close()
+    pool.join()
+
+  # Each chunk came back with its own copies of the satisfying versions (and
+  # each VersionRanges with its own copy of its PackageVersions). Share them
+  # again.
+  for distkey in deps_elaborated:
+    elaboration = deps_elaborated[distkey]
+    for i, edep in enumerate(elaboration):
+      if edep[1] == PACKAGE_VERSIONS_UNKNOWN:
+        continue
+      key = (edep[0], edep[2], allow_prerelease)
+      satisfying_versions = cache.results.get(key)
+      if satisfying_versions is None:
+        satisfying_versions = edep[1]
+        if range_encode:
+          satisfying_versions = VersionRanges(package_versions[edep[0]],
+              satisfying_versions.ranges, satisfying_versions.excluded)
+        cache.results[key] = satisfying_versions
+      elaboration[i] = (edep[0], satisfying_versions, edep[2])
+
+  return (
+      deps_elaborated,
+      packages_without_available_version_info,
+      dists_with_missing_dependencies
+  )
+
+
+
+
+
+# Set in each worker process by _init_elaboration_worker.
+_worker_elaboration_args = None
+
+def _init_elaboration_worker(versions_by_package, allow_prerelease,
+    package_versions):
+  global _worker_elaboration_args
+  _worker_elaboration_args = (versions_by_package, allow_prerelease,
+      package_versions, ElaborationCache())
+
+
+
+
+
+def _elaborate_chunk(chunk):
+  """Worker process side of _elaborate_dependencies_in_parallel."""
+  (versions_by_package, allow_prerelease, package_versions, cache) = \
+      _worker_elaboration_args
+  return _elaborate_dists(chunk, versions_by_package, allow_prerelease,
+      package_versions, cache)
+
+
+
+
+
+def elaborate_dependencies_incremental(old_edeps, old_versions_by_package,
+    new_versions_by_package, changed_deps, allow_prerelease=False,
+    range_encode=False):
+  """
+  Update elaborated dependencies after a scrape, without re-elaborating
+  everything as elaborate_dependencies does.
+
+  Only these are elaborated:
+    - every dist in changed_deps (dists newly added or whose dependencies
+      changed), and
+    - in the dists of old_edeps, only those dependencies on packages which
+      gained or lost versions between old_versions_by_package and
+      new_versions_by_package.
+
+  Dists of old_edeps whose version is no longer in new_versions_by_package
+  are taken to have been removed, and are dropped.
+
+  Arguments:
+    1. old_edeps, the elaborated dependencies from the previous run
+       (as returned by elaborate_dependencies)
+    2. old_versions_by_package, the versions_by_package old_edeps was
+       elaborated with
+    3. new_versions_by_package, versions_by_package for the updated deps
+    4. changed_deps, deps (see module docstring) for only the new and
+       changed dists
+    5. allow_prerelease, range_encode: see elaborate_dependencies
+
+  Returns:
+    1-3. as elaborate_dependencies does for the updated deps: new edeps,
+       packages_without_available_version_info, and
+       dists_with_missing_dependencies
+    4. changed_distkeys, the set of distkeys whose elaborated dependencies
+       were added, removed, or differ from those in old_edeps
+  """
+  # Packages that gained or lost versions, including packages that are new
+  # or gone altogether.
+  changed_packages = set()
+  for packname in set(old_versions_by_package) | set(new_versions_by_package):
+    old_versions = old_versions_by_package.get(packname)
+    new_versions = new_versions_by_package.get(packname)
+    if old_versions is None or new_versions is None or \
+        len(old_versions) != len(new_versions) or \
+        set(old_versions) != set(new_versions):
+      changed_packages.add(packname)
+
+  # Versions now available of each changed package, to spot removed dists.
+  new_version_sets = dict((packname,
+      set(new_versions_by_package.get(packname, ())))
+      for packname in changed_packages)
+
+  # Sorted versions of only the packages we might elaborate against.
+  package_versions = None
+  if range_encode:
+    packnames = set(changed_packages)
+    for distkey in changed_deps:
+      packnames.update(dep[0] for dep in changed_deps[distkey])
+    package_versions = sort_versions_by_package(dict(
+        (packname, new_versions_by_package[packname]) for packname in packnames
+        if packname in new_versions_by_package))
+
+  edeps = dict()
+  packages_without_available_version_info = set()
+  dists_with_missing_dependencies = set()
+  changed_distkeys = set()
+  cache = ElaborationCache()
+
+  for distkey in old_edeps:
+    if distkey in changed_deps:
+      continue # Elaborated from scratch below.
+
+    (packname, version) = get_pack_and_version(distkey)
+    if packname in new_version_sets and \
+        version not in new_version_sets[packname]:
+      changed_distkeys.add(distkey) # removed
+      continue
+
+    old_elaboration = old_edeps[distkey]
+    elaboration = old_elaboration
+
+    if any(edep[0] in changed_packages for edep in old_elaboration):
+      elaboration = [
+          _elaborate_dependency([edep[0], edep[2]], new_versions_by_package,
+          allow_prerelease=allow_prerelease, package_versions=package_versions,
+          cache=cache)
+          if edep[0] in changed_packages else edep
+          for edep in old_elaboration]
+
+      if not _elaborations_are_equal(old_elaboration, elaboration):
+        changed_distkeys.add(distkey)
+
+    edeps[distkey] = elaboration
+
+  for distkey in changed_deps:
+    elaboration = [_elaborate_dependency(dep, new_versions_by_package,
+        allow_prerelease=allow_prerelease, package_versions=package_versions,
+        cache=cache)
+        for dep in changed_deps[distkey]]
+
+    if distkey not in old_edeps or \
+        not _elaborations_are_equal(old_edeps[distkey], elaboration):
+      changed_distkeys.add(distkey)
+
+    edeps[distkey] = elaboration
+
+  for distkey in edeps:
+    for edep in edeps[distkey]:
+      if edep[1] == PACKAGE_VERSIONS_UNKNOWN:
+        packages_without_available_version_info.add(edep[0])
         dists_with_missing_dependencies.add(distkey)
 
   return (
-      deps_elaborated,
-      packages_without_available_version_info, 
-      dists_with_missing_dependencies
+      edeps,
+      packages_without_available_version_info,
+      dists_with_missing_dependencies,
+      changed_distkeys
   )
 
 
 
 
 
-def _elaborate_dependency(dep, versions_by_package, allow_prerelease=False):
+def _elaborations_are_equal(elaboration_a, elaboration_b):
+  """
+  Compare two lists of elaborated dependencies (the value in edeps for a
+  single dist), whether the edeps in them are lists or tuples and whether
+  their satisfying versions are lists or VersionRanges.
+  """
+  if len(elaboration_a) != len(elaboration_b):
+    return False
+
+  for (edep_a, edep_b) in zip(elaboration_a, elaboration_b):
+    if edep_a[0] != edep_b[0] or edep_a[2] != edep_b[2] or \
+        list(edep_a[1]) != list(edep_b[1]):
+      return False
+
+  return True
+
+
+
+
+
+def _elaborate_dependency(dep, versions_by_package, allow_prerelease=False,
+    package_versions=None, cache=None):
   """
   Given a single dependency in post-pip format, return its specifier string,
   SpecifierSet, and the full set of elaborated dependencies (a list of every
@@ -1306,6 +3443,15 @@ def _elaborate_dependency(dep, versions_by_package, allow_prerelease=False):
     3. allow_prerelease: optional. see allow_prerelease argument for
        elaborate_dependencies function.
 
+    4. package_versions: optional. A dictionary mapping package names to
+       PackageVersions, as returned by sort_versions_by_package(). If provided,
+       the elaboration is returned as a VersionRanges over the depended-on
+       package's sorted versions rather than as a list.
+
+    5. cache: optional. An ElaborationCache. If provided, the satisfying
+       versions are looked up there first, and stored there if not found.
+       Results from the cache are shared, so must not be modified.
+
   Returns:
     Returns None if a list of package versions could not be found in
     versions_by_package.
@@ -1333,6 +3479,15 @@ def _elaborate_dependency(dep, versions_by_package, allow_prerelease=False):
   # Interpret the dependency as a package name and SpecifierSet.
   satisfying_packagename = dep[0]
   specstring = dep[1]
+
+  if cache is not None:
+    key = (satisfying_packagename, specstring, allow_prerelease)
+    filtered_versions = cache.results.get(key)
+    if filtered_versions is not None:
+      cache.hits += 1
+      return (satisfying_packagename, filtered_versions, specstring)
+    cache.misses += 1
+
   specset = pip._vendor.packaging.specifiers.SpecifierSet(specstring)
   if allow_prerelease:
     specset.prereleases = True
@@ -1365,12 +3520,587 @@ def _elaborate_dependency(dep, versions_by_package, allow_prerelease=False):
         specset.filter(versions_by_package[satisfying_packagename])]
     #log.info("--Successfully elaborated dependency.")
 
+    if package_versions is not None:
+      filtered_versions = VersionRanges.from_versions(filtered_versions,
+          package_versions[satisfying_packagename])
+
+    if cache is not None:
+      cache.results[key] = filtered_versions
+
   return (satisfying_packagename, filtered_versions, specstring)#, specset)
 
 
 
 
 
+class ElaborationCache(object):
+  """
+  Satisfying versions already found by _elaborate_dependency, keyed by
+  (package name, specifier string, allow_prerelease), so that each distinct
+  dependency (e.g. on 'six' with specstring '') is elaborated once however
+  many dists have it, and all the edeps for it share one result.
+
+  A cache is only valid for the versions_by_package (and range_encode
+  setting) it was filled with. See elaborate_dependencies.
+
+    results   dictionary mapping key to satisfying versions
+    hits      number of lookups answered from the cache
+    misses    number of lookups that had to be elaborated
+  """
+  __slots__ = ['results', 'hits', 'misses']
+
+  def __init__(self):
+    self.results = dict()
+    self.hits = 0
+    self.misses = 0
+
+
+
+  def __len__(self):
+    return len(self.results)
+
+
+
+  def hit_rate(self):
+    """Fraction of lookups answered from the cache (0.0 if none yet)."""
+    lookups = self.hits + self.misses
+    return float(self.hits) / lookups if lookups else 0.0
+
+
+
+  def invalidate_packages(self, packnames):
+    """
+    Forget results for dependencies on the given packages, e.g. after
+    versions of them have been added to versions_by_package.
+    """
+    packnames = set(packnames)
+    for key in [key for key in self.results if key[0] in packnames]:
+      del self.results[key]
+
+
+
+
+
+class LazyEdeps(Mapping):
+  """
+  A read-only edeps mapping (see module docstring) over raw deps and
+  versions_by_package, which elaborates each dist's dependencies only when
+  they are first asked for. A resolution touches only the dists in the
+  transitive closure of the dists resolved, so this can stand in for the
+  output of elaborate_dependencies (e.g. for backtracking_satisfy,
+  naive_satisfy, or are_fully_satisfied) without elaborating everything
+  first.
+
+  The most recently used max_cached elaborations are kept; older ones are
+  dropped and elaborated again if needed. Satisfying versions themselves are
+  kept in an ElaborationCache (elaboration_cache), so elaborating a dist
+  again costs little, and identical dependencies share their results. As
+  with other shared results, do not modify the returned lists in place.
+
+  Keys, membership, and length are those of deps.
+
+  If a provider (see depresolve.providers) is given, it is asked for the
+  dependencies of any dist looked up (or tested for membership) that deps
+  doesn't have (and, in the same batch, for those of the other versions of
+  that package we know of but don't have dependencies for), and for the
+  versions of any package depended on that versions_by_package doesn't have.
+  It is asked about each dist at most once. What it provides is added to
+  copies of deps and versions_by_package kept here, so the resolver finds
+  dependencies as it goes instead of raising MissingDependencyInfoError.
+  Iteration and length then cover the dists provided so far.
+  """
+
+  def __init__(self, deps, versions_by_package=None, allow_prerelease=False,
+      range_encode=False, max_cached=100000, elaboration_cache=None,
+      provider=None):
+    if versions_by_package is None:
+      versions_by_package = generate_dict_versions_by_package(deps)
+    self.provider = provider
+    if provider is not None:
+      # We'll be adding to these.
+      deps = dict(deps)
+      versions_by_package = dict(versions_by_package)
+    self.deps = deps
+    self.versions_by_package = versions_by_package
+    self.allow_prerelease = allow_prerelease
+    self.max_cached = max_cached
+
+    self.package_versions = None
+    if range_encode:
+      self.package_versions = sort_versions_by_package(versions_by_package)
+
+    if elaboration_cache is None:
+      elaboration_cache = ElaborationCache()
+    self.elaboration_cache = elaboration_cache
+
+    # distkey -> elaboration, least recently used first
+    self._elaborated = collections.OrderedDict()
+
+    # Dists and packages the provider has already been asked about.
+    self._dependencies_requested = set()
+    self._versions_requested = set()
+
+
+
+  def __getitem__(self, distkey):
+    try:
+      # Popped and put back below, to mark it most recently used.
+      elaboration = self._elaborated.pop(distkey)
+
+    except KeyError:
+      if distkey not in self.deps and self.provider is not None:
+        self._provide_dependencies(distkey)
+      my_deps = self.deps[distkey]
+
+      if self.provider is not None:
+        for dep in my_deps:
+          if dep[0] not in self.versions_by_package:
+            self._provide_versions(dep[0])
+
+      elaboration = [_elaborate_dependency(dep, self.versions_by_package,
+          allow_prerelease=self.allow_prerelease,
+          package_versions=self.package_versions,
+          cache=self.elaboration_cache)
+          for dep in my_deps]
+
+      if len(self._elaborated) >= self.max_cached:
+        self._elaborated.popitem(last=False)
+
+    self._elaborated[distkey] = elaboration
+    return elaboration
+
+
+
+  def __contains__(self, distkey):
+    # As in __getitem__, so that a dist is in here exactly when it can be
+    # looked up.
+    if distkey not in self.deps and self.provider is not None:
+      self._provide_dependencies(distkey)
+    return distkey in self.deps
+
+
+
+  def __iter__(self):
+    return iter(self.deps)
+
+
+
+  def _provide_dependencies(self, distkey):
+    """
+    Ask the provider for the dependencies of distkey, and of the other
+    versions of its package we lack dependencies for, in one batch, unless
+    it has already been asked about distkey.
+    """
+    if distkey in self._dependencies_requested:
+      return
+
+    (packname, version) = get_pack_and_version(distkey)
+    known_versions = self.versions_by_package.get(packname, [])
+    distkeys = [distkey] + [distkey_format(packname, v) for v in known_versions
+        if v != version and distkey_format(packname, v) not in self.deps and
+        distkey_format(packname, v) not in self._dependencies_requested]
+    self._dependencies_requested.update(distkeys)
+
+    provided = self.provider.get_dependencies_batch(distkeys)
+    self.deps.update(provided)
+
+    new_versions = [get_version(d) for d in provided if
+        get_version(d) not in known_versions]
+    if new_versions:
+      self._add_versions(packname, new_versions)
+
+
+
+  def _provide_versions(self, packname):
+    """Ask the provider for the versions of a package we know none of."""
+    if packname in self._versions_requested:
+      return
+    self._versions_requested.add(packname)
+    versions = self.provider.get_versions(packname)
+    if versions:
+      self._add_versions(packname, versions)
+
+
+
+  def _add_versions(self, packname, versions):
+    """
+    Add versions of a package, forgetting anything elaborated against its
+    old list of versions.
+    """
+    self.versions_by_package[packname] = \
+        list(self.versions_by_package.get(packname, [])) + list(versions)
+
+    if self.package_versions is not None:
+      self.package_versions[packname] = \
+          PackageVersions(self.versions_by_package[packname])
+
+    self.elaboration_cache.invalidate_packages([packname])
+    for distkey in [distkey for distkey in self._elaborated if [edep for edep
+        in self._elaborated[distkey] if edep[0] == packname]]:
+      del self._elaborated[distkey]
+
+
+
+  def __len__(self):
+    return len(self.deps)
+
+
+
+
+
+class SortedEdepsView(Mapping):
+  """
+  A read-only view of an edeps mapping (see module docstring) in which each
+  dist's dependencies are listed alphabetically by depended-on package name
+  (or in reverse, if reverse is True), for backtracking_satisfy_alpha. They
+  are ordered as sorted() orders the edeps themselves, so ties on package
+  name are broken by satisfying versions, then specifier string. Rather
+  than a sorted copy of edeps, the view keeps only a tuple of indices per
+  dist (its ordering), computed the first time the dist is looked up, and the
+  lists it returns share their entries with edeps.
+
+  An alphabetical view and a reverse one can share orderings (see reversed()).
+  An ordering is recomputed if the dist's dependencies change in number;
+  otherwise changes to edeps after a dist is looked up are not seen.
+  """
+
+  def __init__(self, edeps, reverse=False, orderings=None):
+    self.edeps = edeps
+    self.reverse = reverse
+    # distkey -> tuple of indices into edeps[distkey], in sorted order
+    self.orderings = dict() if orderings is None else orderings
+
+
+
+  def reversed(self):
+    """Return a view over the same edeps in the opposite order."""
+    return SortedEdepsView(self.edeps, not self.reverse, self.orderings)
+
+
+
+  def __getitem__(self, distkey):
+    dist_edeps = self.edeps[distkey]
+
+    ordering = self.orderings.get(distkey)
+    if ordering is None or len(ordering) != len(dist_edeps):
+      ordering = self.orderings[distkey] = tuple(sorted(
+          range(len(dist_edeps)),
+          key=lambda i: dist_edeps[i]))
+
+    if self.reverse:
+      return [dist_edeps[i] for i in reversed(ordering)]
+    return [dist_edeps[i] for i in ordering]
+
+
+
+  def __contains__(self, distkey):
+    return distkey in self.edeps
+
+
+
+  def __iter__(self):
+    return iter(self.edeps)
+
+
+
+  def __len__(self):
+    return len(self.edeps)
+
+
+
+
+
+def sort_versions_by_package(versions_by_package):
+  """
+  Given versions_by_package (see generate_dict_versions_by_package), return
+  a dictionary mapping each package name to a PackageVersions holding that
+  package's versions in pip's sort order.
+  """
+  return dict((packname, PackageVersions(versions_by_package[packname]))
+      for packname in versions_by_package)
+
+
+
+
+
+class PackageVersions(object):
+  """
+  All of the available versions of a single package, sorted in ascending pip
+  order (by pip._vendor.packaging.version.parse, ties broken by string).
+  VersionRanges index into this.
+
+    versions    the sorted list of version strings
+    positions   dictionary mapping each version string to its index in
+                versions
+  """
+  __slots__ = ['versions', 'positions']
+
+  def __init__(self, versions):
+    self._set_versions(sorted_versions(versions))
+
+
+
+  @classmethod
+  def from_sorted_versions(cls, versions):
+    """
+    Make a PackageVersions from a list of versions that is already sorted
+    (e.g. one written by write_range_encoded_edeps), without re-sorting it,
+    lest the indices into it change meaning.
+    """
+    package_versions = cls.__new__(cls)
+    package_versions._set_versions(versions)
+    return package_versions
+
+
+
+  def _set_versions(self, versions):
+    self.versions = versions
+    self.positions = dict((v, i) for (i, v) in enumerate(versions))
+
+
+
+
+
+class VersionRanges(Sequence):
+  """
+  A compact stand-in for the list of satisfying versions in an edep (see
+  module docstring), which for popular packages can otherwise be very long
+  and is repeated in every edep on that package.
+
+  Stores index ranges into the depended-on package's sorted version list
+  (a PackageVersions), plus a short list of excluded indices within those
+  ranges, which is how gaps such as those from '!=' are kept without
+  splitting ranges. ['six', ''] is thus a single range, whatever the number
+  of versions of six.
+
+  Behaves as a read-only sequence of version strings in ascending pip order,
+  so code written for version lists works on it unchanged. Membership tests
+  and indexing are binary searches over the ranges (plus a set lookup for
+  exclusions), and iterating in descending order (reversed()) needs no
+  sorting.
+
+    package_versions  the PackageVersions indexed into
+    ranges            list of [start, stop) index pairs, sorted, disjoint
+    excluded          frozenset of indices within ranges that are not
+                      satisfying versions
+  """
+  __slots__ = ['package_versions', 'ranges', 'excluded', '_sorted_excluded',
+      '_offsets']
+
+  # Gaps of up to this many versions between satisfying versions are recorded
+  # as exclusions rather than by starting a new range.
+  MAX_EXCLUSION_GAP = 2
+
+  def __init__(self, package_versions, ranges, excluded=None):
+    self.package_versions = package_versions
+    self.ranges = ranges
+    self.excluded = frozenset(excluded or ())
+    self._sorted_excluded = sorted(self.excluded)
+
+    # _offsets[k] is the number of satisfying versions in the ranges before
+    # ranges[k]; the last entry is the total.
+    self._offsets = [0]
+    for (start, stop) in ranges:
+      n_excluded = bisect.bisect_left(self._sorted_excluded, stop) - \
+          bisect.bisect_left(self._sorted_excluded, start)
+      self._offsets.append(self._offsets[-1] + stop - start - n_excluded)
+
+
+
+  @classmethod
+  def from_versions(cls, versions, package_versions):
+    """
+    Encode the given list of version strings, each of which must appear in
+    the given PackageVersions.
+    """
+    ranges = []
+    excluded = []
+    for pos in sorted(package_versions.positions[v] for v in versions):
+      if ranges and pos - ranges[-1][1] <= cls.MAX_EXCLUSION_GAP:
+        excluded.extend(range(ranges[-1][1], pos))
+        ranges[-1][1] = pos + 1
+      else:
+        ranges.append([pos, pos + 1])
+    return cls(package_versions, ranges, excluded)
+
+
+
+  def _indices(self, descending=False):
+    excluded = self.excluded
+    ranges = reversed(self.ranges) if descending else self.ranges
+    for (start, stop) in ranges:
+      indices = range(stop - 1, start - 1, -1) if descending else \
+          range(start, stop)
+      for i in indices:
+        if i not in excluded:
+          yield i
+
+
+
+  def __iter__(self):
+    versions = self.package_versions.versions
+    for i in self._indices():
+      yield versions[i]
+
+
+
+  def __reversed__(self):
+    versions = self.package_versions.versions
+    for i in self._indices(descending=True):
+      yield versions[i]
+
+
+
+  def __contains__(self, version):
+    i = self.package_versions.positions.get(version)
+    if i is None or i in self.excluded:
+      return False
+    return self._range_containing(i) is not None
+
+
+
+  def _range_containing(self, i):
+    """Return the index of the range containing index i, else None."""
+    k = bisect.bisect_right(self.ranges, [i, float('inf')]) - 1
+    if k >= 0 and i < self.ranges[k][1]:
+      return k
+    return None
+
+
+
+  def __len__(self):
+    return self._offsets[-1]
+
+
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return list(self)[index]
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('VersionRanges index out of range')
+
+    # The range holding the index-th satisfying version, and which
+    # satisfying version in that range it is.
+    k = bisect.bisect_right(self._offsets, index) - 1
+    (start, stop) = self.ranges[k]
+    n_before = index - self._offsets[k]
+
+    # Skip past the exclusions in the range that come before it: find how
+    # many exclusions have no more than n_before satisfying versions before
+    # them in the range (a non-decreasing count), by binary search.
+    excluded = self._sorted_excluded
+    first = bisect.bisect_left(excluded, start)
+    (lo, hi) = (first, bisect.bisect_left(excluded, stop))
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if excluded[mid] - start - (mid - first) <= n_before:
+        lo = mid + 1
+      else:
+        hi = mid
+
+    return self.package_versions.versions[start + n_before + lo - first]
+
+
+
+  def __eq__(self, other):
+    if isinstance(other, VersionRanges) and \
+        other.package_versions is self.package_versions:
+      return self.ranges == other.ranges and self.excluded == other.excluded
+    try:
+      return len(self) == len(other) and list(self) == list(other)
+    except TypeError:
+      return False
+
+
+
+  def __ne__(self, other):
+    return not self == other
+
+  __hash__ = None
+
+
+
+  def __repr__(self):
+    return repr(list(self))
+
+
+
+  def to_json(self):
+    """
+    Return a json-compatible representation, for write_range_encoded_edeps.
+    """
+    return {'ranges': self.ranges, 'exclude': self._sorted_excluded}
+
+
+
+
+
+def write_range_encoded_edeps(edeps, fname):
+  """
+  Write edeps whose satisfying versions are VersionRanges (see
+  elaborate_dependencies' range_encode argument) to a json file, along with
+  the sorted version lists that the ranges index into, so that the file can
+  be loaded without the versions_by_package it was made with.
+
+  The file holds a json object like:
+    {'versions_by_package': {'six': ['1.1.0', '1.2.0', ... ], ...},
+     'edeps': {'autosubmit(3.0.4)': [['six', {'ranges': [[0, 15]],
+                                              'exclude': []}, ''], ...],
+               ...}
+    }
+  Satisfying versions that are plain lists (e.g. PACKAGE_VERSIONS_UNKNOWN)
+  are written as lists.
+  """
+  sorted_versions = dict()
+  json_edeps = dict()
+
+  for distkey in edeps:
+    json_edeps[distkey] = []
+    for edep in edeps[distkey]:
+      satisfying_versions = edep[1]
+      if isinstance(satisfying_versions, VersionRanges):
+        sorted_versions[edep[0]] = satisfying_versions.package_versions.versions
+        satisfying_versions = satisfying_versions.to_json()
+      json_edeps[distkey].append([edep[0], satisfying_versions, edep[2]])
+
+  _write_json_atomically(
+      {'versions_by_package': sorted_versions, 'edeps': json_edeps}, fname)
+
+
+
+
+
+def load_range_encoded_edeps(fname):
+  """
+  Load edeps written by write_range_encoded_edeps, with satisfying versions
+  as VersionRanges. Each package's sorted versions are shared by all of the
+  VersionRanges on that package.
+  """
+  fobj = open(fname, 'r')
+  try:
+    data = json.load(fobj)
+  finally:
+    fobj.close()
+
+  package_versions = dict((packname, PackageVersions.from_sorted_versions(
+      versions)) for (packname, versions) in
+      data['versions_by_package'].items())
+
+  edeps = data['edeps']
+  for distkey in edeps:
+    for edep in edeps[distkey]:
+      if isinstance(edep[1], dict):
+        edep[1] = VersionRanges(package_versions[edep[0]], edep[1]['ranges'],
+            edep[1]['exclude'])
+
+  return edeps
+
+
+
+
+
 # Toy
 def get_dependencies_of_all_X_on_Y(depender_pack, satisfying_pack, deps,
     versions_by_package=None):
@@ -1437,3 +4167,108 @@ def get_dependencies_of_all_X_on_Y(depender_pack, satisfying_pack, deps,
 
 
 
+
+
+def build_reverse_dependency_index(deps, is_elaborated=False):
+  """
+  Build a reverse dependency index (see module docstring) from deps, or from
+  edeps if is_elaborated is True, in which case the index also maps each
+  satisfying dist to the dists it can satisfy.
+
+  Edeps on packages with PACKAGE_VERSIONS_UNKNOWN add to 'packages' only.
+  """
+  packages = dict()
+  dists = dict() if is_elaborated else None
+
+  for depender in deps:
+    for dep in deps[depender]:
+      satisfying_packname = dep[0]
+      dependers = packages.setdefault(satisfying_packname, set())
+      dependers.add(depender)
+
+      if not is_elaborated or dep[1] == PACKAGE_VERSIONS_UNKNOWN:
+        continue
+
+      for version in dep[1]:
+        dists.setdefault(distkey_format(satisfying_packname, version),
+            set()).add(depender)
+
+  index = {'packages': dict(
+      (packname, sorted(packages[packname])) for packname in packages)}
+  if is_elaborated:
+    index['dists'] = dict(
+        (distkey, sorted(dists[distkey])) for distkey in dists)
+
+  return index
+
+
+
+
+
+def write_reverse_dependency_index(index, fname=REVERSE_DEPENDENCY_INDEX_FNAME):
+  """Write the given reverse dependency index to fname as json."""
+  _write_json_atomically(index, fname)
+
+
+
+
+
+def load_reverse_dependency_index(fname=REVERSE_DEPENDENCY_INDEX_FNAME,
+    deps=None, is_elaborated=False):
+  """
+  Load a reverse dependency index written by write_reverse_dependency_index.
+
+  If fname is missing or doesn't hold an index, and deps (or edeps, if
+  is_elaborated is True) are given, build the index from them instead (see
+  build_reverse_dependency_index) and write it to fname for next time.
+  Otherwise, raise IOError (missing) or ValueError (not an index), rather
+  than return an empty index that would report no dependers for every dist.
+  """
+  if os.path.exists(fname):
+    try:
+      index = load_json_db(fname, error_mode='raise')
+      if not isinstance(index, dict) or 'packages' not in index:
+        raise ValueError('No reverse dependency index in ' + fname)
+      return index
+
+    except ValueError:
+      if deps is None:
+        raise
+      log.warning('Unable to read a reverse dependency index from ' + fname +
+          '. Rebuilding it.')
+
+  elif deps is None:
+    raise IOError('No reverse dependency index at ' + fname + '. Build one '
+        'with build_reverse_dependency_index, or pass the deps to build it '
+        'from.')
+
+  index = build_reverse_dependency_index(deps, is_elaborated=is_elaborated)
+  write_reverse_dependency_index(index, fname)
+  return index
+
+
+
+
+
+def get_dependers_of_package(packname, index):
+  """
+  Return a sorted list of the distkeys of dists that depend on any version of
+  the given package, according to the given reverse dependency index.
+  """
+  return list(index['packages'].get(packname, []))
+
+
+
+
+
+def get_dependers_of_dist(distkey, index):
+  """
+  Return a sorted list of the distkeys of dists with a dependency that the
+  given dist satisfies, according to the given reverse dependency index,
+  which must have been built from edeps.
+  """
+  if 'dists' not in index:
+    raise ValueError('This reverse dependency index was built from deps, not '
+        'edeps, and so does not know which dists satisfy which dependencies.')
+
+  return list(index['dists'].get(distkey, []))
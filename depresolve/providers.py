@@ -0,0 +1,324 @@
+"""
+<Program Name>
+  providers.py
+
+<Purpose>
+  Dependency providers: sources of dependency information for dists that are
+  not in the deps (see depdata) that we have, so that resolution can find
+  dependencies as it goes instead of failing with
+  depresolve.MissingDependencyInfoError.
+
+  A provider supplies, for a distkey, the dist's dependencies in the deps
+  format (e.g. [['six', '>=1.4'], ['requests', '']]), and, for a package
+  name, the versions of that package it knows of. Give one to
+  depdata.LazyEdeps and it will be consulted whenever the resolver asks for a
+  dist, or depends on a package, that the deps don't cover.
+
+  Providers here:
+    DependencyProvider        the interface
+    WheelMetadataProvider     reads METADATA from wheels in a local directory
+    LocalIndexProvider        reads a json file in the deps format, e.g. one
+                              produced by the scraper on another machine
+    CachingProvider           wraps another provider, remembering its
+                              answers in a json file across runs
+
+"""
+
+import depresolve
+log = depresolve.logging.getLogger('depresolve')
+import depresolve.depdata as depdata
+import pip._vendor.packaging.requirements # for Requires-Dist parsing
+
+import os
+import abc
+import email.parser # for wheel METADATA
+import zipfile
+import six
+
+
+
+
+@six.add_metaclass(abc.ABCMeta)
+class DependencyProvider(object):
+  """
+  Interface for sources of dependency information. Subclasses must implement
+  get_dependencies and get_versions, and may override get_dependencies_batch
+  if they can fetch many dists more cheaply than one at a time.
+  """
+
+  @abc.abstractmethod
+  def get_dependencies(self, distkey):
+    """
+    Return the dependencies of the given dist, in the deps format (a list of
+    [package name, specifier string] pairs).
+
+    Raises depresolve.MissingDependencyInfoError if this provider has no
+    information on the dist.
+    """
+
+
+
+  def get_dependencies_batch(self, distkeys):
+    """
+    Return a dictionary mapping each of the given distkeys for which this
+    provider has information to that dist's dependencies. Others are left
+    out.
+    """
+    results = dict()
+    for distkey in distkeys:
+      try:
+        results[distkey] = self.get_dependencies(distkey)
+      except depresolve.MissingDependencyInfoError:
+        pass
+    return results
+
+
+
+  @abc.abstractmethod
+  def get_versions(self, packname):
+    """
+    Return a list of the versions of the given package that this provider
+    has information on, or [] if none.
+    """
+
+
+
+
+
+class WheelMetadataProvider(DependencyProvider):
+  """
+  Reads dependencies from the METADATA file in wheels (.whl) in a local
+  directory, e.g. one populated with pip download or pip wheel.
+
+  Requires-Dist entries with environment markers are included only if the
+  markers hold for the running interpreter, as pip would do when
+  installing, and entries only for extras are left out.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+
+    # distkey -> wheel filename, and package name -> versions
+    self.wheels = dict()
+    self.versions = dict()
+
+    for fname in sorted(os.listdir(directory)):
+      if not fname.endswith('.whl'):
+        continue
+      # name-version(-build)?-pythontag-abitag-platformtag.whl
+      parts = fname[:-len('.whl')].split('-')
+      if len(parts) < 5:
+        log.debug('Skipping oddly named wheel: ' + fname)
+        continue
+
+      packname = depdata.normalize_package_name(parts[0])
+      version = parts[1].lower()
+      distkey = depdata.distkey_format(packname, version)
+
+      # Several wheels of one dist (e.g. for several platforms) should list
+      # the same dependencies. The first is as good as any.
+      if distkey not in self.wheels:
+        self.wheels[distkey] = fname
+        self.versions.setdefault(packname, []).append(version)
+
+
+
+  def get_dependencies(self, distkey):
+    try:
+      fname = self.wheels[distkey]
+    except KeyError:
+      raise depresolve.MissingDependencyInfoError('No wheel for ' + distkey +
+          ' in ' + self.directory, distkey)
+
+    wheel = zipfile.ZipFile(os.path.join(self.directory, fname))
+    try:
+      metadata_names = [name for name in wheel.namelist() if
+          name.endswith('.dist-info/METADATA') and name.count('/') == 1]
+      if not metadata_names:
+        raise depresolve.MissingDependencyInfoError('No METADATA in wheel ' +
+            fname, distkey)
+      metadata = wheel.read(metadata_names[0]).decode('utf-8')
+    finally:
+      wheel.close()
+
+    return requires_dist_to_deps(
+        email.parser.Parser().parsestr(metadata).get_all('Requires-Dist') or [])
+
+
+
+  def get_versions(self, packname):
+    return list(self.versions.get(packname, []))
+
+
+
+
+
+def requires_dist_to_deps(requirement_strings):
+  """
+  Convert Requires-Dist values from wheel METADATA (e.g.
+  'requests (>=2.0) ; python_version >= "3"') into a list of dependencies in
+  the deps format, keeping only those that apply to this interpreter without
+  extras.
+  """
+  deps = []
+  for requirement_string in requirement_strings:
+    requirement = pip._vendor.packaging.requirements.Requirement(
+        requirement_string)
+    if requirement.marker is not None and \
+        not requirement.marker.evaluate({'extra': ''}):
+      continue
+    deps.append([depdata.normalize_package_name(requirement.name),
+        str(requirement.specifier)])
+  return deps
+
+
+
+
+
+class LocalIndexProvider(DependencyProvider):
+  """
+  Serves dependencies from a json file in the deps format (see depdata),
+  standing in for an index that could be queried for them. A missing or
+  unparseable file raises (IOError or ValueError) rather than serving
+  nothing.
+  """
+
+  def __init__(self, fname):
+    self.fname = fname
+    self.deps = depdata.load_json_db(fname, error_mode='raise')
+    self.versions = depdata.generate_dict_versions_by_package(self.deps)
+
+
+
+  def get_dependencies(self, distkey):
+    try:
+      return self.deps[distkey]
+    except KeyError:
+      raise depresolve.MissingDependencyInfoError('No dependency data for ' +
+          distkey + ' in ' + self.fname, distkey)
+
+
+
+  def get_versions(self, packname):
+    return list(self.versions.get(packname, []))
+
+
+
+
+
+class CachingProvider(DependencyProvider):
+  """
+  Wraps another provider, keeping everything it answers in a json file
+  (cache_fname) so that later runs need not ask it again. Lookups of many
+  dists are passed on to the wrapped provider as one batch, of only those
+  not already cached.
+
+  The cache file holds {'dependencies': {distkey: deps, ...},
+  'versions': {package name: [versions], ...}}. If it doesn't exist yet, the
+  cache starts empty, and the file is created by the first flush() that has
+  something to write. Call flush() (or use the provider as a context manager)
+  to write it. An unparseable cache file raises ValueError.
+
+  A dist's dependencies don't change once it is released, but a package's
+  list of versions does. Once cached, a package's versions are not asked for
+  again, so releases made since are not seen until the package is forgotten
+  with forget_versions().
+  """
+
+  def __init__(self, provider, cache_fname):
+    self.provider = provider
+    self.cache_fname = cache_fname
+
+    if os.path.exists(cache_fname):
+      cache = depdata.load_json_db(cache_fname, error_mode='raise')
+    else:
+      cache = dict()
+    self.dependencies = cache.get('dependencies', dict())
+    self.versions = cache.get('versions', dict())
+    self.dirty = False
+
+
+
+  def get_dependencies(self, distkey):
+    results = self.get_dependencies_batch([distkey])
+    try:
+      return results[distkey]
+    except KeyError:
+      raise depresolve.MissingDependencyInfoError('No dependency data for ' +
+          distkey + ' from ' + repr(self.provider), distkey)
+
+
+
+  def get_dependencies_batch(self, distkeys):
+    results = dict()
+    misses = []
+    for distkey in distkeys:
+      if distkey in self.dependencies:
+        results[distkey] = self.dependencies[distkey]
+      else:
+        misses.append(distkey)
+
+    if misses:
+      fetched = self.provider.get_dependencies_batch(misses)
+      if fetched:
+        self.dependencies.update(fetched)
+        results.update(fetched)
+        self.dirty = True
+
+    return results
+
+
+
+  def get_versions(self, packname):
+    try:
+      return list(self.versions[packname])
+    except KeyError:
+      pass
+
+    versions = self.provider.get_versions(packname)
+    # Don't remember that there were none; there may be some next time.
+    if versions:
+      self.versions[packname] = list(versions)
+      self.dirty = True
+    return versions
+
+
+
+  def forget_versions(self, packnames=None):
+    """
+    Drop the cached versions of the given packages (of all packages, if none
+    are given), so that the wrapped provider is asked for them again the next
+    time they are needed, picking up any new releases.
+    """
+    if packnames is None:
+      packnames = list(self.versions)
+    for packname in packnames:
+      if self.versions.pop(packname, None) is not None:
+        self.dirty = True
+
+
+
+  def flush(self):
+    """
+    Write the cache to cache_fname, if anything has changed in it. The file is
+    replaced atomically, so an interrupted flush leaves the old cache intact.
+    """
+    if not self.dirty:
+      return
+    directory = os.path.dirname(self.cache_fname)
+    if directory and not os.path.exists(directory):
+      os.makedirs(directory)
+    depdata._write_json_atomically(
+        {'dependencies': self.dependencies, 'versions': self.versions},
+        self.cache_fname)
+    self.dirty = False
+
+
+
+  def __enter__(self):
+    return self
+
+
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.flush()
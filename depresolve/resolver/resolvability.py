@@ -176,9 +176,6 @@ def conflicts_with(distkey, distkey_set):
   """
   (packname, version) = depdata.get_pack_and_version(distkey)
 
-  # For more accurate version equality testing:
-  pipified_version = pip._vendor.packaging.version.parse(version)
-
   # Find all matches for this distkey's package name in the given distkey_set
   # that are not the same literal distkey as this distkey.
   possible_competitors = \
@@ -495,15 +492,21 @@ def backtracking_satisfy_alpha(distkey_to_satisfy, edeps=None,
   Small workaround.
   See https://github.com/awwad/depresolve/issues/12
   """
-  if edeps is None or edeps_alpha is None or edeps_rev is None:
+  if edeps is None:
     depdata.ensure_data_loaded(include_edeps=True, include_sorts=True)
     edeps = depdata.elaborated_dependencies
     edeps_alpha = depdata.elaborated_alpha
     edeps_rev = depdata.elaborated_reverse
     versions_by_package = depdata.versions_by_package
 
-  elif versions_by_package is None:
-    versions_by_package = depdata.generate_dict_versions_by_package(edeps)
+  else:
+    # Sorted views of edeps cost little; see depdata.SortedEdepsView.
+    if edeps_alpha is None:
+      edeps_alpha = depdata.SortedEdepsView(edeps)
+    if edeps_rev is None:
+      edeps_rev = edeps_alpha.reversed()
+    if versions_by_package is None:
+      versions_by_package = depdata.generate_dict_versions_by_package(edeps)
 
 
   satisfy_output = None
@@ -675,7 +678,9 @@ def _backtracking_satisfy(distkey_to_satisfy, edeps, versions_by_package,
   for edep in my_edeps:
 
     satisfying_packname = edep[0]
-    satisfying_versions = sort_versions(edep[1])
+    # Not sorted until we need candidates: membership checks don't need it,
+    # and edep[1] may be a depdata.VersionRanges, which is cheaper to check.
+    satisfying_versions = edep[1]
     chosen_version = None
 
     if not satisfying_versions:
@@ -891,19 +896,15 @@ def sort_versions(versions):
   PEP 440.
 
   This is used by backtracking_satisfy to prioritize version selection.
-  """
 
-  # Construct a list associating version string with pip version object.
-  pipified_versions = []
-  for v in versions:
-    pipified_versions.append((pip._vendor.packaging.version.parse(v), v))
-
-  # Sort that list in reverse order. (pip Versions have overriden comparisons,
-  # sort keys, etc.)
-  pipified_versions = sorted(pipified_versions, reverse=True)
+  A depdata.VersionRanges is already in pip order, so is just reversed.
+  Otherwise, see depdata.sorted_versions, which sorts by the ordinals in
+  depdata.version_table where it can rather than by pip Version objects.
+  """
+  if isinstance(versions, depdata.VersionRanges):
+    return list(reversed(versions))
 
-  # Return just the version strings, but in the correct order now.
-  return [v[1] for v in pipified_versions]
+  return depdata.sorted_versions(versions, reverse=True)
 
 
 
@@ -951,7 +952,8 @@ def resolve_all_via_backtracking(dists_to_solve_for, edeps,
 
     try:
       solution = \
-          backtracking_satisfy_alpha(distkey, edeps, versions_by_package)
+          backtracking_satisfy_alpha(distkey, edeps,
+              versions_by_package=versions_by_package)
 
     # This is what the unresolvables look like:
     except (#depresolve.ConflictingVersionError,      # This should no longer happen?
@@ -440,7 +440,10 @@ def main():
           logger.info("  Added entry to blacklist for " + distkey)
         else:
           assert(no_skip or sys.version_info.major not in depdata.blacklist[distkey])
-          depdata.blacklist[distkey].append(sys.version_info.major)
+          # Reassign rather than append in place, so that the change is
+          # journaled. (See depdata.JournaledDict.)
+          depdata.blacklist[distkey] = depdata.blacklist[distkey] + \
+              [sys.version_info.major]
           logger.info("  Added additional entry to blacklist for " + distkey)
 
           
@@ -450,9 +453,10 @@ def main():
 
   # end of for each tarfile/sdist
 
-  # We're done with all packages. Write the collected data back to file.
+  # We're done with all packages. Write the collected data back to file,
+  # compacting the journals into the json files.
   logger.debug("Writing.")
-  depdata.write_data_to_files([conflict_model])
+  depdata.write_data_to_files([conflict_model], compact=True)
 
 
 
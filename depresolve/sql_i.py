@@ -14,6 +14,16 @@ import depresolve # __init__ for logging
 logger = depresolve.logging.getLogger('depresolve')
 import depresolve.depdata as depdata
 import sqlite3 # dependency db as sqlite db is the future of this :P
+import contextlib # for bulk_load_mode
+import itertools
+import heapq # for merging streams of rows
+import operator
+import collections # for OrderedDict
+try:
+  from collections.abc import Mapping
+except ImportError: # python 2
+  from collections import Mapping
+import six
 
 
 SQL_CONNECTION = None
@@ -33,6 +43,41 @@ SQL_COLUMN_SATISFYING_DIST_KEY = 'satisfying_dist_key'
 SQL_COLUMN_SATISFYING_SPECIFIER = 'satisfying_specifier'
 SQL_COLUMN_PACK_NAME = 'pack_name'
 
+# The normalized schema: each package name, version string, and dist is
+# stored once, and dependency rows refer to them by integer id. See
+# schema/dependency_schema_design_4.sql and migrate_to_normalized_schema.
+SQL_PACKAGES_TABLE = 'packages'
+SQL_VERSIONS_TABLE = 'versions'
+SQL_DISTS_TABLE = 'dists'
+SQL_DEPENDENCIES_TABLE = 'dependencies'
+SQL_SATISFYING_DISTS_TABLE = 'satisfying_dists'
+
+SQL_COLUMN_PACKAGE_ID = 'package_id'
+SQL_COLUMN_VERSION_ID = 'version_id'
+SQL_COLUMN_VERS_NAME = 'vers_name'
+SQL_COLUMN_ORDINAL = 'ordinal'
+SQL_COLUMN_DIST_ID = 'dist_id'
+SQL_COLUMN_HAS_DEPENDENCY_INFO = 'has_dependency_info'
+SQL_COLUMN_DEPENDENCY_ID = 'dependency_id'
+SQL_COLUMN_DEPENDER_DIST_ID = 'depender_dist_id'
+SQL_COLUMN_SATISFYING_PACKAGE_ID = 'satisfying_package_id'
+SQL_COLUMN_SPECIFIER = 'specifier'
+SQL_COLUMN_VERSIONS_UNKNOWN = 'versions_unknown'
+SQL_COLUMN_SATISFYING_DIST_ID = 'satisfying_dist_id'
+
+# Rows inserted per executemany (and, outside bulk_load_mode, per
+# transaction) by bulk_insert.
+BULK_LOAD_BATCH_SIZE = 100000
+
+# True within bulk_load_mode, whose load is committed (or rolled back) whole.
+_bulk_loading = False
+
+# Whether the module's connection is read through the text-keyed tables or
+# the normalized ones (see _reading_legacy_tables); None until checked, and
+# reset whenever the connection or the tables change.
+_legacy_tables_in_use = None
+
+
 
 SQL_DEPENDENCY_TBLDEF = (
     "CREATE TABLE IF NOT EXISTS " + SQL_DEPENDENCY_TABLE + "(" +
@@ -85,6 +130,99 @@ SQL_MISSING_DEPS_TBLDEF = (
 
 
 
+SQL_PACKAGES_TBLDEF = (
+    "CREATE TABLE IF NOT EXISTS " + SQL_PACKAGES_TABLE + "(" +
+        SQL_COLUMN_PACKAGE_ID + " INTEGER PRIMARY KEY, " +
+        SQL_COLUMN_PACK_NAME + " TEXT UNIQUE NOT NULL" +
+    ")")
+
+# Ordinals are those of depdata.VersionTable: ranks in pip's order, shared by
+# versions pip considers equal.
+SQL_VERSIONS_TBLDEF = (
+    "CREATE TABLE IF NOT EXISTS " + SQL_VERSIONS_TABLE + "(" +
+        SQL_COLUMN_VERSION_ID + " INTEGER PRIMARY KEY, " +
+        SQL_COLUMN_VERS_NAME + " TEXT UNIQUE NOT NULL, " +
+        SQL_COLUMN_ORDINAL + " INTEGER NOT NULL" +
+    ")")
+
+# has_dependency_info is 0 for dists known only as satisfiers of others'
+# dependencies.
+SQL_DISTS_TBLDEF = (
+    "CREATE TABLE IF NOT EXISTS " + SQL_DISTS_TABLE + "(" +
+        SQL_COLUMN_DIST_ID + " INTEGER PRIMARY KEY, " +
+        SQL_COLUMN_PACKAGE_ID + " INTEGER NOT NULL REFERENCES " +
+            SQL_PACKAGES_TABLE + ", " +
+        SQL_COLUMN_VERSION_ID + " INTEGER NOT NULL REFERENCES " +
+            SQL_VERSIONS_TABLE + ", " +
+        SQL_COLUMN_HAS_DEPENDENCY_INFO + " INTEGER NOT NULL, " +
+        "UNIQUE(" + SQL_COLUMN_PACKAGE_ID + ", " + SQL_COLUMN_VERSION_ID + ")" +
+    ")")
+
+# versions_unknown is 1 for dependencies on packages without version info
+# (depdata.PACKAGE_VERSIONS_UNKNOWN).
+SQL_DEPENDENCIES_TBLDEF = (
+    "CREATE TABLE IF NOT EXISTS " + SQL_DEPENDENCIES_TABLE + "(" +
+        SQL_COLUMN_DEPENDENCY_ID + " INTEGER PRIMARY KEY, " +
+        SQL_COLUMN_DEPENDER_DIST_ID + " INTEGER NOT NULL REFERENCES " +
+            SQL_DISTS_TABLE + ", " +
+        SQL_COLUMN_SATISFYING_PACKAGE_ID + " INTEGER NOT NULL REFERENCES " +
+            SQL_PACKAGES_TABLE + ", " +
+        SQL_COLUMN_SPECIFIER + " TEXT NOT NULL, " +
+        SQL_COLUMN_VERSIONS_UNKNOWN + " INTEGER NOT NULL, " +
+        "UNIQUE(" + SQL_COLUMN_DEPENDER_DIST_ID + ", " +
+            SQL_COLUMN_SATISFYING_PACKAGE_ID + ")" +
+    ")")
+
+SQL_SATISFYING_DISTS_TBLDEF = (
+    "CREATE TABLE IF NOT EXISTS " + SQL_SATISFYING_DISTS_TABLE + "(" +
+        SQL_COLUMN_DEPENDENCY_ID + " INTEGER NOT NULL REFERENCES " +
+            SQL_DEPENDENCIES_TABLE + ", " +
+        SQL_COLUMN_SATISFYING_DIST_ID + " INTEGER NOT NULL REFERENCES " +
+            SQL_DISTS_TABLE + ", " +
+        "PRIMARY KEY(" + SQL_COLUMN_DEPENDENCY_ID + ", " +
+            SQL_COLUMN_SATISFYING_DIST_ID + ")" +
+    ") WITHOUT ROWID")
+
+
+
+
+
+# Secondary indexes on the tables above, as (index name, CREATE INDEX
+# statement) pairs. They are created by initialize, and dropped during bulk
+# loads (see bulk_load_mode) and created again afterwards, which is much
+# faster than updating them row by row.
+#
+# Each covers a reverse lookup (see get_dependers_of_dist and
+# get_dependers_of_package), so that it is answered from the index alone.
+SQL_INDEXDEFS = [
+    ('idx_elaborated_dependencies_by_satisfier',
+        "CREATE INDEX IF NOT EXISTS idx_elaborated_dependencies_by_satisfier "
+        "ON " + SQL_DEPENDENCY_TABLE + "(" +
+            SQL_COLUMN_SATISFYING_DIST_KEY + ", " +
+            SQL_COLUMN_DEPENDER_DIST_KEY + ")"),
+    ('idx_dependency_specifiers_by_package',
+        "CREATE INDEX IF NOT EXISTS idx_dependency_specifiers_by_package "
+        "ON " + SQL_DEP_SPECIFIER_TABLE + "(" +
+            SQL_COLUMN_SATISFYING_PACK_NAME + ", " +
+            SQL_COLUMN_DEPENDER_DIST_KEY + ")"),
+    # The same two lookups on the normalized tables: dependencies on a
+    # package, and dependencies a dist satisfies.
+    ('idx_dependencies_by_package',
+        "CREATE INDEX IF NOT EXISTS idx_dependencies_by_package "
+        "ON " + SQL_DEPENDENCIES_TABLE + "(" +
+            SQL_COLUMN_SATISFYING_PACKAGE_ID + ", " +
+            SQL_COLUMN_DEPENDER_DIST_ID + ")"),
+    ('idx_satisfying_dists_by_dist',
+        "CREATE INDEX IF NOT EXISTS idx_satisfying_dists_by_dist "
+        "ON " + SQL_SATISFYING_DISTS_TABLE + "(" +
+            SQL_COLUMN_SATISFYING_DIST_ID + ", " +
+            SQL_COLUMN_DEPENDENCY_ID + ")"),
+]
+
+
+
+
+
 # SQLITE3 interfacing functions
 def initialize(db_fname=None):
   """
@@ -110,20 +248,30 @@ def initialize(db_fname=None):
 
   global SQL_CONNECTION
   global SQL_CURSOR
+  global _legacy_tables_in_use
   SQL_CONNECTION = sqlite3.connect(sql_dependency_fname)
   SQL_CURSOR = SQL_CONNECTION.cursor()
+  _legacy_tables_in_use = None
 
   all_tabledefs = [
       SQL_DEPENDENCY_TBLDEF,
       SQL_DEP_SPECIFIER_TBLDEF,
       SQL_NO_DEPS_TBLDEF,
       SQL_NO_VERS_INFO_TBLDEF,
-      SQL_MISSING_DEPS_TBLDEF]
+      SQL_MISSING_DEPS_TBLDEF,
+      SQL_PACKAGES_TBLDEF,
+      SQL_VERSIONS_TBLDEF,
+      SQL_DISTS_TBLDEF,
+      SQL_DEPENDENCIES_TBLDEF,
+      SQL_SATISFYING_DISTS_TBLDEF]
 
   for tabledef in all_tabledefs:
     print("Creating table " + tabledef)
     SQL_CURSOR.execute(tabledef)
 
+  for (indexname, indexdef) in SQL_INDEXDEFS:
+    SQL_CURSOR.execute(indexdef)
+
 
 
 
@@ -143,6 +291,8 @@ def add_to_table(
   _ensure_connected_to_sqlite()
 
   global SQL_CURSOR
+  global _legacy_tables_in_use
+  _legacy_tables_in_use = None
 
   logger.debug("           SQLI: \n"
       "INSERT INTO " + tablename + " VALUES (" + depender_dist_key + ", " +
@@ -170,16 +320,23 @@ def delete_all_tables():
   """ Clear the db. """
   _ensure_connected_to_sqlite()
   global SQL_CURSOR
+  global _legacy_tables_in_use
+  _legacy_tables_in_use = None
   
   all_tables = [
       SQL_DEPENDENCY_TABLE,
       SQL_DEP_SPECIFIER_TABLE,
       SQL_NO_DEPS_TABLE,
       SQL_NO_VERS_INFO_TABLE,
-      SQL_MISSING_DEPS_TABLE]
+      SQL_MISSING_DEPS_TABLE,
+      SQL_PACKAGES_TABLE,
+      SQL_VERSIONS_TABLE,
+      SQL_DISTS_TABLE,
+      SQL_DEPENDENCIES_TABLE,
+      SQL_SATISFYING_DISTS_TABLE]
 
   for tablename in all_tables:
-    SQL_CURSOR.execute('drop table ' + tablename)
+    SQL_CURSOR.execute('drop table if exists ' + tablename)
   
   flush()
 
@@ -207,11 +364,103 @@ def _ensure_connected_to_sqlite():
 
 
 
+def bulk_insert(tablename, rows, n_columns):
+  """
+  Insert the given rows (an iterable, e.g. a generator, of tuples of
+  n_columns values each) into the given table with executemany,
+  BULK_LOAD_BATCH_SIZE rows at a time, so that no more than one batch is held
+  in memory. Each batch is committed, except within bulk_load_mode, which
+  commits the whole load at once. Returns the number of rows inserted.
+
+  For large loads, use within bulk_load_mode.
+  """
+  _ensure_connected_to_sqlite()
+
+  statement = "INSERT INTO " + tablename + " VALUES (" + \
+      ", ".join(["?"] * n_columns) + ")"
+
+  rows = iter(rows)
+  n_rows = 0
+
+  while True:
+    batch = list(itertools.islice(rows, BULK_LOAD_BATCH_SIZE))
+    if not batch:
+      break
+    SQL_CURSOR.executemany(statement, batch)
+    if not _bulk_loading:
+      SQL_CONNECTION.commit()
+    n_rows += len(batch)
+    logger.debug("Inserted " + str(n_rows) + " rows into " + tablename)
+
+  return n_rows
+
+
+
+
+
+@contextlib.contextmanager
+def bulk_load_mode():
+  """
+  Context manager for loading large amounts of data: within it, the rollback
+  journal is kept in memory and sqlite does not wait for writes to reach the
+  disk, and the indexes in SQL_INDEXDEFS are dropped. Afterwards, the indexes
+  are created again (over all the data at once) and the journal and
+  synchronous settings restored.
+
+  Everything written within it is one transaction: committed at the end, or
+  rolled back if an exception is raised, leaving the tables as they were.
+  A crash of the process during a bulk load may still leave the database
+  corrupt, so load into a database that can be rebuilt.
+  """
+  global _bulk_loading
+  global _legacy_tables_in_use
+  _ensure_connected_to_sqlite()
+  SQL_CONNECTION.commit() # Pragmas can't be changed within a transaction.
+
+  journal_mode = SQL_CURSOR.execute("PRAGMA journal_mode").fetchone()[0]
+  synchronous = SQL_CURSOR.execute("PRAGMA synchronous").fetchone()[0]
+
+  SQL_CURSOR.execute("PRAGMA journal_mode = MEMORY")
+  SQL_CURSOR.execute("PRAGMA synchronous = OFF")
+
+  for (indexname, indexdef) in SQL_INDEXDEFS:
+    SQL_CURSOR.execute("DROP INDEX IF EXISTS " + indexname)
+
+  _bulk_loading = True
+  try:
+    yield
+
+  except:
+    SQL_CONNECTION.rollback()
+    raise
+
+  else:
+    SQL_CONNECTION.commit()
+
+  finally:
+    _bulk_loading = False
+    _legacy_tables_in_use = None
+
+    for (indexname, indexdef) in SQL_INDEXDEFS:
+      SQL_CURSOR.execute(indexdef)
+    SQL_CONNECTION.commit()
+
+    SQL_CURSOR.execute("PRAGMA journal_mode = " + journal_mode)
+    SQL_CURSOR.execute("PRAGMA synchronous = " + str(synchronous))
+
+
+
+
+
 def populate_sql_with_dependency_specifiers(deps, db_fname=None):
   """
   Function that feeds dependency info in my old internal format into a sqlite3
   db with a format more amenable to pip and tidier that I think I'll use in the
   future.
+
+  Old style dependencies (with lists of specifier tuples rather than
+  specifier strings) are converted. Dists without dependencies go in the
+  no-dependencies table.
   """
   log = depresolve.logging.getLogger('populate_sql_with_dependency_specifiers')
   log.info("Initializing db")
@@ -220,29 +469,21 @@ def populate_sql_with_dependency_specifiers(deps, db_fname=None):
   # information as interpreted from the json files above.
   initialize(db_fname)
 
-  for distkey in deps:
-    log.info("Working through " + distkey + "'s dependencies.")
-
-    assume_dep_data_exists_for(distkey, deps)
+  def _specifier_rows():
+    for distkey in deps:
+      for dep in deps[distkey]: # for every one of its dependencies,
+        specstring = dep[1]
+        if not isinstance(specstring, six.string_types): # old style
+          specstring = depdata.spectuples_to_specstring(specstring)
+        yield (distkey, dep[0], specstring)
 
-    if not deps[distkey]:
-      log.info(distkey + ' has no dependencies. Adding to that table.')
+  with bulk_load_mode():
+    n_specifiers = bulk_insert(SQL_DEP_SPECIFIER_TABLE, _specifier_rows(), 3)
+    n_no_deps = bulk_insert(SQL_NO_DEPS_TABLE,
+        ((distkey,) for distkey in deps if not deps[distkey]), 1)
 
-    for dep in deps[distkey]: # for every one of its dependencies,
-      satisfying_packagename = dep[0]
-      spectuples = dep[1]
-      specstring = spectuples_to_specstring(spectuples)
-
-      log.info("  satisfying_packagename:" + satisfying_packagename)
-      log.info("  specstring: " + specstring)
-
-      add_to_table(
-          SQL_DEP_SPECIFIER_TABLE,
-          distkey,
-          satisfying_packagename,
-          specstring)
-
-  flush()
+  log.info("Added " + str(n_specifiers) + " dependency specifiers, and " +
+      str(n_no_deps) + " dists with no dependencies.")
 
 
 
@@ -255,7 +496,18 @@ def populate_sql_with_full_dependency_info(
     dists_with_missing_dependencies,
     db_fname=None):
   """
-  (Write this docstring last.)
+  Load elaborated dependencies (and the other results of
+  depdata.elaborate_dependencies) into the sqlite3 db, in bulk (see
+  bulk_load_mode):
+    - each dependency's specifier string into the dependency specifiers table
+    - each (depender, satisfying dist) pair into the elaborated dependencies
+      table
+    - dists with no dependencies into the no-dependencies table
+    - packages_without_available_version_info into the table of packages
+      without version info
+    - dependencies on those packages (for which the satisfying versions are
+      depdata.PACKAGE_VERSIONS_UNKNOWN), which make up
+      dists_with_missing_dependencies, into the missing dependencies table
   """
   log = depresolve.logging.getLogger('populate_sql_with_full_dependency_info')
 
@@ -265,49 +517,702 @@ def populate_sql_with_full_dependency_info(
   # information as interpreted from the json files above.
   initialize(db_fname)
 
-  for distkey in deps_elaborated: # for every dist,
-
-    log.info("Working through " + distkey + "'s dependencies.")
-    for e_dep in deps_elaborated[distkey]: # for every one of its dependencies,
-
-      satisfying_packagename = e_dep[0]
-      list_of_satisfying_versions = e_dep[1]
-      specstring = e_dep[2]
-      # We don't need the SpecifierSet, element 3 (4th) of the tuple right now.
-
-      log.info("  satisfying_packagename:" + satisfying_packagename)
-      log.info("  list_of_satisfying_versions: " +
-          str(list_of_satisfying_versions))
-      log.info("  specstring: " + specstring)
-
-      # First, let's add the dependency specifier to that table.
-      add_to_table(
-          SQL_DEP_SPECIFIER_TABLE,
-          distkey,
-          satisfying_packagename,
-          specstring
-          )
-
-      # Now let's add every satisfying version to the full dependency info
-      # table.
-      for version in list_of_satisfying_versions:
-        satisfying_distkey = depdata.distkey_format(
-            satisfying_packagename, version)
-
-        add_to_table(
-            SQL_DEPENDENCY_TABLE,
+  def _edeps():
+    for distkey in deps_elaborated: # for every dist,
+      for e_dep in deps_elaborated[distkey]: # for every one of its deps,
+        yield (distkey, e_dep)
+
+  def _satisfier_rows():
+    for (distkey, e_dep) in _edeps():
+      if e_dep[1] == depdata.PACKAGE_VERSIONS_UNKNOWN:
+        continue
+      for version in e_dep[1]:
+        yield (
             distkey, # depending dist: 'codegrapher(0.1.1)'
-            satisfying_packagename, # package depended on: 'click'
-            satisfying_distkey # one distkey that could satisfy: 'click(1.0)'
-        )
+            e_dep[0], # package depended on: 'click'
+            # one distkey that could satisfy: 'click(1.0)'
+            depdata.distkey_format(e_dep[0], version))
 
-  flush()
+  with bulk_load_mode():
+    n_specifiers = bulk_insert(SQL_DEP_SPECIFIER_TABLE,
+        ((distkey, e_dep[0], e_dep[2]) for (distkey, e_dep) in _edeps()), 3)
+
+    n_satisfiers = bulk_insert(SQL_DEPENDENCY_TABLE, _satisfier_rows(), 3)
+
+    bulk_insert(SQL_NO_DEPS_TABLE, ((distkey,) for distkey in deps_elaborated
+        if not deps_elaborated[distkey]), 1)
+
+    bulk_insert(SQL_NO_VERS_INFO_TABLE,
+        ((packname,) for packname in packages_without_available_version_info),
+        1)
+
+    n_missing = bulk_insert(SQL_MISSING_DEPS_TABLE,
+        ((distkey, e_dep[0]) for (distkey, e_dep) in _edeps()
+        if e_dep[1] == depdata.PACKAGE_VERSIONS_UNKNOWN), 2)
+
+  log.info("Added " + str(n_specifiers) + " dependencies with " +
+      str(n_satisfiers) + " satisfying dists, and " + str(n_missing) +
+      " dependencies on packages without version info.")
+
+
+
+
+
+def populate_normalized_sql(deps_elaborated, db_fname=None):
+  """
+  Load elaborated dependencies into the normalized tables (see
+  schema/dependency_schema_design_4.sql), in bulk (see bulk_load_mode).
+
+  deps_elaborated may also be a function returning a fresh iterable of
+  (distkey, edeps) pairs (e.g. lambda: load_edeps_from_sql()), which is then
+  read twice, once for the names and versions and once for the
+  dependencies, so that the edeps needn't all be in memory.
+  """
+  if callable(deps_elaborated):
+    get_items = deps_elaborated
+  else:
+    get_items = lambda: six.iteritems(deps_elaborated)
+
+  initialize(db_fname)
+
+  _populate_normalized_sql(get_items)
+
+
+
+
+
+def _populate_normalized_sql(get_items):
+  """
+  Does the work of populate_normalized_sql, given a function returning a
+  fresh iterable of (distkey, edeps) pairs, on the module's existing
+  connection.
+  """
+  log = depresolve.logging.getLogger('populate_normalized_sql')
+
+  # First pass: every package, version, and dist, so that each can be given
+  # an id (and each version its ordinal) before any dependency is written.
+  dist_has_info = dict() # distkey -> whether we have its dependencies
+  packnames = set()
+  for (distkey, edeps) in get_items():
+    dist_has_info[distkey] = True
+    for edep in edeps:
+      packnames.add(edep[0])
+      if edep[1] == depdata.PACKAGE_VERSIONS_UNKNOWN:
+        continue
+      for version in edep[1]:
+        dist_has_info.setdefault(depdata.distkey_format(edep[0], version),
+            False)
+
+  versions_by_package = depdata.generate_dict_versions_by_package(
+      dist_has_info)
+  packnames.update(versions_by_package)
+  version_table = depdata.VersionTable.from_versions_by_package(
+      versions_by_package)
+
+  package_ids = dict((packname, i) for (i, packname) in
+      enumerate(sorted(packnames), 1))
+  version_ids = dict((version, i) for (i, version) in
+      enumerate(sorted(version_table.ordinals), 1))
+  dist_ids = dict((distkey, i) for (i, distkey) in
+      enumerate(sorted(dist_has_info), 1))
+
+  def _dependency_rows(satisfier_rows):
+    """Yield rows for the dependencies table, appending the rows for the
+    satisfying dists table to satisfier_rows as it goes. A dependency's
+    satisfier rows are appended before its own row is yielded, so that they
+    are in satisfier_rows by the time the batch holding it is written.
+
+    A dist has one dependency per package here: if it lists several on the
+    same package, the last is kept, as in the dependency specifiers table."""
+    dependency_id = 0
+    for (distkey, edeps) in get_items():
+      last_on_package = dict((edep[0], i) for (i, edep) in enumerate(edeps))
+      for (i, edep) in enumerate(edeps):
+        if last_on_package[edep[0]] != i:
+          continue
+        dependency_id += 1
+        versions_unknown = edep[1] == depdata.PACKAGE_VERSIONS_UNKNOWN
+        if not versions_unknown:
+          satisfier_rows.extend((dependency_id, dist_ids[
+              depdata.distkey_format(edep[0], version)])
+              for version in edep[1])
+        yield (dependency_id, dist_ids[distkey], package_ids[edep[0]],
+            edep[2], int(versions_unknown))
+
+  with bulk_load_mode():
+    # Replace whatever was there before.
+    for tablename in [SQL_SATISFYING_DISTS_TABLE, SQL_DEPENDENCIES_TABLE,
+        SQL_DISTS_TABLE, SQL_VERSIONS_TABLE, SQL_PACKAGES_TABLE]:
+      SQL_CURSOR.execute("DELETE FROM " + tablename)
+
+    bulk_insert(SQL_PACKAGES_TABLE, ((package_ids[packname], packname)
+        for packname in package_ids), 2)
+
+    bulk_insert(SQL_VERSIONS_TABLE, ((version_ids[version], version,
+        version_table.ordinal(version)) for version in version_ids), 3)
+
+    bulk_insert(SQL_DISTS_TABLE, ((dist_ids[distkey],
+        package_ids[depdata.get_packname(distkey)],
+        version_ids[depdata.get_version(distkey)], int(dist_has_info[distkey]))
+        for distkey in dist_ids), 4)
+
+    # Satisfying dists are gathered while the dependencies are written, and
+    # written a batch at a time.
+    satisfier_rows = []
+    n_satisfiers = 0
+    n_dependencies = 0
+    dependency_rows = _dependency_rows(satisfier_rows)
+    while True:
+      batch = list(itertools.islice(dependency_rows, BULK_LOAD_BATCH_SIZE))
+      if not batch:
+        break
+      n_dependencies += bulk_insert(SQL_DEPENDENCIES_TABLE, batch, 5)
+      n_satisfiers += bulk_insert(SQL_SATISFYING_DISTS_TABLE, satisfier_rows, 2)
+      del satisfier_rows[:]
+
+  log.info("Added " + str(len(package_ids)) + " packages, " +
+      str(len(version_ids)) + " versions, " + str(len(dist_ids)) + " dists, " +
+      str(n_dependencies) + " dependencies, and " + str(n_satisfiers) +
+      " satisfying dists.")
+
+
+
+
+
+def migrate_to_normalized_schema(db_fname=None, drop_old_tables=False):
+  """
+  Copy the data in the text-keyed tables (as written by
+  populate_sql_with_full_dependency_info) into the normalized tables, reading
+  it with load_edeps_from_sql. If drop_old_tables is True, drop the old
+  tables afterwards and vacuum the db to reclaim their space; the reverse
+  lookups (e.g. get_dependers_of_dist) and SQLiteEdeps then read the
+  normalized tables.
+  """
+  global _legacy_tables_in_use
+  initialize(db_fname)
+
+  _populate_normalized_sql(load_edeps_from_sql)
 
+  if drop_old_tables:
+    for tablename in [SQL_DEPENDENCY_TABLE, SQL_DEP_SPECIFIER_TABLE,
+        SQL_NO_DEPS_TABLE, SQL_NO_VERS_INFO_TABLE, SQL_MISSING_DEPS_TABLE]:
+      SQL_CURSOR.execute("DROP TABLE IF EXISTS " + tablename)
+    flush()
+    SQL_CURSOR.execute("VACUUM")
+    _legacy_tables_in_use = None
 
 
 
 
-def load_raw_deps_from_sql():
+
+def load_edeps_from_normalized_sql(db_fname=None):
   """
+  As load_edeps_from_sql, but from the normalized tables. Satisfying
+  versions are listed in pip's order (by ordinal).
   """
-  assert False, "Not written yet"
+  if db_fname is not None:
+    initialize(db_fname)
+  _ensure_connected_to_sqlite()
+
+  cursor = SQL_CONNECTION.cursor()
+  cursor.execute(_NORMALIZED_EDEPS_QUERY)
+
+  return _decode_normalized_edeps(cursor)
+
+
+
+
+
+def _decode_normalized_edeps(rows):
+  """
+  Given rows as selected by _NORMALIZED_EDEPS_QUERY, yield (distkey, edeps)
+  for each dist in them.
+  """
+  for (dist_id, dist_rows) in itertools.groupby(rows,
+      operator.itemgetter(0)):
+    edeps = []
+    distkey = None
+
+    for (dependency_id, rows) in itertools.groupby(dist_rows,
+        operator.itemgetter(3)):
+      rows = list(rows)
+      (dist_id, packname, version, dependency_id, satisfying_packname,
+          specstring, versions_unknown, satisfying_version) = rows[0]
+      distkey = depdata.distkey_format(packname, version)
+
+      if dependency_id is None: # no dependencies
+        continue
+      elif versions_unknown:
+        satisfying_versions = depdata.PACKAGE_VERSIONS_UNKNOWN
+      else:
+        satisfying_versions = [row[7] for row in rows if row[7] is not None]
+
+      edeps.append([satisfying_packname, satisfying_versions, specstring])
+
+    yield (distkey, edeps)
+
+
+
+
+
+# Every dist we have dependency info for, with each of its dependencies and
+# each dependency's satisfying versions. Dist ids are assigned in distkey
+# order and dependency ids in the order the dependencies were given.
+_NORMALIZED_EDEPS_SELECT = (
+    "SELECT d." + SQL_COLUMN_DIST_ID + ", dp." + SQL_COLUMN_PACK_NAME +
+        ", dv." + SQL_COLUMN_VERS_NAME + ", dep." + SQL_COLUMN_DEPENDENCY_ID +
+        ", sp." + SQL_COLUMN_PACK_NAME + ", dep." + SQL_COLUMN_SPECIFIER +
+        ", dep." + SQL_COLUMN_VERSIONS_UNKNOWN + ", sv." +
+        SQL_COLUMN_VERS_NAME +
+    " FROM " + SQL_DISTS_TABLE + " d" +
+    " JOIN " + SQL_PACKAGES_TABLE + " dp ON dp." + SQL_COLUMN_PACKAGE_ID +
+        " = d." + SQL_COLUMN_PACKAGE_ID +
+    " JOIN " + SQL_VERSIONS_TABLE + " dv ON dv." + SQL_COLUMN_VERSION_ID +
+        " = d." + SQL_COLUMN_VERSION_ID +
+    " LEFT JOIN " + SQL_DEPENDENCIES_TABLE + " dep ON dep." +
+        SQL_COLUMN_DEPENDER_DIST_ID + " = d." + SQL_COLUMN_DIST_ID +
+    " LEFT JOIN " + SQL_PACKAGES_TABLE + " sp ON sp." + SQL_COLUMN_PACKAGE_ID +
+        " = dep." + SQL_COLUMN_SATISFYING_PACKAGE_ID +
+    " LEFT JOIN " + SQL_SATISFYING_DISTS_TABLE + " s ON s." +
+        SQL_COLUMN_DEPENDENCY_ID + " = dep." + SQL_COLUMN_DEPENDENCY_ID +
+    " LEFT JOIN " + SQL_DISTS_TABLE + " sd ON sd." + SQL_COLUMN_DIST_ID +
+        " = s." + SQL_COLUMN_SATISFYING_DIST_ID +
+    " LEFT JOIN " + SQL_VERSIONS_TABLE + " sv ON sv." + SQL_COLUMN_VERSION_ID +
+        " = sd." + SQL_COLUMN_VERSION_ID)
+
+_NORMALIZED_EDEPS_ORDER = (
+    " ORDER BY d." + SQL_COLUMN_DIST_ID + ", dep." + SQL_COLUMN_DEPENDENCY_ID +
+        ", sv." + SQL_COLUMN_ORDINAL + ", sv." + SQL_COLUMN_VERS_NAME)
+
+_NORMALIZED_EDEPS_QUERY = (_NORMALIZED_EDEPS_SELECT +
+    " WHERE d." + SQL_COLUMN_HAS_DEPENDENCY_INFO + _NORMALIZED_EDEPS_ORDER)
+
+# The same for one dist, given its package name and version.
+_NORMALIZED_DIST_EDEPS_QUERY = (_NORMALIZED_EDEPS_SELECT +
+    " WHERE dp." + SQL_COLUMN_PACK_NAME + " = ? AND dv." +
+        SQL_COLUMN_VERS_NAME + " = ? AND d." + SQL_COLUMN_HAS_DEPENDENCY_INFO +
+    _NORMALIZED_EDEPS_ORDER)
+
+# Package names and versions of the dists we have dependency info for, in
+# distkey order.
+_NORMALIZED_DISTS_QUERY = (
+    "SELECT p." + SQL_COLUMN_PACK_NAME + ", v." + SQL_COLUMN_VERS_NAME +
+    " FROM " + SQL_DISTS_TABLE + " d" +
+    " JOIN " + SQL_PACKAGES_TABLE + " p ON p." + SQL_COLUMN_PACKAGE_ID +
+        " = d." + SQL_COLUMN_PACKAGE_ID +
+    " JOIN " + SQL_VERSIONS_TABLE + " v ON v." + SQL_COLUMN_VERSION_ID +
+        " = d." + SQL_COLUMN_VERSION_ID +
+    " WHERE d." + SQL_COLUMN_HAS_DEPENDENCY_INFO +
+    " ORDER BY d." + SQL_COLUMN_DIST_ID)
+
+
+
+
+
+def _legacy_tables_hold_data(connection):
+  """
+  Return True if the text-keyed tables (as written by
+  populate_sql_with_full_dependency_info) hold any dists, and False if they
+  are empty or gone (e.g. dropped by migrate_to_normalized_schema), in which
+  case lookups are answered from the normalized tables instead.
+  """
+  for tablename in [SQL_DEP_SPECIFIER_TABLE, SQL_NO_DEPS_TABLE]:
+    try:
+      if connection.execute(
+          "SELECT 1 FROM " + tablename + " LIMIT 1").fetchone() is not None:
+        return True
+    except sqlite3.OperationalError: # no such table
+      pass
+  return False
+
+
+
+def _reading_legacy_tables():
+  """
+  Return whether the module's connection should be read through the
+  text-keyed tables (see _legacy_tables_hold_data). Checked once per
+  connection and load.
+  """
+  global _legacy_tables_in_use
+  _ensure_connected_to_sqlite()
+  if _legacy_tables_in_use is None:
+    _legacy_tables_in_use = _legacy_tables_hold_data(SQL_CONNECTION)
+  return _legacy_tables_in_use
+
+
+
+
+
+def get_dependers_of_dist(distkey):
+  """
+  Return a sorted list of the distkeys of dists with a dependency that the
+  given dist satisfies.
+  """
+  if _reading_legacy_tables():
+    return [row[0] for row in SQL_CURSOR.execute(_DEPENDERS_OF_DIST_QUERY,
+        (distkey,))]
+  return [depdata.distkey_format(*row) for row in SQL_CURSOR.execute(
+      _NORMALIZED_DEPENDERS_OF_DIST_QUERY,
+      (depdata.get_packname(distkey), depdata.get_version(distkey)))]
+
+
+
+def get_dependers_of_package(packname):
+  """
+  Return a sorted list of the distkeys of dists that depend on any version of
+  the given package (whether or not any version satisfies them).
+  """
+  if _reading_legacy_tables():
+    return [row[0] for row in SQL_CURSOR.execute(_DEPENDERS_OF_PACKAGE_QUERY,
+        (packname,))]
+  return [depdata.distkey_format(*row) for row in SQL_CURSOR.execute(
+      _NORMALIZED_DEPENDERS_OF_PACKAGE_QUERY, (packname,))]
+
+
+
+def get_satisfiers_of_dependency(depender_distkey, packname):
+  """
+  Return a list of the distkeys of the dists that satisfy the given dist's
+  dependency on the given package, in the order they were added (or, from
+  the normalized tables, in pip's version order).
+  """
+  if _reading_legacy_tables():
+    return [row[0] for row in SQL_CURSOR.execute(_SATISFIERS_QUERY,
+        (depender_distkey, packname))]
+  return [depdata.distkey_format(packname, row[0]) for row in
+      SQL_CURSOR.execute(_NORMALIZED_SATISFIERS_QUERY,
+      (depdata.get_packname(depender_distkey),
+      depdata.get_version(depender_distkey), packname))]
+
+
+
+# The queries for the functions above, fixed so that sqlite3 prepares each
+# once and reuses it. The text-keyed tables are read through their covering
+# indexes (see SQL_INDEXDEFS)...
+_DEPENDERS_OF_DIST_QUERY = (
+    "SELECT " + SQL_COLUMN_DEPENDER_DIST_KEY + " FROM " + SQL_DEPENDENCY_TABLE +
+    " WHERE " + SQL_COLUMN_SATISFYING_DIST_KEY + " = ?" +
+    " ORDER BY " + SQL_COLUMN_DEPENDER_DIST_KEY)
+
+_DEPENDERS_OF_PACKAGE_QUERY = (
+    "SELECT " + SQL_COLUMN_DEPENDER_DIST_KEY + " FROM " +
+    SQL_DEP_SPECIFIER_TABLE +
+    " WHERE " + SQL_COLUMN_SATISFYING_PACK_NAME + " = ?" +
+    " ORDER BY " + SQL_COLUMN_DEPENDER_DIST_KEY)
+
+_SATISFIERS_QUERY = (
+    "SELECT " + SQL_COLUMN_SATISFYING_DIST_KEY + " FROM " +
+    SQL_DEPENDENCY_TABLE +
+    " WHERE " + SQL_COLUMN_DEPENDER_DIST_KEY + " = ?" +
+    " AND " + SQL_COLUMN_SATISFYING_PACK_NAME + " = ?" +
+    " ORDER BY rowid")
+
+# ... and the normalized tables through idx_satisfying_dists_by_dist and
+# idx_dependencies_by_package, given ids looked up by name. Dist ids are in
+# distkey order, so ordering by them sorts the dependers.
+_NORMALIZED_DIST_ID_SUBQUERY = (
+    "(SELECT d." + SQL_COLUMN_DIST_ID + " FROM " + SQL_DISTS_TABLE + " d" +
+    " JOIN " + SQL_PACKAGES_TABLE + " p ON p." + SQL_COLUMN_PACKAGE_ID +
+        " = d." + SQL_COLUMN_PACKAGE_ID +
+    " JOIN " + SQL_VERSIONS_TABLE + " v ON v." + SQL_COLUMN_VERSION_ID +
+        " = d." + SQL_COLUMN_VERSION_ID +
+    " WHERE p." + SQL_COLUMN_PACK_NAME + " = ? AND v." +
+        SQL_COLUMN_VERS_NAME + " = ?)")
+
+_NORMALIZED_PACKAGE_ID_SUBQUERY = (
+    "(SELECT " + SQL_COLUMN_PACKAGE_ID + " FROM " + SQL_PACKAGES_TABLE +
+    " WHERE " + SQL_COLUMN_PACK_NAME + " = ?)")
+
+# Names of the depending dist, joined to a dependency dep.
+_NORMALIZED_DEPENDER_NAMES = (
+    " JOIN " + SQL_DISTS_TABLE + " d ON d." + SQL_COLUMN_DIST_ID +
+        " = dep." + SQL_COLUMN_DEPENDER_DIST_ID +
+    " JOIN " + SQL_PACKAGES_TABLE + " p ON p." + SQL_COLUMN_PACKAGE_ID +
+        " = d." + SQL_COLUMN_PACKAGE_ID +
+    " JOIN " + SQL_VERSIONS_TABLE + " v ON v." + SQL_COLUMN_VERSION_ID +
+        " = d." + SQL_COLUMN_VERSION_ID)
+
+_NORMALIZED_DEPENDERS_OF_DIST_QUERY = (
+    "SELECT p." + SQL_COLUMN_PACK_NAME + ", v." + SQL_COLUMN_VERS_NAME +
+    " FROM " + SQL_SATISFYING_DISTS_TABLE + " s" +
+    " JOIN " + SQL_DEPENDENCIES_TABLE + " dep ON dep." +
+        SQL_COLUMN_DEPENDENCY_ID + " = s." + SQL_COLUMN_DEPENDENCY_ID +
+    _NORMALIZED_DEPENDER_NAMES +
+    " WHERE s." + SQL_COLUMN_SATISFYING_DIST_ID + " = " +
+        _NORMALIZED_DIST_ID_SUBQUERY +
+    " ORDER BY dep." + SQL_COLUMN_DEPENDER_DIST_ID)
+
+_NORMALIZED_DEPENDERS_OF_PACKAGE_QUERY = (
+    "SELECT p." + SQL_COLUMN_PACK_NAME + ", v." + SQL_COLUMN_VERS_NAME +
+    " FROM " + SQL_DEPENDENCIES_TABLE + " dep" +
+    _NORMALIZED_DEPENDER_NAMES +
+    " WHERE dep." + SQL_COLUMN_SATISFYING_PACKAGE_ID + " = " +
+        _NORMALIZED_PACKAGE_ID_SUBQUERY +
+    " ORDER BY dep." + SQL_COLUMN_DEPENDER_DIST_ID)
+
+_NORMALIZED_SATISFIERS_QUERY = (
+    "SELECT v." + SQL_COLUMN_VERS_NAME +
+    " FROM " + SQL_DEPENDENCIES_TABLE + " dep" +
+    " JOIN " + SQL_SATISFYING_DISTS_TABLE + " s ON s." +
+        SQL_COLUMN_DEPENDENCY_ID + " = dep." + SQL_COLUMN_DEPENDENCY_ID +
+    " JOIN " + SQL_DISTS_TABLE + " d ON d." + SQL_COLUMN_DIST_ID +
+        " = s." + SQL_COLUMN_SATISFYING_DIST_ID +
+    " JOIN " + SQL_VERSIONS_TABLE + " v ON v." + SQL_COLUMN_VERSION_ID +
+        " = d." + SQL_COLUMN_VERSION_ID +
+    " WHERE dep." + SQL_COLUMN_DEPENDER_DIST_ID + " = " +
+        _NORMALIZED_DIST_ID_SUBQUERY +
+    " AND dep." + SQL_COLUMN_SATISFYING_PACKAGE_ID + " = " +
+        _NORMALIZED_PACKAGE_ID_SUBQUERY +
+    " ORDER BY v." + SQL_COLUMN_ORDINAL + ", v." + SQL_COLUMN_VERS_NAME)
+
+
+
+
+
+def load_raw_deps_from_sql(db_fname=None):
+  """
+  Generator yielding (distkey, dependencies) for every dist in the db, in
+  distkey order, with dependencies in the deps format (see depdata), in the
+  order they were added. Dists from the dependency specifiers table are
+  merged with those from the no-dependencies table (which have []).
+
+  Rows are read from a cursor as they are needed, so only one dist's rows are
+  in memory at a time. e.g., to ingest the db:
+    depdata.ingest_raw_deps(sql_i.load_raw_deps_from_sql())
+
+  If db_fname is given, the module is first initialized with it.
+  """
+  if db_fname is not None:
+    initialize(db_fname)
+
+  for (distkey, (specifier_rows, no_deps_rows)) in _merge_groups(
+      _iter_rows_by_depender(SQL_DEP_SPECIFIER_TABLE),
+      _iter_rows_by_depender(SQL_NO_DEPS_TABLE)):
+    yield (distkey, [[row[1], row[2]] for row in specifier_rows])
+
+
+
+
+
+def load_edeps_from_sql(db_fname=None):
+  """
+  As load_raw_deps_from_sql, but yielding each dist's elaborated dependencies
+  (see depdata), from the dependency specifiers, elaborated dependencies,
+  and missing dependencies tables. Dependencies on packages without version
+  info have depdata.PACKAGE_VERSIONS_UNKNOWN for satisfying versions.
+  """
+  if db_fname is not None:
+    initialize(db_fname)
+
+  for (distkey, (specifier_rows, satisfier_rows, missing_rows, no_deps_rows)) \
+      in _merge_groups(
+      _iter_rows_by_depender(SQL_DEP_SPECIFIER_TABLE),
+      _iter_rows_by_depender(SQL_DEPENDENCY_TABLE),
+      _iter_rows_by_depender(SQL_MISSING_DEPS_TABLE),
+      _iter_rows_by_depender(SQL_NO_DEPS_TABLE)):
+    yield (distkey, _decode_edeps(specifier_rows, satisfier_rows,
+        missing_rows))
+
+
+
+
+
+def _decode_edeps(specifier_rows, satisfier_rows, missing_rows):
+  """
+  Given one dist's rows from the dependency specifiers, elaborated
+  dependencies, and missing dependencies tables, return its elaborated
+  dependencies.
+  """
+  satisfying_versions = dict() # package name -> versions, for this dist
+  for row in satisfier_rows:
+    satisfying_versions.setdefault(row[1], []).append(
+        depdata.get_version(row[2]))
+
+  missing_packnames = set(row[1] for row in missing_rows)
+
+  edeps = []
+  for (depender, packname, specstring) in specifier_rows:
+    if packname in missing_packnames:
+      edeps.append([packname, depdata.PACKAGE_VERSIONS_UNKNOWN, specstring])
+    else:
+      edeps.append([packname, satisfying_versions.get(packname, []),
+          specstring])
+
+  return edeps
+
+
+
+
+
+def rebuild_deps_from_sql(db_fname=None, elaborated=False):
+  """
+  Read the whole db into a deps dictionary, or, if elaborated is True, an
+  edeps dictionary. See load_raw_deps_from_sql and load_edeps_from_sql.
+  """
+  if elaborated:
+    return dict(load_edeps_from_sql(db_fname))
+  return dict(load_raw_deps_from_sql(db_fname))
+
+
+
+
+
+def _iter_rows_by_depender(tablename):
+  """
+  Yield (depender distkey, list of rows) for each depender in the given
+  table, in distkey order, the rows in the order they were inserted. Uses its
+  own cursor, so several of these can be read side by side.
+  """
+  _ensure_connected_to_sqlite()
+
+  cursor = SQL_CONNECTION.cursor()
+  cursor.execute("SELECT * FROM " + tablename + " ORDER BY " +
+      SQL_COLUMN_DEPENDER_DIST_KEY + ", rowid")
+
+  for (distkey, rows) in itertools.groupby(cursor, operator.itemgetter(0)):
+    yield (distkey, list(rows))
+
+
+
+
+
+def _merge_groups(*streams):
+  """
+  Merge streams of (distkey, rows) in distkey order (as from
+  _iter_rows_by_depender), yielding (distkey, [rows from each stream]) for
+  every distkey in any of them, with [] for streams without it.
+  """
+  def _tagged(i, stream):
+    for (distkey, rows) in stream:
+      yield (distkey, i, rows)
+
+  # Ties on distkey are broken by stream number, so rows are never compared.
+  merged = heapq.merge(*[_tagged(i, stream)
+      for (i, stream) in enumerate(streams)])
+
+  for (distkey, entries) in itertools.groupby(merged, operator.itemgetter(0)):
+    groups = [[] for stream in streams]
+    for (distkey, i, rows) in entries:
+      groups[i] = rows
+    yield (distkey, groups)
+
+
+
+
+
+class SQLiteEdeps(Mapping):
+  """
+  A read-only edeps mapping (see depdata) served from a dependency db
+  populated by populate_sql_with_full_dependency_info (or, if its text-keyed
+  tables are empty or dropped, from the normalized tables, as written by
+  populate_normalized_sql or migrate_to_normalized_schema, in which case
+  satisfying versions are in pip's order), so that the resolvers
+  (e.g. resolvability.backtracking_satisfy or are_fully_satisfied) can run
+  against dependency data too large to hold in memory.
+
+  Each dist is read with a few fixed (and so prepared once and reused by
+  sqlite3) queries on first lookup. The most recently used max_cached decoded
+  entries are kept. As with other shared results, do not modify the returned
+  lists in place.
+
+  Uses its own connection to db_fname (default: sql_dependency_fname), not
+  the module's.
+  """
+
+  _SPECIFIERS_QUERY = "SELECT * FROM " + SQL_DEP_SPECIFIER_TABLE + \
+      " WHERE " + SQL_COLUMN_DEPENDER_DIST_KEY + " = ? ORDER BY rowid"
+  _SATISFIERS_QUERY = "SELECT * FROM " + SQL_DEPENDENCY_TABLE + \
+      " WHERE " + SQL_COLUMN_DEPENDER_DIST_KEY + " = ? ORDER BY rowid"
+  _MISSING_QUERY = "SELECT * FROM " + SQL_MISSING_DEPS_TABLE + \
+      " WHERE " + SQL_COLUMN_DEPENDER_DIST_KEY + " = ?"
+  _NO_DEPS_QUERY = "SELECT 1 FROM " + SQL_NO_DEPS_TABLE + \
+      " WHERE " + SQL_COLUMN_DEPENDER_DIST_KEY + " = ?"
+  _DISTKEYS_QUERY = "SELECT " + SQL_COLUMN_DEPENDER_DIST_KEY + " FROM " + \
+      SQL_DEP_SPECIFIER_TABLE + " UNION SELECT " + \
+      SQL_COLUMN_DEPENDER_DIST_KEY + " FROM " + SQL_NO_DEPS_TABLE
+
+  def __init__(self, db_fname=None, max_cached=100000):
+    if db_fname is None:
+      db_fname = sql_dependency_fname
+    self.db_fname = db_fname
+    self.max_cached = max_cached
+    self.connection = sqlite3.connect(db_fname)
+    self.normalized = not _legacy_tables_hold_data(self.connection)
+    self._decoded = collections.OrderedDict() # distkey -> edeps, LRU order
+    self._len = None
+
+
+
+  def __getitem__(self, distkey):
+    try:
+      # Popped and put back below, to mark it most recently used.
+      decoded = self._decoded.pop(distkey)
+
+    except KeyError:
+      decoded = self._read(distkey)
+
+      if len(self._decoded) >= self.max_cached:
+        self._decoded.popitem(last=False)
+
+    self._decoded[distkey] = decoded
+    return decoded
+
+
+
+  def _read(self, distkey):
+    """Read and decode the given dist's edeps, raising KeyError if the db
+    has no dependency info for it."""
+    if self.normalized:
+      for (found_distkey, edeps) in _decode_normalized_edeps(
+          self.connection.execute(_NORMALIZED_DIST_EDEPS_QUERY,
+          (depdata.get_packname(distkey), depdata.get_version(distkey)))):
+        return edeps
+      raise KeyError(distkey)
+
+    specifier_rows = self.connection.execute(
+        self._SPECIFIERS_QUERY, (distkey,)).fetchall()
+
+    if not specifier_rows and self.connection.execute(
+        self._NO_DEPS_QUERY, (distkey,)).fetchone() is None:
+      raise KeyError(distkey)
+
+    return _decode_edeps(specifier_rows,
+        self.connection.execute(self._SATISFIERS_QUERY, (distkey,)),
+        self.connection.execute(self._MISSING_QUERY, (distkey,)))
+
+
+
+  def __contains__(self, distkey):
+    if distkey in self._decoded:
+      return True
+    try:
+      self[distkey]
+    except KeyError:
+      return False
+    return True
+
+
+
+  def __iter__(self):
+    if self.normalized:
+      for row in self.connection.execute(_NORMALIZED_DISTS_QUERY):
+        yield depdata.distkey_format(*row)
+    else:
+      for row in self.connection.execute(self._DISTKEYS_QUERY):
+        yield row[0]
+
+
+
+  def __len__(self):
+    # The db is read-only to us, so count just once.
+    if self._len is None:
+      query = _NORMALIZED_DISTS_QUERY if self.normalized else \
+          self._DISTKEYS_QUERY
+      self._len = self.connection.execute(
+          "SELECT COUNT(*) FROM (" + query + ")").fetchone()[0]
+    return self._len
+
+
+
+  def close(self):
+    self.connection.close()
@@ -0,0 +1,385 @@
+"""
+<Program Name>
+  vectorized_elaboration.py
+
+<Purpose>
+  An alternative engine for depdata.elaborate_dependencies that filters
+  versions with numpy array operations instead of running pip's
+  SpecifierSet.filter over every version of the package depended on, in
+  Python, for every dependency.
+
+  Each package's versions (in the order given in versions_by_package) are
+  parsed once, into arrays of integer ranks: the rank of each version among
+  the package's distinct versions in pip order, likewise for its public
+  version (without local part) and its base version (without pre-, post-,
+  dev-release or local parts), plus flags (prerelease, postrelease, local,
+  legacy) and the release numbers themselves. A specifier like '>=1.4' then
+  becomes one binary search for '1.4' among the package's sorted versions
+  and one comparison over the rank array. '<', '<=', '>', '==', '!=', '~='
+  and '==X.Y.*' are all handled this way, with pip's own special cases (e.g.
+  '<2' excluding 2.0a1, '>2' excluding 2.post1, '==2' ignoring local
+  versions) applied as further masks.
+
+  The results are exactly those of SpecifierSet.filter. Anything this
+  engine doesn't model exactly falls back to pip's own code (the public
+  Specifier.contains), one specifier at a time: '===', '~=' and wildcard
+  versions that aren't plain release numbers (e.g. with epochs, leading
+  zeros, or pre-, post- or dev-release parts), packages with release numbers
+  too large for int64, and specifier strings that pip can only read as
+  legacy specifiers.
+
+  The filtering is a cache-warming pass: elaborate_dependencies_vectorized()
+  puts each distinct dependency's satisfying versions in an
+  ElaborationCache, and then has depdata.elaborate_dependencies() assemble
+  the edeps from it, so that the output (including the lists of packages and
+  dists with missing information) is exactly what elaborate_dependencies
+  gives. With the cache warm, that second pass is a dictionary lookup per
+  dependency.
+
+  numpy is optional. Without it, elaborate_dependencies_vectorized() just
+  calls depdata.elaborate_dependencies().
+
+  See benchmark_elaboration.py for a comparison of the two engines.
+
+"""
+
+import depresolve
+log = depresolve.logging.getLogger('depresolve')
+import depresolve.depdata as depdata
+import pip._vendor.packaging.version # for Version
+import pip._vendor.packaging.specifiers # for SpecifierSet
+
+import bisect
+import re
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Release numbers at least this large are not put in int64 arrays.
+_MAX_RELEASE_NUMBER = 1 << 62
+
+# A version string that is only release numbers, without leading zeros, e.g.
+# '2.2.1'. pip reads the '~=' and '==X.*' prefixes of these as the numbers
+# they look like; others it compares as strings, in ways not reproduced here.
+_PLAIN_RELEASE = re.compile(r'(0|[1-9][0-9]*)(\.(0|[1-9][0-9]*))*\Z')
+
+
+
+
+def elaborate_dependencies_vectorized(deps, versions_by_package,
+    allow_prerelease=False, cache=None):
+  """
+  Elaborate dependencies as depdata.elaborate_dependencies does, with the
+  same arguments and results, but filtering versions with numpy.
+
+  The numpy work is a cache-warming pass: each distinct (package, specifier
+  string) in deps is filtered once, with the results put in an
+  ElaborationCache (cache, if given). depdata.elaborate_dependencies is then
+  run with that cache, and builds edeps from it without filtering anything
+  itself.
+
+  range_encode and workers are not supported here.
+  """
+  if cache is None:
+    cache = depdata.ElaborationCache()
+
+  if numpy is None:
+    log.warning('numpy is not available. Elaborating without it.')
+
+  else:
+    elaborator = VectorizedElaborator(versions_by_package)
+    for distkey in deps:
+      for dep in deps[distkey]:
+        key = (dep[0], dep[1], allow_prerelease)
+        if key in cache.results or dep[0] not in versions_by_package:
+          continue
+        try:
+          cache.results[key] = elaborator.filter(dep[0], dep[1],
+              allow_prerelease)
+        except pip._vendor.packaging.specifiers.InvalidSpecifier:
+          # Leave this one for elaborate_dependencies to raise as it would.
+          pass
+
+    log.info('Vectorized elaboration: ' + str(elaborator.vectorized) +
+        ' specifiers vectorized, ' + str(elaborator.fallbacks) +
+        ' fell back to pip.')
+
+  return depdata.elaborate_dependencies(deps, versions_by_package,
+      allow_prerelease=allow_prerelease, cache=cache)
+
+
+
+
+
+class VectorizedElaborator(object):
+  """
+  Filters the versions of packages in versions_by_package by specifier
+  strings. filter() returns what SpecifierSet.filter would.
+
+  The arrays for each package are built the first time that package is
+  filtered on.
+
+    vectorized  number of individual specifiers evaluated with numpy
+    fallbacks   number of individual specifiers evaluated by pip instead
+  """
+
+  def __init__(self, versions_by_package):
+    if numpy is None:
+      raise ImportError('VectorizedElaborator requires numpy.')
+    self.versions_by_package = versions_by_package
+    self.arrays = dict()
+    self.vectorized = 0
+    self.fallbacks = 0
+
+
+
+  def filter(self, packname, specstring, allow_prerelease=False):
+    """
+    Return the versions of the given package satisfying the given specifier
+    string, in versions_by_package order.
+    """
+    specset = pip._vendor.packaging.specifiers.SpecifierSet(specstring)
+    if allow_prerelease:
+      specset.prereleases = True
+
+    versions = self.versions_by_package[packname]
+    specs = list(specset)
+
+    # pip can only read some specifier strings as legacy specifiers, which
+    # behave differently throughout.
+    if [spec for spec in specs if
+        not isinstance(spec, pip._vendor.packaging.specifiers.Specifier)]:
+      self.fallbacks += len(specs)
+      return list(specset.filter(versions))
+
+    arrays = self.arrays.get(packname)
+    if arrays is None:
+      arrays = self.arrays[packname] = VersionArrays(versions)
+
+    if not specs:
+      # With no specifiers, SpecifierSet.filter drops legacy versions and,
+      # unless told otherwise, prereleases - but only if that leaves any.
+      mask = ~arrays.is_legacy
+      if not allow_prerelease:
+        final_mask = mask & ~arrays.is_prerelease
+        if final_mask.any():
+          mask = final_mask
+
+    else:
+      mask = numpy.ones(len(versions), dtype=bool)
+      for spec in specs:
+        mask &= self._spec_mask(spec, arrays)
+
+      # A prerelease is only allowed if asked for, or if a specifier names
+      # one (e.g. '>=2.0b1').
+      if not specset.prereleases:
+        mask &= ~arrays.is_prerelease
+
+    return [versions[i] for i in numpy.flatnonzero(mask)]
+
+
+
+  def _spec_mask(self, spec, arrays):
+    """
+    Boolean array, True for each version satisfying the given
+    pip._vendor.packaging.specifiers.Specifier, ignoring prerelease rules.
+    """
+    mask = None
+
+    if spec.operator == '~=':
+      # pip: >= the given version and == its release prefix, e.g. ~=2.2.1 is
+      # >=2.2.1 and ==2.2.*.
+      if _PLAIN_RELEASE.match(spec.version):
+        prefix_mask = arrays.prefix_mask(spec.version.split('.')[:-1])
+        if prefix_mask is not None:
+          mask = arrays.compare('>=', spec.version) & prefix_mask
+
+    elif spec.operator in ['==', '!='] and spec.version.endswith('.*'):
+      if _PLAIN_RELEASE.match(spec.version[:-2]):
+        mask = arrays.prefix_mask(spec.version[:-2].split('.'))
+        if mask is not None and spec.operator == '!=':
+          mask = ~mask & ~arrays.is_legacy
+
+    elif spec.operator != '===':
+      mask = arrays.compare(spec.operator, spec.version)
+
+    if mask is None:
+      self.fallbacks += 1
+      return numpy.array([spec.contains(parsed, prereleases=True)
+          for parsed in arrays.parsed], dtype=bool)
+
+    self.vectorized += 1
+    return mask
+
+
+
+
+
+class VersionArrays(object):
+  """
+  The versions of one package, as numpy arrays for VectorizedElaborator.
+  Arrays are in the order of the versions given. Ranks are among the
+  package's distinct (by pip) versions, in pip order. Legacy versions have
+  rank -1 and are excluded from every comparison, as pip excludes them.
+
+    parsed          pip Version (or LegacyVersion) of each version
+    full_sorted     distinct Versions, sorted; full_rank indexes into this
+    public_sorted   distinct public Versions, sorted; public_rank likewise
+    base_sorted     distinct base Versions, sorted; base_rank likewise
+    is_legacy, is_prerelease, is_postrelease, is_local, has_suffix
+                    flags (has_suffix: has a pre-, post- or dev-release part)
+    epoch           epoch of each version
+    release         2D array of release numbers, zero-padded to the longest
+                    release; None if any number is too large for int64
+    release_length  number of release numbers in each version
+  """
+  __slots__ = ['parsed', 'full_sorted', 'full_rank', 'public_sorted',
+      'public_rank', 'base_sorted', 'base_rank', 'is_legacy', 'is_prerelease',
+      'is_postrelease', 'is_local', 'has_suffix', 'epoch', 'release',
+      'release_length']
+
+  def __init__(self, versions):
+    Version = pip._vendor.packaging.version.Version
+    self.parsed = [depdata.parse_version(v) for v in versions]
+    good = [p for p in self.parsed if isinstance(p, Version)]
+
+    publics = [depdata.parse_version(p.public) for p in good]
+    bases = [depdata.parse_version(p.base_version) for p in good]
+
+    self.full_sorted = sorted(set(good))
+    self.public_sorted = sorted(set(publics))
+    self.base_sorted = sorted(set(bases))
+
+    full_ranks = dict((v, i) for (i, v) in enumerate(self.full_sorted))
+    public_ranks = dict((v, i) for (i, v) in enumerate(self.public_sorted))
+    base_ranks = dict((v, i) for (i, v) in enumerate(self.base_sorted))
+
+    n = len(self.parsed)
+    self.is_legacy = numpy.array([not isinstance(p, Version)
+        for p in self.parsed], dtype=bool)
+    self.is_prerelease = numpy.array([p.is_prerelease for p in self.parsed],
+        dtype=bool)
+
+    self.full_rank = numpy.full(n, -1, dtype=numpy.int64)
+    self.public_rank = numpy.full(n, -1, dtype=numpy.int64)
+    self.base_rank = numpy.full(n, -1, dtype=numpy.int64)
+    self.is_postrelease = numpy.zeros(n, dtype=bool)
+    self.is_local = numpy.zeros(n, dtype=bool)
+    self.has_suffix = numpy.zeros(n, dtype=bool)
+    self.epoch = numpy.full(n, -1, dtype=numpy.int64)
+    self.release_length = numpy.zeros(n, dtype=numpy.int64)
+
+    good_indices = numpy.flatnonzero(~self.is_legacy)
+    for (i, p, public, base) in zip(good_indices, good, publics, bases):
+      self.full_rank[i] = full_ranks[p]
+      self.public_rank[i] = public_ranks[public]
+      self.base_rank[i] = base_ranks[base]
+      self.is_postrelease[i] = p.is_postrelease
+      self.is_local[i] = p.local is not None
+      self.has_suffix[i] = p.pre is not None or p.post is not None or \
+          p.dev is not None
+      self.epoch[i] = p.epoch
+      self.release_length[i] = len(p.release)
+
+    self.release = None
+    longest = max([len(p.release) for p in good] or [0])
+    if not [p for p in good if max(p.release) >= _MAX_RELEASE_NUMBER]:
+      self.release = numpy.zeros((n, longest), dtype=numpy.int64)
+      for (i, p) in zip(good_indices, good):
+        self.release[i, :len(p.release)] = p.release
+
+
+
+  def compare(self, operator, spec_version):
+    """
+    Boolean array for specifier operator '<', '<=', '>', '>=', '==' or '!='
+    with a (non-wildcard) version string, as pip's Specifier evaluates it.
+    """
+    spec = pip._vendor.packaging.version.Version(spec_version)
+    valid = ~self.is_legacy
+
+    if operator == '>=':
+      # pip compares the public version, ignoring any local part.
+      return valid & (self.public_rank >=
+          bisect.bisect_left(self.public_sorted, spec))
+
+    elif operator == '<=':
+      return valid & (self.public_rank <
+          bisect.bisect_right(self.public_sorted, spec))
+
+    elif operator == '<':
+      mask = valid & (self.full_rank <
+          bisect.bisect_left(self.full_sorted, spec))
+      # <2 should not match 2.0a1, unless the spec is itself a prerelease.
+      if not spec.is_prerelease:
+        mask &= ~(self.is_prerelease & self._base_equals(spec))
+      return mask
+
+    elif operator == '>':
+      mask = valid & (self.full_rank >=
+          bisect.bisect_right(self.full_sorted, spec))
+      # >2 should match neither 2.post1 (unless the spec is itself a
+      # postrelease) nor 2+local.
+      same_base = self._base_equals(spec)
+      if not spec.is_postrelease:
+        mask &= ~(self.is_postrelease & same_base)
+      mask &= ~(self.is_local & same_base)
+      return mask
+
+    elif operator in ['==', '!=']:
+      # Local versions are only compared if the spec has a local part.
+      if spec.local:
+        mask = self.full_rank == self._rank_of(self.full_sorted, spec)
+      else:
+        mask = self.public_rank == self._rank_of(self.public_sorted, spec)
+      return valid & mask if operator == '==' else valid & ~mask
+
+    raise ValueError('Unexpected specifier operator: ' + operator)
+
+
+
+  def prefix_mask(self, prefix):
+    """
+    Boolean array for pip's wildcard equality (=='X.Y.*') with the given
+    prefix of plain release numbers (see _PLAIN_RELEASE), split into strings
+    (e.g. ['1', '2']). Returns None if the package's release numbers don't
+    fit in the arrays, or the prefix is empty.
+    """
+    if self.release is None or not prefix:
+      return None
+
+    numbers = [int(part) for part in prefix]
+    length = len(numbers)
+    columns = min(length, self.release.shape[1])
+
+    # Release numbers beyond the longest release in the package are all 0.
+    if [number for number in numbers[columns:] if number]:
+      return numpy.zeros(len(self.parsed), dtype=bool)
+
+    mask = ~self.is_legacy & (self.epoch == 0)
+    if columns:
+      mask &= (self.release[:, :columns] == numbers[:columns]).all(axis=1)
+
+    # pip pads releases shorter than the prefix with zeros, unless they have
+    # a pre-, post- or dev-release part, in which case they don't match.
+    mask &= (self.release_length >= length) | ~self.has_suffix
+    return mask
+
+
+
+  def _base_equals(self, spec):
+    return self.base_rank == self._rank_of(self.base_sorted,
+        pip._vendor.packaging.version.Version(spec.base_version))
+
+
+
+  @staticmethod
+  def _rank_of(sorted_versions, version):
+    """Rank of version in sorted_versions, or -2 (matching no rank) if absent.
+    """
+    i = bisect.bisect_left(sorted_versions, version)
+    if i < len(sorted_versions) and sorted_versions[i] == version:
+      return i
+    return -2
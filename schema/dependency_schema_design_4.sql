@@ -0,0 +1,50 @@
+CREATE TABLE IF NOT EXISTS packages(
+  package_id INTEGER PRIMARY KEY,
+  pack_name TEXT UNIQUE NOT NULL
+)
+
+# ordinal: rank in pip's version order (see depdata.VersionTable); versions
+# pip considers equal, like '2' and '2.0', share an ordinal.
+CREATE TABLE IF NOT EXISTS versions(
+  version_id INTEGER PRIMARY KEY,
+  vers_name TEXT UNIQUE NOT NULL,
+  ordinal INTEGER NOT NULL
+)
+
+# has_dependency_info: 0 for dists known only as satisfiers of others'
+# dependencies
+CREATE TABLE IF NOT EXISTS dists(
+  dist_id INTEGER PRIMARY KEY,
+  package_id INTEGER NOT NULL REFERENCES packages,
+  version_id INTEGER NOT NULL REFERENCES versions,
+  has_dependency_info INTEGER NOT NULL,
+  UNIQUE(package_id, version_id)
+)
+
+# versions_unknown: 1 for dependencies on packages without version info
+# (replaces missing_dependencies). Dists without dependencies have no rows
+# here (replaces dists_with_no_dependencies). One dependency per dist and
+# package: a dist listing several on one package keeps only the last, as
+# dependency_specifiers does.
+CREATE TABLE IF NOT EXISTS dependencies(
+  dependency_id INTEGER PRIMARY KEY,
+  depender_dist_id INTEGER NOT NULL REFERENCES dists,
+  satisfying_package_id INTEGER NOT NULL REFERENCES packages,
+  specifier TEXT NOT NULL,
+  versions_unknown INTEGER NOT NULL,
+  UNIQUE(depender_dist_id, satisfying_package_id)
+)
+
+CREATE TABLE IF NOT EXISTS satisfying_dists(
+  dependency_id INTEGER NOT NULL REFERENCES dependencies,
+  satisfying_dist_id INTEGER NOT NULL REFERENCES dists,
+  PRIMARY KEY(dependency_id, satisfying_dist_id)
+) WITHOUT ROWID
+
+# For reverse lookups: the dependencies on a package, and the dependencies a
+# dist satisfies.
+CREATE INDEX IF NOT EXISTS idx_dependencies_by_package
+  ON dependencies(satisfying_package_id, depender_dist_id)
+
+CREATE INDEX IF NOT EXISTS idx_satisfying_dists_by_dist
+  ON satisfying_dists(satisfying_dist_id, dependency_id)
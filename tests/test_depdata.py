@@ -8,8 +8,11 @@
 
 """
 
+import gc
 import json
 import os
+import pickle
+import random
 
 import depresolve # __init__ for errors
 import depresolve.depdata as depdata
@@ -20,6 +23,23 @@ def main():
   """
   """
   test_depdata()
+  test_compact_edeps()
+  test_mapped_edeps()
+  test_iter_json_db()
+  test_load_json_db_error_modes()
+  test_range_encoded_edeps()
+  test_version_table()
+  test_distkey()
+  test_elaborate_dependencies_incremental()
+  test_elaborate_dependencies_in_parallel()
+  test_elaboration_cache()
+  test_background_loading()
+  test_journaled_dict()
+  test_validate_deps()
+  test_reverse_dependency_index()
+  test_diff_deps()
+  test_fingerprints()
+  test_ingest_raw_deps()
 
   print("All tests in main() OK")
 
@@ -83,6 +103,969 @@ def test_depdata():
 
 
 
+def test_compact_edeps():
+  """
+  Round-trip elaborated dependencies through the compact binary store.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+
+  # Include a dependency we can't elaborate, to check the sentinel survives,
+  # and a second dependency on any version of six.
+  edeps['foo(1)'] = [depdata._elaborate_dependency(['nonexistent', '>=1'],
+      versions_by_package)]
+  edeps['bar(1)'] = [depdata._elaborate_dependency(['six', ''],
+      versions_by_package)]
+
+  depdata.write_edeps_compact(edeps, 'data/test_edeps.bin')
+  loaded = depdata.load_edeps_compact('data/test_edeps.bin')
+
+  assert sorted(edeps) == sorted(loaded), \
+      "Compact edeps store lost or added distkeys!"
+
+  for distkey in edeps:
+    assert [list(edep) for edep in edeps[distkey]] == loaded[distkey], \
+        "Compact edeps store mangled the edeps of " + distkey
+
+  assert loaded['foo(1)'][0][1] == depdata.PACKAGE_VERSIONS_UNKNOWN
+
+  # Identical satisfying version lists are stored (and loaded) only once.
+  assert loaded['autosubmit(3.0.4)'][0][1] is loaded['bar(1)'][0][1]
+  assert loaded['b(1)'][0][1] == ['2', '3']
+
+  print("test_compact_edeps(): All tests OK.")
+
+
+
+
+
+def test_mapped_edeps():
+  """
+  Lazily read elaborated dependencies from a memory-mapped compact store.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+
+  depdata.write_edeps_compact(edeps, 'data/test_edeps.bin')
+  mapped = depdata.MappedEdeps('data/test_edeps.bin')
+
+  assert len(edeps) == len(mapped)
+  assert sorted(edeps) == list(mapped), \
+      "MappedEdeps should iterate over distkeys in sorted order."
+  assert 'x(1)' in mapped and 'x(2)' not in mapped and '' not in mapped
+
+  # Nothing is decoded until asked for, and then only what was asked for.
+  assert not mapped._decoded
+  assert [['a', ['2', '3'], '>=2,<4']] == mapped['b(1)']
+  assert ['b(1)'] == list(mapped._decoded)
+
+  # Decoded entries are cached.
+  assert mapped['b(1)'] is mapped['b(1)']
+
+  try:
+    mapped['nonexistent(1)']
+  except KeyError:
+    pass
+  else:
+    assert False, "MappedEdeps should raise KeyError for unknown distkeys."
+
+  for distkey in edeps:
+    assert [list(edep) for edep in edeps[distkey]] == mapped[distkey]
+
+  mapped.close()
+
+  # ensure_data_loaded maps the store only while it is at least as new as
+  # the json edeps.
+  saved = (depdata.elaborated_dependencies, depdata.ELABORATED_DEPS_FNAME,
+      depdata.ELABORATED_DEPS_COMPACT_FNAME)
+  try:
+    depdata.ELABORATED_DEPS_FNAME = 'data/test_edeps_current.json'
+    depdata.ELABORATED_DEPS_COMPACT_FNAME = 'data/test_edeps.bin'
+    json.dump(edeps, open(depdata.ELABORATED_DEPS_FNAME, 'w'))
+    bin_mtime = os.path.getmtime(depdata.ELABORATED_DEPS_COMPACT_FNAME)
+
+    os.utime(depdata.ELABORATED_DEPS_FNAME, (bin_mtime - 10, bin_mtime - 10))
+    depdata.elaborated_dependencies = None
+    depdata._load_edeps(include_sorts=False)
+    assert isinstance(depdata.elaborated_dependencies, depdata.MappedEdeps)
+    depdata.elaborated_dependencies.close()
+
+    # Re-elaborated after the store was written: the store is stale.
+    os.utime(depdata.ELABORATED_DEPS_FNAME, (bin_mtime + 10, bin_mtime + 10))
+    depdata.elaborated_dependencies = None
+    depdata._load_edeps(include_sorts=False)
+    assert isinstance(depdata.elaborated_dependencies, dict)
+    assert sorted(edeps) == sorted(depdata.elaborated_dependencies)
+
+  finally:
+    (depdata.elaborated_dependencies, depdata.ELABORATED_DEPS_FNAME,
+        depdata.ELABORATED_DEPS_COMPACT_FNAME) = saved
+
+  print("test_mapped_edeps(): All tests OK.")
+
+
+
+
+
+def test_iter_json_db():
+  """
+  Stream a json db, with tiny buffers and with filters.
+  """
+  json.dump(testdata.DEPS_MODERATE, open('data/test_deps_set.json', 'w'),
+      indent=1)
+
+  # Tiny chunks force values (including numbers) to straddle buffer refills.
+  for chunk_size in [1, 3, 64]:
+    streamed = dict(depdata.iter_json_db('data/test_deps_set.json',
+        chunk_size=chunk_size))
+    assert testdata.DEPS_MODERATE == streamed, \
+        "iter_json_db mangled data with chunk_size " + str(chunk_size)
+
+  partial = depdata.load_json_db('data/test_deps_set.json',
+      packages=set(['a', 'x']))
+  assert sorted(['x(1)', 'a(1)', 'a(2)', 'a(3)', 'a(4)']) == sorted(partial)
+
+  partial = depdata.load_json_db('data/test_deps_set.json',
+      key_filter=lambda distkey: distkey.startswith('six(1.4'))
+  assert sorted(['six(1.4.0)', 'six(1.4.1)']) == sorted(partial)
+
+  open('data/test_numbers.json', 'w').write(
+      '{"a(1)": 12345, "b(1)": [true, null, 1.5e3], "c(1)": {} }')
+  assert [('a(1)', 12345), ('b(1)', [True, None, 1500.0]), ('c(1)', {})] == \
+      list(depdata.iter_json_db('data/test_numbers.json', chunk_size=2))
+
+  # Top-level numbers split by a chunk boundary anywhere, including just
+  # after a '.', 'e', 'E', or '-', are read whole.
+  numbers = {'a(1)': 12.5, 'b(1)': -3, 'c(1)': 1.5e-3, 'd(1)': 2E+10,
+      'e(1)': -0.25, 'f(1)': 7}
+  open('data/test_numbers.json', 'w').write(
+      '{"a(1)":12.5,"b(1)":-3,"c(1)":1.5e-3,"d(1)":2E+10,"e(1)": -0.25 ,'
+      '"f(1)":7}')
+  for chunk_size in range(1, 20):
+    assert numbers == dict(depdata.iter_json_db('data/test_numbers.json',
+        chunk_size=chunk_size)), 'Mangled numbers with chunk_size ' + \
+        str(chunk_size)
+
+  print("test_iter_json_db(): All tests OK.")
+
+
+
+
+
+def test_load_json_db_error_modes():
+  """
+  Missing and unparseable files, in the non-interactive error modes.
+  """
+  fname = 'data/test_missing.json'
+  if os.path.exists(fname):
+    os.remove(fname)
+
+  try:
+    depdata.load_json_db(fname, error_mode='raise')
+  except IOError:
+    pass
+  else:
+    assert False, "Expected IOError loading a missing file in raise mode."
+  assert not os.path.exists(fname)
+
+  assert {} == depdata.load_json_db(fname, error_mode='empty')
+  assert os.path.exists(fname), "File should be created in empty mode."
+
+  # The (empty) file created above now loads fine even in raise mode.
+  assert {} == depdata.load_json_db(fname, error_mode='raise')
+
+  open(fname, 'w').write('{"a(1)": [["b", ""]], "b(1)": [')
+
+  try:
+    depdata.load_json_db(fname, error_mode='raise')
+  except ValueError:
+    pass
+  else:
+    assert False, "Expected ValueError loading truncated json in raise mode."
+
+  assert {} == depdata.load_json_db(fname, error_mode='empty')
+
+  os.remove(fname)
+
+  print("test_load_json_db_error_modes(): All tests OK.")
+
+
+
+
+
+
+
+
+def test_range_encoded_edeps():
+  """
+  Elaborate dependencies with satisfying versions as index ranges into each
+  package's sorted versions, and round-trip them through json.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  deps['y(1)'] = [['six', '>=1.2.0,!=1.4.1,!=1.6.0,<1.10.0']]
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+  r_edeps = depdata.elaborate_dependencies(deps, versions_by_package,
+      range_encode=True)[0]
+
+  # Same contents, in pip order rather than the order they were listed in.
+  assert sorted(edeps) == sorted(r_edeps)
+  for distkey in edeps:
+    for edep, r_edep in zip(edeps[distkey], r_edeps[distkey]):
+      assert edep[0] == r_edep[0] and edep[2] == r_edep[2]
+      assert sorted(edep[1]) == sorted(r_edep[1])
+
+  # An unconstrained dependency is a single range.
+  six_all = r_edeps['autosubmit(3.0.4)'][0][1]
+  assert isinstance(six_all, depdata.VersionRanges)
+  assert [[0, 15]] == six_all.ranges and not six_all.excluded
+  assert '1.10.0' == six_all[-1] and '1.1.0' == six_all[0]
+
+  # Small gaps are exclusions within a range.
+  six_some = r_edeps['y(1)'][0][1]
+  assert 1 == len(six_some.ranges)
+  assert ['1.2.0', '1.3.0', '1.4.0', '1.5.1', '1.5.2', '1.6.1', '1.7.0',
+      '1.7.2', '1.7.3', '1.8.0', '1.9.0'] == list(six_some)
+  assert list(reversed(list(six_some))) == list(reversed(six_some))
+  assert '1.4.1' not in six_some and '1.4.0' in six_some
+  assert '1.10.0' not in six_some and '99' not in six_some
+  assert 11 == len(six_some)
+
+  # Indexing and membership agree with the plain list, whatever the ranges
+  # and exclusions.
+  package_versions = depdata.PackageVersions([str(i) for i in range(40)])
+  all_versions = package_versions.versions
+  rng = random.Random(0)
+  for trial in range(200):
+    versions = [v for v in all_versions if rng.random() < trial / 200.0]
+    ranges = depdata.VersionRanges.from_versions(versions, package_versions)
+    expected = [v for v in all_versions if v in versions]
+    assert expected == [ranges[i] for i in range(len(ranges))]
+    assert expected[::-1] == [ranges[-i] for i in range(1, len(ranges) + 1)]
+    assert [v in expected for v in all_versions] == \
+        [v in ranges for v in all_versions]
+    for index in [len(ranges), -len(ranges) - 1]:
+      try:
+        ranges[index]
+      except IndexError:
+        pass
+      else:
+        assert False, 'Expected IndexError for index ' + str(index)
+
+  # Satisfiable by nothing: empty, and still false.
+  assert [] == depdata.VersionRanges.from_versions([],
+      depdata.PackageVersions(['1', '2']))
+  assert not depdata.VersionRanges.from_versions([],
+      depdata.PackageVersions(['1', '2']))
+
+  depdata.write_range_encoded_edeps(r_edeps, 'data/test_edeps_ranges.json')
+  loaded = depdata.load_range_encoded_edeps('data/test_edeps_ranges.json')
+  assert sorted(loaded) == sorted(r_edeps)
+  for distkey in r_edeps:
+    for edep, l_edep in zip(r_edeps[distkey], loaded[distkey]):
+      assert list(edep[1]) == list(l_edep[1])
+
+  # Each package's versions are shared by all its VersionRanges.
+  assert loaded['autosubmit(3.0.4)'][0][1].package_versions is \
+      loaded['y(1)'][0][1].package_versions
+
+  print("test_range_encoded_edeps(): All tests OK.")
+
+
+
+
+
+def test_version_table():
+  """
+  Version ordinals, and the functions that use them in place of parsing.
+  """
+  versions = ['1.0', '2', '2.0', '1.10', '1.9', '1.0a1', '2.0.post1']
+  table = depdata.VersionTable(versions)
+
+  assert len(versions) == len(table) and '3' not in table
+  assert table.ordinal('2') == table.ordinal('2.0')
+  assert table.ordinal('1.0a1') < table.ordinal('1.0') < table.ordinal('1.9') \
+      < table.ordinal('1.10') < table.ordinal('2') < table.ordinal('2.0.post1')
+
+  assert depdata.parse_version('1.9') is depdata.parse_version('1.9')
+
+  expected = ['1.0a1', '1.0', '1.9', '1.10', '2', '2.0', '2.0.post1']
+
+  old_table = depdata.version_table
+  try:
+    depdata.version_table = None
+    assert expected == depdata.sorted_versions(versions)
+    assert depdata.versions_are_equal('2', '2.0')
+
+    depdata.version_table = table
+    assert expected == depdata.sorted_versions(versions)
+    assert expected[::-1] == depdata.sorted_versions(versions, reverse=True)
+    assert depdata.versions_are_equal('2', '2.0')
+    assert not depdata.versions_are_equal('2', '2.0.post1')
+
+    # Versions not in the table are parsed as before.
+    assert ['0.5', '1.0', '3'] == depdata.sorted_versions(['3', '1.0', '0.5'])
+    assert depdata.versions_are_equal('3', '3.0')
+  finally:
+    depdata.version_table = old_table
+
+  print("test_version_table(): All tests OK.")
+
+
+
+
+
+def test_distkey():
+  """
+  Interned distkeys with their package name and version split out.
+  """
+  distkey = depdata.Distkey('django(1.8.3)')
+  assert distkey is depdata.Distkey('django(1.8.3)')
+  assert distkey is depdata.distkey_format('Django', '1.8.3')
+  assert 'django' == distkey.packname and '1.8.3' == distkey.version
+  assert distkey.ordinal is None or isinstance(distkey.ordinal, int)
+
+  # Interchangeable with plain strings.
+  assert 'django(1.8.3)' == distkey and {'django(1.8.3)': 1}[distkey] == 1
+  assert '["django(1.8.3)"]' == json.dumps([distkey])
+  assert pickle.loads(pickle.dumps(distkey)) is distkey
+
+  assert ('foo', '1.0(2)') == depdata.get_pack_and_version('Foo(1.0(2))')
+  assert 'foo' == depdata.get_packname('foo(1)')
+  assert '1' == depdata.get_version('foo(1)')
+
+  # Only distkeys still in use stay interned.
+  assert 'django(1.8.3)' in depdata._DISTKEYS
+  assert depdata.is_valid_distkey('transient(1)')
+  assert 'transient' == depdata.get_packname('transient(2)')
+  transient = depdata.Distkey('transient(3)')
+  del transient
+  gc.collect()
+  for i in [1, 2, 3]:
+    assert 'transient(' + str(i) + ')' not in depdata._DISTKEYS
+
+  try:
+    depdata.get_packname(None)
+  except TypeError:
+    pass
+  else:
+    assert False, "get_packname should raise TypeError for a non-string."
+
+  old_table = depdata.version_table
+  try:
+    depdata.version_table = depdata.VersionTable(['1.8', '1.8.3', '1.9'])
+    assert 1 == distkey.ordinal
+  finally:
+    depdata.version_table = old_table
+
+  print("test_distkey(): All tests OK.")
+
+
+
+
+
+def test_elaborate_dependencies_incremental():
+  """
+  Incremental elaboration should give what a full elaboration would, and
+  report exactly which dists' elaborations changed.
+  """
+  old_deps = testdata.DEPS_MODERATE
+  old_vbp = depdata.generate_dict_versions_by_package(old_deps)
+  old_edeps = depdata.elaborate_dependencies(old_deps, old_vbp)[0]
+
+  changed_deps = {
+      'six(1.11.0)': [],
+      'newpkg(1)': [['six', '>=1.10'], ['unknownpkg', '']],
+  }
+  new_deps = dict(old_deps)
+  new_deps.update(changed_deps)
+  del new_deps['humanfriendly(1.5)']
+  new_vbp = depdata.generate_dict_versions_by_package(new_deps)
+
+  for range_encode in [False, True]:
+    (edeps, missing_packages, missing_dists, changed) = \
+        depdata.elaborate_dependencies_incremental(old_edeps, old_vbp, new_vbp,
+        changed_deps, range_encode=range_encode)
+
+    (expected_edeps, expected_missing_packages, expected_missing_dists) = \
+        depdata.elaborate_dependencies(new_deps, new_vbp)
+
+    assert sorted(expected_edeps) == sorted(edeps)
+    for distkey in expected_edeps:
+      assert depdata._elaborations_are_equal(expected_edeps[distkey],
+          edeps[distkey]), 'Mismatch for ' + distkey
+    assert expected_missing_packages == missing_packages == \
+        set(['unknownpkg', 'pip'])
+    assert expected_missing_dists == missing_dists == \
+        set(['newpkg(1)', 'pip-accel(0.9.10)'])
+
+    # six gained a version, so autosubmit's dependency on it changed, but
+    # coloredlogs' dependencies on humanfriendly never included 1.5.
+    assert set(['six(1.11.0)', 'newpkg(1)', 'humanfriendly(1.5)',
+        'autosubmit(3.0.4)']) == changed, str(changed)
+
+  # No changes, no changed distkeys.
+  assert not depdata.elaborate_dependencies_incremental(old_edeps, old_vbp,
+      old_vbp, {})[3]
+
+  print("test_elaborate_dependencies_incremental(): All tests OK.")
+
+
+
+
+
+def test_elaborate_dependencies_in_parallel():
+  """
+  Elaboration across worker processes should match serial elaboration.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+
+  serial = depdata.elaborate_dependencies(deps, versions_by_package)
+  parallel = depdata.elaborate_dependencies(deps, versions_by_package,
+      workers=3)
+
+  assert serial == parallel
+  assert list(serial[0]) == list(parallel[0])
+
+  ranged = depdata.elaborate_dependencies(deps, versions_by_package,
+      range_encode=True, workers=2)[0]
+  assert list(serial[0]) == list(ranged)
+  for distkey in serial[0]:
+    assert depdata._elaborations_are_equal(serial[0][distkey], ranged[distkey])
+
+  # VersionRanges on the same package share the same sorted versions.
+  shared = dict()
+  for distkey in ranged:
+    for edep in ranged[distkey]:
+      if isinstance(edep[1], depdata.VersionRanges):
+        assert shared.setdefault(edep[0], edep[1].package_versions) is \
+            edep[1].package_versions
+
+  print("test_elaborate_dependencies_in_parallel(): All tests OK.")
+
+
+
+
+
+def test_elaboration_cache():
+  """
+  Identical dependencies are elaborated once and share their result.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  deps['y(1)'] = [['six', ''], ['a', '==3']]
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+
+  cache = depdata.ElaborationCache()
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package,
+      cache=cache)[0]
+  uncached = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+
+  assert edeps == uncached
+  assert edeps['y(1)'][0][1] is edeps['autosubmit(3.0.4)'][0][1]
+  assert edeps['y(1)'][1][1] is edeps['c(1)'][0][1]
+  assert 2 == cache.hits
+  assert len(cache) == cache.misses - 1 # The dependency on unknown pip.
+  assert 0 < cache.hit_rate() < 1
+
+  # Cached results are per allow_prerelease.
+  entries = len(cache)
+  depdata.elaborate_dependencies(deps, versions_by_package,
+      allow_prerelease=True, cache=cache)
+  assert 2 * entries == len(cache) and 4 == cache.hits
+
+  cache.invalidate_packages(['six'])
+  assert not [key for key in cache.results if key[0] == 'six']
+
+  # Shared again after elaborating in several processes.
+  parallel = depdata.elaborate_dependencies(deps, versions_by_package,
+      workers=2)[0]
+  assert edeps == parallel
+  assert parallel['y(1)'][0][1] is parallel['autosubmit(3.0.4)'][0][1]
+
+  print("test_elaboration_cache(): All tests OK.")
+
+
+
+
+
+def test_background_loading():
+  """
+  ensure_data_loaded(background=True) loads each global independently, and
+  await_data waits for just the one asked for. Failed loads are retried.
+  """
+  names = ['dependencies_by_dist', 'versions_by_package', 'version_table',
+      'pip_solutions_by_dist', 'conflicts_1_db', 'conflicts_2_db',
+      'conflicts_3_db', 'blacklist', 'elaborated_dependencies']
+  view_names = ['elaborated_alpha', 'elaborated_reverse']
+  fname_names = ['DEPENDENCIES_DB_FNAME', 'PIP_SOLUTIONS_DB_FNAME',
+      'DEPENDENCY_CONFLICTS1_DB_FNAME', 'DEPENDENCY_CONFLICTS2_DB_FNAME',
+      'DEPENDENCY_CONFLICTS3_DB_FNAME', 'BLACKLIST_DB_FNAME',
+      'ELABORATED_DEPS_FNAME', 'ELABORATED_DEPS_COMPACT_FNAME']
+  saved = dict((name, getattr(depdata, name)) for name in
+      names + view_names + fname_names)
+  saved_load_json_db = depdata.load_json_db
+  saved_load_journaled_db = depdata.load_journaled_db
+
+  deps = testdata.DEPS_MODERATE
+  edeps = depdata.elaborate_dependencies(deps,
+      depdata.generate_dict_versions_by_package(deps))[0]
+
+  try:
+    for name in names + view_names:
+      setattr(depdata, name, None)
+    for fname_name in fname_names:
+      setattr(depdata, fname_name, os.path.join('data',
+          'test_background_' + fname_name.lower() + '.json'))
+    json.dump(deps, open(depdata.DEPENDENCIES_DB_FNAME, 'w'))
+    json.dump(edeps, open(depdata.ELABORATED_DEPS_FNAME, 'w'))
+    json.dump({'x(1)': True}, open(depdata.DEPENDENCY_CONFLICTS3_DB_FNAME, 'w'))
+
+    futures = depdata.ensure_data_loaded(include_edeps=True, background=True)
+    assert set(names) == set(futures)
+    # The three dependency globals are set by one load.
+    assert futures['dependencies_by_dist'] is futures['version_table']
+
+    loaded_edeps = depdata.await_data('elaborated_dependencies')
+    assert sorted(edeps) == sorted(loaded_edeps)
+    assert {'x(1)': True} == depdata.await_data('conflicts_3_db')
+
+    # Once everything is loaded, there is nothing more to load.
+    depdata.await_data()
+    assert {} == depdata.ensure_data_loaded(include_edeps=True,
+        background=True)
+
+    # Loading in the foreground waits for the background loads.
+    depdata.ensure_data_loaded(include_edeps=True)
+    assert deps == depdata.dependencies_by_dist
+    assert '1.9.0' in depdata.version_table
+    assert {} == depdata.blacklist
+
+    # A foreground load while background loads are under way waits for them
+    # and loads nothing they load again, leaving their globals in place.
+    for name in names:
+      setattr(depdata, name, None)
+    depdata._data_loading.clear()
+
+    # Every db, journaled or not, is read with load_json_db.
+    n_loads = dict()
+    def _counting_load_json_db(fname, *args, **kwargs):
+      n_loads[fname] = n_loads.get(fname, 0) + 1
+      return saved_load_json_db(fname, *args, **kwargs)
+    depdata.load_json_db = _counting_load_json_db
+
+    depdata.ensure_data_loaded(include_edeps=True, background=True)
+    loaded_blacklist = depdata.await_data('blacklist')
+    depdata.ensure_data_loaded(include_edeps=True)
+
+    assert loaded_blacklist is depdata.blacklist
+    assert [1] * 7 == list(n_loads.values()), n_loads
+
+    # Sorted views of edeps are set up when asked for, and then there is
+    # nothing left to load.
+    depdata.ensure_data_loaded(include_edeps=True, include_sorts=True)
+    assert isinstance(depdata.elaborated_alpha, depdata.SortedEdepsView)
+    assert isinstance(depdata.elaborated_reverse, depdata.SortedEdepsView)
+    assert sorted(edeps) == sorted(depdata.elaborated_alpha)
+    assert [] == depdata._needed_loads([1, 2, 3], True, True)
+
+    # A failed load raises when awaited, and is started again next time.
+    def _failing_load_journaled_db(fname, *args, **kwargs):
+      raise IOError('Could not read ' + fname)
+    depdata.load_journaled_db = _failing_load_journaled_db
+    depdata.blacklist = None
+    assert ['blacklist'] == list(depdata.ensure_data_loaded(
+        include_edeps=True, background=True))
+    try:
+      depdata.await_data('blacklist')
+    except IOError:
+      pass
+    else:
+      assert False, 'Expected the failed load to raise.'
+
+    depdata.load_journaled_db = saved_load_journaled_db
+    assert ['blacklist'] == list(depdata.ensure_data_loaded(
+        include_edeps=True, background=True))
+    assert {} == depdata.await_data('blacklist')
+
+    # So is a global reset after its load finished, awaited or not.
+    depdata.blacklist = None
+    depdata.ensure_data_loaded(background=True)['blacklist'].result()
+    depdata.blacklist = None
+    assert ['blacklist'] == list(depdata.ensure_data_loaded(
+        include_edeps=True, background=True))
+    depdata.await_data()
+    assert {} == depdata.blacklist
+    assert {} == depdata._data_loading
+
+  finally:
+    for name in saved:
+      setattr(depdata, name, saved[name])
+    depdata.load_json_db = saved_load_json_db
+    depdata.load_journaled_db = saved_load_journaled_db
+    depdata._data_loading.clear()
+
+  print("test_background_loading(): All tests OK.")
+
+
+
+
+
+def test_journaled_dict():
+  """
+  JournaledDict checkpoints append only what changed, loading replays the
+  journal over the snapshot, and compaction folds the journal in.
+  """
+  fname = os.path.join('data', 'test_journaled.json')
+  journal_fname = fname + depdata.JournaledDict.JOURNAL_SUFFIX
+  for f in [fname, journal_fname]:
+    if os.path.exists(f):
+      os.remove(f)
+
+  json.dump({'a(1)': [], 'b(1)': [['a', '']]}, open(fname, 'w'))
+
+  db = depdata.load_journaled_db(fname)
+  assert {'a(1)': [], 'b(1)': [['a', '']]} == db
+  assert not db.dirty # read straight in, not set key by key
+  assert 0 == db.checkpoint() # nothing new
+  assert not os.path.exists(journal_fname)
+
+  db['c(1)'] = [['b', '>=1']]
+  db['a(1)'] = [['c', '']]
+  del db['b(1)']
+  db.setdefault('d(1)', [])
+  db.update({'e(1)': []})
+  assert 5 == db.checkpoint()
+  assert 5 == len(open(journal_fname).readlines())
+
+  # Only records for new changes are appended.
+  db['f(1)'] = []
+  assert 1 == db.checkpoint()
+  assert 6 == len(open(journal_fname).readlines())
+
+  # The snapshot hasn't been touched, but loading replays the journal.
+  assert {'a(1)': [], 'b(1)': [['a', '']]} == depdata.load_json_db(fname)
+  assert db == depdata.load_journaled_db(fname)
+
+  # A checkpoint interrupted partway leaves a partial line, which is skipped.
+  db['g(1)'] = []
+  open(journal_fname, 'a').write('["g(1)", [')
+  reloaded = depdata.load_journaled_db(fname)
+  assert 'g(1)' not in reloaded
+  del db['g(1)']
+  assert db == reloaded
+  # ... and the journal has been compacted away.
+  assert not os.path.exists(journal_fname)
+  assert db == depdata.load_json_db(fname)
+
+  db['h(1)'] = []
+  db.checkpoint()
+  db.compact()
+  assert not os.path.exists(journal_fname)
+  assert db == depdata.load_json_db(fname)
+
+  # Replaying a journal already compacted into the snapshot changes nothing.
+  db['a(1)'] = []
+  db.checkpoint()
+  journal = open(journal_fname).read()
+  db.compact()
+  open(journal_fname, 'w').write(journal)
+  assert db == depdata.load_journaled_db(fname)
+
+  os.remove(journal_fname)
+
+  # A snapshot cut off partway loads as empty, as with load_json_db, without
+  # keeping what was read before the cut.
+  open(fname, 'w').write('{"a(1)": [], "b(1)": [["a", ""]')
+  assert {} == depdata.load_journaled_db(fname, error_mode='empty')
+  into = dict()
+  assert into is depdata.load_json_db(fname, error_mode='empty', into=into)
+  assert {} == into
+
+  os.remove(fname)
+
+  print("test_journaled_dict(): All tests OK.")
+
+
+
+
+
+def test_validate_deps():
+  """
+  validate_deps should report every offending dist, agreeing with the
+  single-item validators, in one process or several.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  deps['Upper(1)'] = []
+  deps['under_score(1)'] = []
+  deps['noversion()'] = []
+  deps['ok(1)'] = [['six', '>=1.4'], ['Six', ''], ['bar', '=>1'], ['baz']]
+  deps['notalist(1)'] = 'six'
+
+  expected = set(['Upper(1)', 'under_score(1)', 'noversion()', 'ok(1)',
+      'notalist(1)'])
+
+  for workers in [None, 2]:
+    report = depdata.validate_deps(deps, workers=workers)
+    assert not report.valid
+    assert expected == set(report.problems), str(report.problems)
+    assert 3 == len(report.problems['ok(1)'])
+    assert len(deps) == report.n_dists
+    assert report.summary().startswith('5 of ' + str(len(deps)))
+
+  for distkey in deps:
+    if distkey == 'notalist(1)':
+      continue
+    assert (distkey in expected) == (not depdata.is_valid_distkey(distkey) or
+        not all(depdata.is_dep_valid(dep) for dep in deps[distkey]))
+
+  assert not depdata.are_deps_valid(deps)
+
+  # Elaborated, thoroughly.
+  edeps = depdata.elaborate_dependencies(testdata.DEPS_MODERATE,
+      depdata.generate_dict_versions_by_package(testdata.DEPS_MODERATE))[0]
+  assert depdata.validate_deps(edeps, is_elaborated=True, thorough=True).valid
+  edeps['x(1)'] = [['b', '1', '']]
+  report = depdata.validate_deps(edeps, is_elaborated=True)
+  assert ['x(1)'] == list(report.problems)
+
+  print("test_validate_deps(): All tests OK.")
+
+
+
+
+
+def test_reverse_dependency_index():
+  """
+  The reverse dependency index should agree with a scan of the data, and
+  survive being written and loaded.
+  """
+  deps = testdata.DEPS_MODERATE
+  edeps = depdata.elaborate_dependencies(deps,
+      depdata.generate_dict_versions_by_package(deps))[0]
+
+  index = depdata.build_reverse_dependency_index(deps)
+  assert 'dists' not in index
+  elaborated_index = depdata.build_reverse_dependency_index(edeps,
+      is_elaborated=True)
+  assert index['packages'] == elaborated_index['packages']
+
+  fname = os.path.join('data', 'test_reverse_dependencies.json')
+  depdata.write_reverse_dependency_index(elaborated_index, fname)
+  loaded = depdata.load_reverse_dependency_index(fname)
+  assert elaborated_index == loaded
+  os.remove(fname)
+
+  # A missing (or empty) index is an error, not an index with no dependers,
+  # unless there are edeps to rebuild it from.
+  for contents in [None, '']:
+    if contents is not None:
+      open(fname, 'w').write(contents)
+    try:
+      depdata.load_reverse_dependency_index(fname)
+    except (IOError, ValueError):
+      pass
+    else:
+      assert False, 'Expected an error loading a missing or empty index.'
+    assert elaborated_index == depdata.load_reverse_dependency_index(fname,
+        edeps, is_elaborated=True)
+    assert elaborated_index == depdata.load_reverse_dependency_index(fname)
+    os.remove(fname)
+
+  packnames = set(dep[0] for distkey in deps for dep in deps[distkey])
+  for packname in packnames | set(['nonexistent']):
+    expected = sorted(distkey for distkey in deps
+        if packname in [dep[0] for dep in deps[distkey]])
+    assert expected == depdata.get_dependers_of_package(packname, loaded)
+
+  for satisfier in list(edeps) + ['nonexistent(1)']:
+    (packname, version) = depdata.get_pack_and_version(satisfier)
+    expected = sorted(distkey for distkey in edeps if [edep for edep in
+        edeps[distkey] if edep[0] == packname and version in edep[1]])
+    assert expected == depdata.get_dependers_of_dist(satisfier, loaded)
+
+  try:
+    depdata.get_dependers_of_dist('six(1.9.0)', index)
+  except ValueError:
+    pass
+  else:
+    assert False, 'Expected ValueError querying dists in an index of deps.'
+
+  print("test_reverse_dependency_index(): All tests OK.")
+
+
+
+
+
+def test_diff_deps():
+  """
+  Diffing two deps files should find exactly what changed, and the change set
+  should drive incremental elaboration to the same result as a full one.
+  """
+  old_deps = testdata.DEPS_MODERATE
+  new_deps = dict(old_deps)
+  new_deps['six(1.11.0)'] = []
+  new_deps['newpkg(1)'] = [['six', '>=1.10']]
+  new_deps['x(1)'] = old_deps['x(1)'] + [['newpkg', '']]
+  del new_deps['humanfriendly(1.5)']
+
+  old_fname = os.path.join('data', 'test_diff_old.json')
+  new_fname = os.path.join('data', 'test_diff_new.json')
+  json.dump(old_deps, open(old_fname, 'w'))
+  json.dump(new_deps, open(new_fname, 'w'))
+
+  change_set = depdata.diff_deps_files(old_fname, new_fname)
+  assert depdata.diff_deps(old_deps, new_deps).to_json() == \
+      change_set.to_json()
+
+  assert set(['six(1.11.0)', 'newpkg(1)']) == change_set.added
+  assert set(['humanfriendly(1.5)']) == change_set.removed
+  assert set(['x(1)']) == change_set.changed
+  assert sorted(change_set.changed_deps) == \
+      ['newpkg(1)', 'six(1.11.0)', 'x(1)']
+  assert {'six': ['1.11.0'], 'newpkg': ['1']} == change_set.versions_added
+  assert {'humanfriendly': ['1.5']} == change_set.versions_removed
+  assert set(['six', 'newpkg', 'humanfriendly']) == \
+      change_set.changed_packages
+
+  # Round trip, as for passing the change set on to a refresh job.
+  assert change_set.to_json() == depdata.DepsChangeSet.from_json(
+      json.loads(json.dumps(change_set.to_json()))).to_json()
+
+  old_vbp = depdata.generate_dict_versions_by_package(old_deps)
+  new_vbp = change_set.apply_to_versions_by_package(old_vbp)
+  expected_vbp = depdata.generate_dict_versions_by_package(new_deps)
+  assert sorted(expected_vbp) == sorted(new_vbp)
+  for packname in expected_vbp:
+    assert sorted(expected_vbp[packname]) == sorted(new_vbp[packname])
+
+  old_edeps = depdata.elaborate_dependencies(old_deps, old_vbp)[0]
+  edeps = depdata.elaborate_dependencies_incremental(old_edeps, old_vbp,
+      new_vbp, change_set.changed_deps)[0]
+  expected_edeps = depdata.elaborate_dependencies(new_deps, expected_vbp)[0]
+  assert sorted(expected_edeps) == sorted(edeps)
+  for distkey in expected_edeps:
+    assert depdata._elaborations_are_equal(expected_edeps[distkey],
+        edeps[distkey]), 'Mismatch for ' + distkey
+
+  # Nothing changed, nothing to do.
+  assert not depdata.diff_deps_files(old_fname, old_fname)
+
+  os.remove(old_fname)
+  os.remove(new_fname)
+
+  print("test_diff_deps(): All tests OK.")
+
+
+
+
+
+def test_fingerprints():
+  """
+  Closure fingerprints should change for exactly the dists whose closures
+  change, and entry and dataset fingerprints whenever their entries do.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  # A cycle: p(1) -> q -> p
+  deps['p(1)'] = [['q', '']]
+  deps['q(1)'] = [['p', '>=1']]
+  deps['r(1)'] = [['p', '']]
+
+  assert depdata.fingerprint_entry([['a', '']]) == \
+      depdata.fingerprint_entry([('a', '')])
+  assert depdata.fingerprint_entry([['a', '']]) != \
+      depdata.fingerprint_entry([['a', '>1']])
+
+  for is_elaborated in [False, True]:
+    if is_elaborated:
+      def get_data(deps):
+        return depdata.elaborate_dependencies(deps,
+            depdata.generate_dict_versions_by_package(deps))[0]
+    else:
+      get_data = dict
+
+    data = get_data(deps)
+    fingerprints = depdata.fingerprint_closures(data, is_elaborated)
+    assert sorted(data) == sorted(fingerprints)
+    assert fingerprints == depdata.fingerprint_closures(data, is_elaborated)
+
+    # Members of a cycle share their closure.
+    assert fingerprints['p(1)'] == fingerprints['q(1)'] != fingerprints['r(1)']
+
+    # A new version of six changes the closures of six's dependers, and of
+    # their dependers, but nothing else.
+    changed_deps = dict(deps)
+    changed_deps['six(1.11.0)'] = []
+    changed_data = get_data(changed_deps)
+    changed_fingerprints = depdata.fingerprint_closures(changed_data,
+        is_elaborated)
+    changed = set(distkey for distkey in fingerprints
+        if fingerprints[distkey] != changed_fingerprints[distkey])
+    assert set(['autosubmit(3.0.4)']) == changed, str(changed)
+
+    # A change inside the cycle changes the whole cycle and its dependers.
+    changed_deps = dict(deps)
+    changed_deps['q(1)'] = [['p', '>=1'], ['six', '']]
+    changed_fingerprints = depdata.fingerprint_closures(
+        get_data(changed_deps), is_elaborated)
+    changed = set(distkey for distkey in fingerprints
+        if fingerprints[distkey] != changed_fingerprints[distkey])
+    assert set(['p(1)', 'q(1)', 'r(1)']) == changed, str(changed)
+
+    assert depdata.fingerprint_dataset(data) == \
+        depdata.fingerprint_dataset(dict(reversed(list(data.items()))))
+    assert depdata.fingerprint_dataset(data) != \
+        depdata.fingerprint_dataset(changed_data)
+
+  print("test_fingerprints(): All tests OK.")
+
+
+
+
+
+def test_ingest_raw_deps():
+  """
+  Ingesting raw data should normalize names, versions, and old-style
+  specifiers in one pass, giving deps and versions_by_package as the separate
+  passes would.
+  """
+  raw = {
+      'Foo_Bar(1.0RC1)': [['Six', [['>=', '1.4'], ['!=', '1.5']]],
+          ['requests', '>=2.0']],
+      'foo-bar(2)': [['six', []]],
+      'six(1.9.0)': [],
+  }
+
+  fname = os.path.join('data', 'test_raw_deps.json')
+  json.dump(raw, open(fname, 'w'))
+
+  for (deps, versions_by_package) in [
+      depdata.ingest_raw_deps(sorted(raw.items())),
+      depdata.ingest_raw_deps_file(fname)]:
+    assert {
+        'foo-bar(1.0rc1)': [['six', '>=1.4,!=1.5'], ['requests', '>=2.0']],
+        'foo-bar(2)': [['six', '']],
+        'six(1.9.0)': [],
+    } == deps
+    assert depdata.are_deps_valid(deps)
+    assert sorted(['1.0rc1', '2']) == sorted(versions_by_package['foo-bar'])
+    assert depdata.generate_dict_versions_by_package(deps).keys() == \
+        versions_by_package.keys()
+
+  os.remove(fname)
+
+  # Pip's normalization of versions, on request; duplicates are merged.
+  (deps, versions_by_package) = depdata.ingest_raw_deps(
+      [('foo(1.0RC1)', []), ('foo(1.0.rc.1)', [['six', '']])],
+      normalize_versions=True)
+  assert {'foo(1.0rc1)': [['six', '']]} == deps
+  assert {'foo': ['1.0rc1']} == versions_by_package
+
+  print("test_ingest_raw_deps(): All tests OK.")
+
+
 
 
 
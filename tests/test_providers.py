@@ -0,0 +1,276 @@
+"""
+<Program>
+  test_providers.py
+
+<Purpose>
+  Some unit tests for depresolve.providers, the sources of dependency
+  information for dists missing from our dependency data.
+
+"""
+
+import json
+import os
+import shutil
+import zipfile
+
+import depresolve # __init__ for errors
+import depresolve.depdata as depdata
+import depresolve.providers as providers
+import depresolve.resolver.resolvability as ry
+
+WHEEL_DIR = os.path.join('data', 'test_wheels')
+
+WHEELS = {
+    'pkg_a-1.0-py2.py3-none-any.whl': ['pkg-b (>=1.0)',
+        'pkg-c ; extra == "tests"', 'pkg-d ; python_version < "2"'],
+    'pkg_b-1.0-py2.py3-none-any.whl': [],
+    'pkg_b-2.0-py2.py3-none-any.whl': ['pkg-c (<2,>=1)'],
+    'pkg_c-1.5-py2.py3-none-any.whl': [],
+    'pkg_c-2.0-py2.py3-none-any.whl': [],
+}
+
+
+
+
+def main():
+  test_provider_interface()
+  test_requires_dist_to_deps()
+  test_wheel_metadata_provider()
+  test_local_index_provider()
+  test_caching_provider()
+  test_resolve_with_provider()
+  print("All tests in main() OK.")
+
+
+
+
+
+def _write_wheels():
+  if os.path.exists(WHEEL_DIR):
+    shutil.rmtree(WHEEL_DIR)
+  os.makedirs(WHEEL_DIR)
+
+  for fname in WHEELS:
+    (name, version) = fname.split('-')[:2]
+    metadata = 'Metadata-Version: 2.0\nName: ' + name + '\nVersion: ' + \
+        version + '\n'
+    for requirement in WHEELS[fname]:
+      metadata += 'Requires-Dist: ' + requirement + '\n'
+
+    wheel = zipfile.ZipFile(os.path.join(WHEEL_DIR, fname), 'w')
+    wheel.writestr(name + '-' + version + '.dist-info/METADATA', metadata)
+    wheel.close()
+
+
+
+
+
+class CountingProvider(providers.DependencyProvider):
+  """Wraps a provider, counting the dists it is asked for."""
+
+  def __init__(self, provider):
+    self.provider = provider
+    self.requested = []
+
+  def get_dependencies(self, distkey):
+    self.requested.append(distkey)
+    return self.provider.get_dependencies(distkey)
+
+  def get_dependencies_batch(self, distkeys):
+    self.requested.extend(distkeys)
+    return self.provider.get_dependencies_batch(distkeys)
+
+  def get_versions(self, packname):
+    return self.provider.get_versions(packname)
+
+
+
+
+
+def test_provider_interface():
+  """Providers must implement both get_dependencies and get_versions."""
+  class VersionsOnlyProvider(providers.DependencyProvider):
+    def get_versions(self, packname):
+      return []
+
+  for provider_class in [providers.DependencyProvider, VersionsOnlyProvider]:
+    try:
+      provider_class()
+    except TypeError:
+      pass
+    else:
+      assert False, 'Expected TypeError instantiating ' + \
+          provider_class.__name__
+
+  print("test_provider_interface(): All tests OK.")
+
+
+
+
+
+def test_requires_dist_to_deps():
+  assert [['requests', '>=2.0'], ['six', '']] == \
+      providers.requires_dist_to_deps(['requests (>=2.0)', 'Six',
+      'pytest ; extra == "test"', 'foo ; python_version < "1"'])
+
+  print("test_requires_dist_to_deps(): All tests OK.")
+
+
+
+
+
+def test_wheel_metadata_provider():
+  _write_wheels()
+  provider = providers.WheelMetadataProvider(WHEEL_DIR)
+
+  assert ['1.0', '2.0'] == provider.get_versions('pkg-b')
+  assert [] == provider.get_versions('pkg-z')
+  assert [['pkg-b', '>=1.0']] == provider.get_dependencies('pkg-a(1.0)')
+  assert [['pkg-c', '<2,>=1']] == provider.get_dependencies('pkg-b(2.0)')
+
+  try:
+    provider.get_dependencies('pkg-a(9)')
+  except depresolve.MissingDependencyInfoError:
+    pass
+  else:
+    assert False, 'Expected MissingDependencyInfoError for a missing wheel.'
+
+  assert ['pkg-b(1.0)'] == list(provider.get_dependencies_batch(
+      ['pkg-b(1.0)', 'pkg-a(9)']))
+
+  print("test_wheel_metadata_provider(): All tests OK.")
+
+
+
+
+
+def test_local_index_provider():
+  fname = os.path.join('data', 'test_local_index.json')
+  json.dump({'a(1)': [['b', '>=1']], 'b(1)': []}, open(fname, 'w'))
+
+  provider = providers.LocalIndexProvider(fname)
+  assert [['b', '>=1']] == provider.get_dependencies('a(1)')
+  assert ['1'] == provider.get_versions('b')
+
+  # A missing or unparseable index is an error, not an empty index, and is
+  # left as it was.
+  os.remove(fname)
+  try:
+    providers.LocalIndexProvider(fname)
+  except IOError:
+    pass
+  else:
+    assert False, 'Expected IOError for a missing index.'
+  assert not os.path.exists(fname)
+
+  with open(fname, 'w') as fobj:
+    fobj.write('{"a(1)": [')
+  try:
+    providers.LocalIndexProvider(fname)
+  except ValueError:
+    pass
+  else:
+    assert False, 'Expected ValueError for an unparseable index.'
+
+  print("test_local_index_provider(): All tests OK.")
+
+
+
+
+
+def test_caching_provider():
+  _write_wheels()
+  cache_fname = os.path.join('data', 'test_provider_cache.json')
+  if os.path.exists(cache_fname):
+    os.remove(cache_fname)
+
+  # The cache file is created when there is something to write, not before.
+  counting = CountingProvider(providers.WheelMetadataProvider(WHEEL_DIR))
+  with providers.CachingProvider(counting, cache_fname) as provider:
+    assert not os.path.exists(cache_fname)
+    assert [['pkg-b', '>=1.0']] == provider.get_dependencies('pkg-a(1.0)')
+    provider.get_dependencies_batch(['pkg-a(1.0)', 'pkg-b(1.0)', 'pkg-q(1)'])
+    assert ['pkg-a(1.0)', 'pkg-b(1.0)', 'pkg-q(1)'] == counting.requested
+    assert ['1.5', '2.0'] == provider.get_versions('pkg-c')
+
+  # A later run is answered from the cache file.
+  counting = CountingProvider(providers.WheelMetadataProvider(WHEEL_DIR))
+  provider = providers.CachingProvider(counting, cache_fname)
+  assert [['pkg-b', '>=1.0']] == provider.get_dependencies('pkg-a(1.0)')
+  assert [] == provider.get_dependencies('pkg-b(1.0)')
+  assert ['1.5', '2.0'] == provider.get_versions('pkg-c')
+  assert not counting.requested
+
+  with open(cache_fname) as fobj:
+    assert 'pkg-b(1.0)' in json.load(fobj)['dependencies']
+  assert not os.path.exists(cache_fname + '.tmp')
+
+  # Cached versions are kept until forgotten, then asked for again.
+  provider.versions['pkg-c'] = ['1.5']
+  assert ['1.5'] == provider.get_versions('pkg-c')
+  provider.forget_versions(['pkg-c'])
+  assert ['1.5', '2.0'] == provider.get_versions('pkg-c')
+
+  # An unparseable cache is an error, rather than silently dropped.
+  with open(cache_fname, 'w') as fobj:
+    fobj.write('{"dependencies": {')
+  try:
+    providers.CachingProvider(counting, cache_fname)
+  except ValueError:
+    pass
+  else:
+    assert False, 'Expected ValueError for an unparseable cache.'
+  os.remove(cache_fname)
+
+  print("test_caching_provider(): All tests OK.")
+
+
+
+
+
+def test_resolve_with_provider():
+  """
+  Resolve a dist whose dependencies are all missing from our data, using a
+  provider to fill them in as the resolver goes.
+  """
+  _write_wheels()
+  deps = {'x(1)': [['pkg-a', '']]}
+
+  try:
+    ry.backtracking_satisfy('x(1)', depdata.LazyEdeps(deps))
+  except depresolve.MissingDependencyInfoError:
+    pass
+  else:
+    assert False, 'Expected MissingDependencyInfoError without a provider.'
+
+  # Membership asks the provider just as lookups do, and only once per dist.
+  counting = CountingProvider(providers.WheelMetadataProvider(WHEEL_DIR))
+  edeps = depdata.LazyEdeps(deps, provider=counting)
+  assert 'pkg-a(1.0)' in edeps
+  assert 'pkg-b' == edeps['pkg-a(1.0)'][0][0]
+  assert 'pkg-a(9)' not in edeps and 'pkg-a(9)' not in edeps
+  assert 1 == counting.requested.count('pkg-a(9)')
+
+  counting = CountingProvider(providers.WheelMetadataProvider(WHEEL_DIR))
+  edeps = depdata.LazyEdeps(deps, provider=counting)
+  solution = ry.backtracking_satisfy('x(1)', edeps)
+
+  assert ry.dist_lists_are_equal(solution,
+      ['x(1)', 'pkg-a(1.0)', 'pkg-b(2.0)', 'pkg-c(1.5)']), str(solution)
+
+  # The other version of pkg-b came in the same batch as the one chosen, and
+  # nothing was asked for twice.
+  assert 'pkg-b(1.0)' in edeps
+  assert len(set(counting.requested)) == len(counting.requested)
+
+  # The caller's deps are left alone.
+  assert ['x(1)'] == list(deps)
+
+  print("test_resolve_with_provider(): All tests OK.")
+
+
+
+
+
+if __name__ == '__main__':
+  main()
@@ -53,6 +53,15 @@ def main():
   # Test the detection of model 2 conflicts from deps.
   successes.append(test_detect_model_2_conflicts()) #3
 
+  # Test resolution against a memory-mapped compact edeps store.
+  successes.append(test_resolver_on_mapped_edeps())
+
+  successes.append(test_resolver_on_range_encoded_edeps())
+
+  successes.append(test_resolver_on_lazy_edeps())
+
+  successes.append(test_sorted_edeps_views())
+
 
   # Test the backtracking resolver on basic samples.
   # We expected the current version of backtracking_satisfy to fail on the 2nd
@@ -375,6 +384,142 @@ def test_detect_model_2_conflicts():
 
 
 
+def test_resolver_on_mapped_edeps():
+  """
+  The backtracking resolver should work unchanged on a MappedEdeps.
+  """
+  deps = testdata.DEPS_SIMPLE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+  depdata.write_edeps_compact(edeps, 'data/test_edeps_simple.bin')
+
+  mapped = depdata.MappedEdeps('data/test_edeps_simple.bin')
+  solution = ry.backtracking_satisfy('x(1)', mapped)
+  mapped.close()
+
+  assert ry.dist_lists_are_equal(solution, testdata.DEPS_SIMPLE_SOLUTION), \
+      'Unexpected solution from MappedEdeps: ' + str(solution)
+
+  logger.info('test_resolver_on_mapped_edeps(): Test passed. (:')
+  return True
+
+
+
+
+
+def test_resolver_on_range_encoded_edeps():
+  """
+  The backtracking resolver should give the same solutions on range-encoded
+  edeps as on ordinary ones.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+  r_edeps = depdata.elaborate_dependencies(deps, versions_by_package,
+      range_encode=True)[0]
+
+  for distkey in ['x(1)', 'autosubmit(3.0.4)', 'coloredlogs(5.0)']:
+    solution = ry.backtracking_satisfy(distkey, edeps)
+    r_solution = ry.backtracking_satisfy(distkey, r_edeps)
+
+    assert ry.dist_lists_are_equal(solution, r_solution), \
+        'Unexpected solution from range-encoded edeps: ' + str(r_solution) + \
+        '; expected: ' + str(solution)
+
+  assert ry.dist_lists_are_equal(testdata.DEPS_SIMPLE_SOLUTION,
+      ry.backtracking_satisfy('x(1)', r_edeps))
+
+  logger.info('test_resolver_on_range_encoded_edeps(): Test passed. (:')
+  return True
+
+
+
+
+
+def test_resolver_on_lazy_edeps():
+  """
+  The resolvers should work unchanged on edeps elaborated on demand, and
+  only elaborate what they touch.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+
+  lazy = depdata.LazyEdeps(deps, versions_by_package)
+  assert not lazy._elaborated
+
+  solution = ry.backtracking_satisfy('x(1)', lazy, versions_by_package)
+  assert ry.dist_lists_are_equal(solution, testdata.DEPS_SIMPLE_SOLUTION)
+  assert sorted(lazy._elaborated) == sorted(testdata.DEPS_SIMPLE_SOLUTION), \
+      'Expected only the dists resolved to be elaborated, but got: ' + \
+      str(list(lazy._elaborated))
+
+  assert ry.naive_satisfy('autosubmit(3.0.4)', lazy, versions_by_package) == \
+      ry.naive_satisfy('autosubmit(3.0.4)', edeps, versions_by_package)
+
+  assert ry.are_fully_satisfied(solution, lazy, versions_by_package,
+      report_issue=True)[0]
+
+  # With a small cache, older elaborations are dropped and redone as needed.
+  small = depdata.LazyEdeps(deps, versions_by_package, max_cached=2)
+  solution = ry.backtracking_satisfy('x(1)', small, versions_by_package)
+  assert ry.dist_lists_are_equal(solution, testdata.DEPS_SIMPLE_SOLUTION)
+  assert 2 == len(small._elaborated)
+
+  for distkey in deps:
+    assert edeps[distkey] == small[distkey]
+  assert len(deps) == len(small) and 'x(1)' in small and 'x(2)' not in small
+
+  logger.info('test_resolver_on_lazy_edeps(): Test passed. (:')
+  return True
+
+
+
+
+
+def test_sorted_edeps_views():
+  """
+  Sorted views of edeps should list each dist's dependencies as sorting them
+  would, and serve backtracking_satisfy_alpha.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+
+  alpha = depdata.SortedEdepsView(edeps)
+  reverse = alpha.reversed()
+  assert reverse.orderings is alpha.orderings
+
+  for distkey in edeps:
+    assert sorted(edeps[distkey]) == alpha[distkey]
+    assert sorted(edeps[distkey], reverse=True) == reverse[distkey]
+  assert len(edeps) == len(alpha) == len(reverse)
+  assert sorted(edeps) == sorted(reverse) and 'x(1)' in reverse
+
+  # Dependencies on the same package with the same specifier are ordered by
+  # their satisfying versions, as sorting the edeps orders them.
+  tied = {'t(1)': [['b', ['2'], ''], ['a', ['1'], ''], ['b', ['1'], '']]}
+  assert [['a', ['1'], ''], ['b', ['1'], ''], ['b', ['2'], '']] == \
+      depdata.SortedEdepsView(tied)['t(1)']
+  assert [['b', ['2'], ''], ['b', ['1'], ''], ['a', ['1'], '']] == \
+      depdata.SortedEdepsView(tied, reverse=True)['t(1)']
+
+  # The views share entries with edeps rather than copying them.
+  assert alpha['x(1)'][0] in edeps['x(1)']
+  assert [id(e) for e in alpha['x(1)']] == \
+      [id(e) for e in reversed(reverse['x(1)'])]
+
+  solution = ry.backtracking_satisfy_alpha('x(1)', edeps,
+      versions_by_package=versions_by_package)
+  assert ry.dist_lists_are_equal(solution, testdata.DEPS_SIMPLE_SOLUTION)
+
+  logger.info('test_sorted_edeps_views(): Test passed. (:')
+  return True
+
+
+
+
+
 def test_sort_versions():
   """
   Make sure the version sort used by the resolver is working.
@@ -11,13 +11,45 @@ import depresolve
 import depresolve.depdata as depdata
 import testdata
 import depresolve.sql_i as sqli
+import depresolve.resolver.resolvability as ry
+
+TEST_DB_FNAME = 'data/test_dependencies.db'
 
 
 
 def main():
+  test_populate_sql_with_full_dependency_info()
+  test_populate_sql_with_dependency_specifiers()
+  test_bulk_load_mode()
+  test_load_deps_from_sql()
+  test_sqlite_edeps()
+  test_normalized_schema()
+  test_normalized_schema_batching()
+  test_normalized_schema_duplicates()
+  test_reverse_queries()
 
+  print('All tests in main() OK.')
 
-  deps = testdata.DEPS_MODERATE
+
+
+
+
+def _reset_test_db():
+  """Clear any pre-existing test database."""
+  sqli.initialize(db_fname=TEST_DB_FNAME)
+  sqli.delete_all_tables()
+
+
+
+
+
+def test_populate_sql_with_full_dependency_info():
+  """
+  Every dependency, satisfying dist, and dist without dependencies should
+  land in its table.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  deps['newpkg(1)'] = [['six', '>=1.10'], ['unknownpkg', '']]
   versions_by_package = depdata.generate_dict_versions_by_package(deps)
 
   (edeps, packs_wout_avail_version_info, dists_w_missing_dependencies) = \
@@ -27,17 +59,427 @@ def main():
       depdata.are_deps_valid(testdata.DEPS_SIMPLE), \
       'The test dependencies are coming up as invalid for some reason....'
 
+  _reset_test_db()
+
+  # Small batches, to exercise batching.
+  saved_batch_size = sqli.BULK_LOAD_BATCH_SIZE
+  sqli.BULK_LOAD_BATCH_SIZE = 7
+  try:
+    sqli.populate_sql_with_full_dependency_info(
+        edeps, versions_by_package, packs_wout_avail_version_info, 
+        dists_w_missing_dependencies, db_fname=TEST_DB_FNAME)
+  finally:
+    sqli.BULK_LOAD_BATCH_SIZE = saved_batch_size
+
+  cursor = sqli.SQL_CURSOR
+
+  expected_specifiers = sorted((distkey, edep[0], edep[2])
+      for distkey in edeps for edep in edeps[distkey])
+  assert expected_specifiers == sorted(cursor.execute(
+      'SELECT * FROM ' + sqli.SQL_DEP_SPECIFIER_TABLE).fetchall())
+
+  expected_satisfiers = sorted((distkey, edep[0],
+      depdata.distkey_format(edep[0], version))
+      for distkey in edeps for edep in edeps[distkey]
+      if edep[1] != depdata.PACKAGE_VERSIONS_UNKNOWN for version in edep[1])
+  assert expected_satisfiers == sorted(cursor.execute(
+      'SELECT * FROM ' + sqli.SQL_DEPENDENCY_TABLE).fetchall())
+
+  assert sorted((distkey,) for distkey in edeps if not edeps[distkey]) == \
+      sorted(cursor.execute(
+      'SELECT * FROM ' + sqli.SQL_NO_DEPS_TABLE).fetchall())
+
+  assert sorted((p,) for p in packs_wout_avail_version_info) == sorted(
+      cursor.execute('SELECT * FROM ' + sqli.SQL_NO_VERS_INFO_TABLE).fetchall())
+
+  missing = cursor.execute(
+      'SELECT * FROM ' + sqli.SQL_MISSING_DEPS_TABLE).fetchall()
+  assert ('newpkg(1)', 'unknownpkg') in missing
+  assert dists_w_missing_dependencies == set(row[0] for row in missing)
+
+  print('test_populate_sql_with_full_dependency_info(): All tests OK.')
+
+
+
+
+
+def test_populate_sql_with_dependency_specifiers():
+  """Old and new style dependencies should both be stored as specstrings."""
+  deps = {
+      'foo(1)': [['six', [['>=', '1.4'], ['<', '2']]], ['bar', '']],
+      'bar(1)': []}
+
+  _reset_test_db()
+  sqli.populate_sql_with_dependency_specifiers(deps, db_fname=TEST_DB_FNAME)
+
+  assert sorted([('foo(1)', 'six', '>=1.4,<2'), ('foo(1)', 'bar', '')]) == \
+      sorted(sqli.SQL_CURSOR.execute(
+      'SELECT * FROM ' + sqli.SQL_DEP_SPECIFIER_TABLE).fetchall())
+  assert [('bar(1)',)] == sqli.SQL_CURSOR.execute(
+      'SELECT * FROM ' + sqli.SQL_NO_DEPS_TABLE).fetchall()
+
+  print('test_populate_sql_with_dependency_specifiers(): All tests OK.')
+
+
+
 
-  # Clear any pre-existing test database.
-  sqli.initialize(db_fname='data/test_dependencies.db')
-  sqli.delete_all_tables()
 
+def test_bulk_load_mode():
+  """
+  Indexes should be dropped during a bulk load and built again afterwards,
+  and pragmas restored, even after a load that fails.
+  """
+  _reset_test_db()
+  sqli.initialize(db_fname=TEST_DB_FNAME)
+
+  def _pragmas():
+    return (sqli.SQL_CURSOR.execute('PRAGMA journal_mode').fetchone()[0],
+        sqli.SQL_CURSOR.execute('PRAGMA synchronous').fetchone()[0])
+
+  def _indexes():
+    return sorted(row[0] for row in sqli.SQL_CURSOR.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND "
+        "name NOT LIKE 'sqlite_autoindex_%'"))
+
+  all_indexes = sorted(name for (name, indexdef) in sqli.SQL_INDEXDEFS)
+  assert all_indexes, 'Expected some secondary indexes to be defined.'
+  assert all_indexes == _indexes()
+
+  before = _pragmas()
+
+  try:
+    with sqli.bulk_load_mode():
+      assert ('memory', 0) == _pragmas()
+      assert [] == _indexes()
+      raise ValueError('interrupted')
+  except ValueError:
+    pass
+
+  assert before == _pragmas()
+  assert all_indexes == _indexes()
+
+  print('test_bulk_load_mode(): All tests OK.')
+
+
+
+
+
+def test_load_deps_from_sql():
+  """
+  Reading deps and edeps back from the db should give what was put in, in
+  distkey order, with dependencies in their original order.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  deps['newpkg(1)'] = [['unknownpkg', ''], ['six', '>=1.10'], ['b', '>5']]
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  (edeps, packs_wout_avail_version_info, dists_w_missing_dependencies) = \
+      depdata.elaborate_dependencies(deps, versions_by_package)
+
+  _reset_test_db()
   sqli.populate_sql_with_full_dependency_info(
-      edeps, versions_by_package, packs_wout_avail_version_info, 
-      dists_w_missing_dependencies, db_fname='data/test_dependencies.db')
+      edeps, versions_by_package, packs_wout_avail_version_info,
+      dists_w_missing_dependencies, db_fname=TEST_DB_FNAME)
 
+  loaded = list(sqli.load_raw_deps_from_sql())
+  assert sorted(deps) == [distkey for (distkey, dependencies) in loaded]
+  assert deps == dict(loaded)
+  assert deps == sqli.rebuild_deps_from_sql()
+
+  loaded_edeps = sqli.rebuild_deps_from_sql(elaborated=True)
+  assert sorted(edeps) == sorted(loaded_edeps)
+  for distkey in edeps:
+    assert [list(edep) for edep in edeps[distkey]] == loaded_edeps[distkey], \
+        'Mismatch for ' + distkey
+  assert depdata.PACKAGE_VERSIONS_UNKNOWN == loaded_edeps['newpkg(1)'][0][1]
+  assert [] == loaded_edeps['newpkg(1)'][2][1] # nothing satisfies b>5
+
+  print('test_load_deps_from_sql(): All tests OK.')
+
+
+
+
+
+def test_sqlite_edeps():
+  """
+  The resolvers should work unchanged on edeps served from the db.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  (edeps, packs_wout_avail_version_info, dists_w_missing_dependencies) = \
+      depdata.elaborate_dependencies(deps, versions_by_package)
+
+  _reset_test_db()
+  sqli.populate_sql_with_full_dependency_info(
+      edeps, versions_by_package, packs_wout_avail_version_info,
+      dists_w_missing_dependencies, db_fname=TEST_DB_FNAME)
+
+  sql_edeps = sqli.SQLiteEdeps(TEST_DB_FNAME, max_cached=3)
+
+  assert len(edeps) == len(sql_edeps)
+  assert sorted(edeps) == sorted(sql_edeps)
+  for distkey in edeps:
+    assert [list(edep) for edep in edeps[distkey]] == sql_edeps[distkey]
+  assert 3 == len(sql_edeps._decoded)
+  assert 'x(1)' in sql_edeps and 'nonexistent(1)' not in sql_edeps
+
+  solution = ry.backtracking_satisfy('x(1)', sql_edeps, versions_by_package)
+  assert ry.dist_lists_are_equal(solution, testdata.DEPS_SIMPLE_SOLUTION)
+  assert ry.are_fully_satisfied(solution, sql_edeps, versions_by_package,
+      report_issue=True)[0]
+
+  # Without versions_by_package, it is generated from the db's distkeys.
+  assert ry.dist_lists_are_equal(ry.backtracking_satisfy('x(1)', sql_edeps),
+      testdata.DEPS_SIMPLE_SOLUTION)
+
+  sql_edeps.close()
+
+  print('test_sqlite_edeps(): All tests OK.')
+
+
+
+
+
+def test_normalized_schema():
+  """
+  Migrating to the normalized tables should keep all of the data, and
+  versions should get their ordinals.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  deps['newpkg(1)'] = [['unknownpkg', ''], ['six', '>=1.10'], ['b', '>5']]
+  deps['b(1.0)'] = [] # equal to b(1) in pip's eyes
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  (edeps, packs_wout_avail_version_info, dists_w_missing_dependencies) = \
+      depdata.elaborate_dependencies(deps, versions_by_package)
+
+  _reset_test_db()
+  sqli.populate_sql_with_full_dependency_info(
+      edeps, versions_by_package, packs_wout_avail_version_info,
+      dists_w_missing_dependencies, db_fname=TEST_DB_FNAME)
+
+  # Migrating twice replaces, rather than duplicates. Each migration connects
+  # once, reading and writing on the same connection.
+  initialize = sqli.initialize
+  n_initializations = [0]
+  def _counting_initialize(db_fname=None):
+    n_initializations[0] += 1
+    initialize(db_fname)
+  sqli.initialize = _counting_initialize
+  try:
+    for i in range(2):
+      sqli.migrate_to_normalized_schema(TEST_DB_FNAME)
+  finally:
+    sqli.initialize = initialize
+  assert 2 == n_initializations[0], n_initializations[0]
+
+  loaded = list(sqli.load_edeps_from_normalized_sql())
+  assert sorted(edeps) == [distkey for (distkey, e) in loaded]
+  loaded = dict(loaded)
+  for distkey in edeps:
+    expected = [[edep[0], edep[1] if edep[1] == depdata.PACKAGE_VERSIONS_UNKNOWN
+        else depdata.sorted_versions(edep[1]), edep[2]]
+        for edep in edeps[distkey]]
+    assert expected == loaded[distkey], 'Mismatch for ' + distkey
+
+  cursor = sqli.SQL_CURSOR
+  ordinals = dict(cursor.execute('SELECT ' + sqli.SQL_COLUMN_VERS_NAME + ', ' +
+      sqli.SQL_COLUMN_ORDINAL + ' FROM ' + sqli.SQL_VERSIONS_TABLE).fetchall())
+  assert ordinals['1'] == ordinals['1.0'] < ordinals['1.9.0'] < ordinals['2']
+  assert 'unknownpkg' in [row[0] for row in cursor.execute(
+      'SELECT ' + sqli.SQL_COLUMN_PACK_NAME + ' FROM ' +
+      sqli.SQL_PACKAGES_TABLE)]
+
+  # Reverse lookups on the normalized tables are answered from indexes.
+  for (query, index_name) in [
+      ('SELECT ' + sqli.SQL_COLUMN_DEPENDER_DIST_ID + ' FROM ' +
+      sqli.SQL_DEPENDENCIES_TABLE + ' WHERE ' +
+      sqli.SQL_COLUMN_SATISFYING_PACKAGE_ID + ' = ?',
+      'idx_dependencies_by_package'),
+      ('SELECT ' + sqli.SQL_COLUMN_DEPENDENCY_ID + ' FROM ' +
+      sqli.SQL_SATISFYING_DISTS_TABLE + ' WHERE ' +
+      sqli.SQL_COLUMN_SATISFYING_DIST_ID + ' = ?',
+      'idx_satisfying_dists_by_dist')]:
+    plan = ' '.join(str(row[-1]) for row in cursor.execute(
+        'EXPLAIN QUERY PLAN ' + query, (1,)))
+    assert 'COVERING INDEX ' + index_name in plan, plan
+
+  # Populating directly from edeps gives the same.
+  sqli.populate_normalized_sql(edeps, TEST_DB_FNAME)
+  assert loaded == dict(sqli.load_edeps_from_normalized_sql())
+
+  sqli.migrate_to_normalized_schema(TEST_DB_FNAME, drop_old_tables=True)
+  assert loaded == dict(sqli.load_edeps_from_normalized_sql())
+
+  print('test_normalized_schema(): All tests OK.')
+
+
+
+
+
+def test_normalized_schema_batching():
+  """
+  No satisfying dists should be lost when the number of dependencies is an
+  exact multiple of the batch size.
+  """
+  deps = dict(('a(' + str(i) + ')', [['b', '']]) for i in range(1, 7))
+  deps['b(1)'] = []
+  deps['b(2)'] = []
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  edeps = depdata.elaborate_dependencies(deps, versions_by_package)[0]
+
+  _reset_test_db()
+
+  saved_batch_size = sqli.BULK_LOAD_BATCH_SIZE
+  try:
+    for batch_size in [3, 6, 4, 100]:
+      sqli.BULK_LOAD_BATCH_SIZE = batch_size
+      sqli.populate_normalized_sql(edeps, TEST_DB_FNAME)
+
+      for (tablename, expected_count) in [
+          (sqli.SQL_DEPENDENCIES_TABLE, 6),
+          (sqli.SQL_SATISFYING_DISTS_TABLE, 12)]:
+        count = sqli.SQL_CURSOR.execute(
+            'SELECT COUNT(*) FROM ' + tablename).fetchone()[0]
+        assert expected_count == count, 'Expected ' + str(expected_count) + \
+            ' rows in ' + tablename + ' with batch size ' + str(batch_size) + \
+            ', got ' + str(count)
+  finally:
+    sqli.BULK_LOAD_BATCH_SIZE = saved_batch_size
+
+  print('test_normalized_schema_batching(): All tests OK.')
+
+
+
+
+
+def test_normalized_schema_duplicates():
+  """
+  A dist with two dependencies on one package should keep the last, as the
+  dependency specifiers table does, and a load that fails partway should
+  leave the tables as they were.
+  """
+  edeps = {
+      'a(1)': [['b', ['1', '2'], '>=1'], ['c', ['1'], ''], ['b', ['1'], '<2']],
+      'b(1)': [], 'b(2)': [], 'c(1)': []}
+
+  _reset_test_db()
+  sqli.populate_normalized_sql(edeps, TEST_DB_FNAME)
+
+  loaded = dict(sqli.load_edeps_from_normalized_sql())
+  assert [['b', ['1'], '<2'], ['c', ['1'], '']] == sorted(loaded['a(1)']), \
+      loaded
+
+  passes = []
+  def _failing_items():
+    """Read fully for the names and versions, then fail partway through the
+    dependencies, after some batches have been written."""
+    passes.append(None)
+    for i in range(1, 5):
+      yield ('x(' + str(i) + ')', [['y', ['1'], '']])
+    if len(passes) > 1:
+      raise RuntimeError('load interrupted')
+    yield ('y(1)', [])
+
+  saved_batch_size = sqli.BULK_LOAD_BATCH_SIZE
+  sqli.BULK_LOAD_BATCH_SIZE = 1
+  try:
+    sqli.populate_normalized_sql(_failing_items, TEST_DB_FNAME)
+  except RuntimeError:
+    pass
+  else:
+    assert False, 'Expected the interrupted load to raise.'
+  finally:
+    sqli.BULK_LOAD_BATCH_SIZE = saved_batch_size
+
+  # The delete and the batches written before the failure are undone.
+  assert loaded == dict(sqli.load_edeps_from_normalized_sql(TEST_DB_FNAME))
+  assert not sqli.SQL_CONNECTION.in_transaction
+  assert 4 == len(sqli.SQL_CURSOR.execute('SELECT name FROM sqlite_master '
+      'WHERE type = "index" AND name LIKE "idx_%"').fetchall())
+
+  print('test_normalized_schema_duplicates(): All tests OK.')
+
+
+
+
+
+def test_reverse_queries():
+  """
+  Reverse lookups should agree with a scan of edeps, and be answered from
+  the covering indexes.
+  """
+  deps = testdata.DEPS_MODERATE
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+  (edeps, packs_wout_avail_version_info, dists_w_missing_dependencies) = \
+      depdata.elaborate_dependencies(deps, versions_by_package)
+
+  _reset_test_db()
+  sqli.populate_sql_with_full_dependency_info(
+      edeps, versions_by_package, packs_wout_avail_version_info,
+      dists_w_missing_dependencies, db_fname=TEST_DB_FNAME)
+
+  index = depdata.build_reverse_dependency_index(edeps, is_elaborated=True)
+
+  for distkey in list(edeps) + ['nonexistent(1)']:
+    assert depdata.get_dependers_of_dist(distkey, index) == \
+        sqli.get_dependers_of_dist(distkey)
+
+    packname = depdata.get_packname(distkey)
+    assert depdata.get_dependers_of_package(packname, index) == \
+        sqli.get_dependers_of_package(packname)
+
+  for distkey in edeps:
+    for edep in edeps[distkey]:
+      expected = [] if edep[1] == depdata.PACKAGE_VERSIONS_UNKNOWN else \
+          [depdata.distkey_format(edep[0], v) for v in edep[1]]
+      assert expected == sqli.get_satisfiers_of_dependency(distkey, edep[0])
+
+  # Bulk loading dropped and recreated the indexes, and the queries use them.
+  for (query, index_name) in [
+      (sqli._DEPENDERS_OF_DIST_QUERY, sqli.SQL_INDEXDEFS[0][0]),
+      (sqli._DEPENDERS_OF_PACKAGE_QUERY, sqli.SQL_INDEXDEFS[1][0])]:
+    plan = ' '.join(str(row[-1]) for row in sqli.SQL_CURSOR.execute(
+        'EXPLAIN QUERY PLAN ' + query, ('x',)))
+    assert 'COVERING INDEX ' + index_name in plan, plan
+
+  # With the text-keyed tables dropped, the same answers come from the
+  # normalized tables, through their indexes.
+  sqli.migrate_to_normalized_schema(TEST_DB_FNAME, drop_old_tables=True)
+
+  for distkey in list(edeps) + ['nonexistent(1)']:
+    assert depdata.get_dependers_of_dist(distkey, index) == \
+        sqli.get_dependers_of_dist(distkey)
+
+    packname = depdata.get_packname(distkey)
+    assert depdata.get_dependers_of_package(packname, index) == \
+        sqli.get_dependers_of_package(packname)
+
+  for distkey in edeps:
+    for edep in edeps[distkey]:
+      expected = [] if edep[1] == depdata.PACKAGE_VERSIONS_UNKNOWN else \
+          [depdata.distkey_format(edep[0], v)
+          for v in depdata.sorted_versions(edep[1])]
+      assert expected == sqli.get_satisfiers_of_dependency(distkey, edep[0])
+
+  for (query, index_name) in [
+      (sqli._NORMALIZED_DEPENDERS_OF_DIST_QUERY, 'idx_satisfying_dists_by_dist'),
+      (sqli._NORMALIZED_DEPENDERS_OF_PACKAGE_QUERY,
+      'idx_dependencies_by_package')]:
+    plan = ' '.join(str(row[-1]) for row in sqli.SQL_CURSOR.execute(
+        'EXPLAIN QUERY PLAN ' + query, ('x',) * query.count('?')))
+    assert 'COVERING INDEX ' + index_name in plan, plan
+    assert 'SCAN' not in plan, plan
+
+  sql_edeps = sqli.SQLiteEdeps(TEST_DB_FNAME)
+  assert sql_edeps.normalized
+  assert sorted(edeps) == list(sql_edeps) and len(edeps) == len(sql_edeps)
+  assert dict(sqli.load_edeps_from_normalized_sql()) == dict(sql_edeps)
+  assert 'nonexistent(1)' not in sql_edeps
+  assert ry.dist_lists_are_equal(ry.backtracking_satisfy('x(1)', sql_edeps),
+      testdata.DEPS_SIMPLE_SOLUTION)
+  sql_edeps.close()
+
+  print('test_reverse_queries(): All tests OK.')
 
-  print('All tests in main() OK.')
 
 
 
@@ -0,0 +1,100 @@
+"""
+<Program>
+  test_vectorized_elaboration.py
+
+<Purpose>
+  Some unit tests for the numpy elaboration engine in
+  depresolve.vectorized_elaboration, checking it against pip's SpecifierSet.
+
+"""
+
+import depresolve # __init__ for errors
+import depresolve.depdata as depdata
+import depresolve.vectorized_elaboration as vectorized_elaboration
+import pip._vendor.packaging.specifiers
+import testdata
+
+# Versions exercising pip's special cases: prereleases, postreleases, local
+# versions, epochs, legacy versions, and equal versions spelled differently.
+TRICKY_VERSIONS = ['1', '1.0', '1.0.0', '1.0a1', '1.0rc1', '1.0.dev0',
+    '1.0.post1', '1.post1', '1rc1', '1.0+local', '1.0.1', '1.1.dev1', '1.2',
+    '1.2.3', '2.0', '2.0a1', '2.0.post1', '2.0+abc', '2.1', '10.0', '1!1.0',
+    '0.9', 'foo', '1.0-legacy-x', '20150101']
+
+TRICKY_SPECSTRINGS = ['', '>=1.0', '<2', '<2.0a1', '>2', '>2.0.post1', '<=1.0',
+    '==1', '==1.0+local', '!=1.0', '~=1.0', '~=1.0.0', '==1.*', '==1.0.*',
+    '!=1.*', '==1!1.*', '==01.*', '>=1.0a1', '>=1.0,<2,!=1.2', '===foo',
+    '>1.0,<1.1', '~=2.0.post1', '<=20150101', '~=1.0rc1', '~=1.0.rev1',
+    '~=1.0.c1', '~=01.0', '~=1!1.0', '~=v1.0', '==1.0.0.*',
+    '==1.0.0.0.*']
+
+
+
+
+def main():
+  test_vectorized_filter()
+  test_elaborate_dependencies_vectorized()
+  print("All tests in main() OK.")
+
+
+
+
+
+def test_vectorized_filter():
+  """
+  VectorizedElaborator.filter should match SpecifierSet.filter exactly.
+  """
+  if vectorized_elaboration.numpy is None:
+    print("test_vectorized_filter(): numpy not available. Skipping.")
+    return
+
+  versions_by_package = {'tricky': TRICKY_VERSIONS,
+      'finals': ['0.1', '0.2', '1.0'], 'prereleases': ['1.0a1', '1.0b1']}
+  elaborator = vectorized_elaboration.VectorizedElaborator(versions_by_package)
+
+  for packname in versions_by_package:
+    for specstring in TRICKY_SPECSTRINGS:
+      for allow_prerelease in [False, True]:
+        specset = pip._vendor.packaging.specifiers.SpecifierSet(specstring)
+        if allow_prerelease:
+          specset.prereleases = True
+        expected = list(specset.filter(versions_by_package[packname]))
+
+        result = elaborator.filter(packname, specstring, allow_prerelease)
+
+        assert expected == result, 'Mismatch for ' + packname + ' ' + \
+            specstring + ' allow_prerelease=' + str(allow_prerelease) + \
+            '. Expected ' + str(expected) + '; got ' + str(result)
+
+  assert elaborator.vectorized > elaborator.fallbacks > 0
+
+  print("test_vectorized_filter(): All tests OK.")
+
+
+
+
+
+def test_elaborate_dependencies_vectorized():
+  """
+  Vectorized elaboration should give what depdata.elaborate_dependencies
+  gives, with or without numpy.
+  """
+  deps = dict(testdata.DEPS_MODERATE)
+  deps['y(1)'] = [['six', '>=1.4,!=1.5.1,<1.9'], ['coloredlogs', '~=0.4.0']]
+  versions_by_package = depdata.generate_dict_versions_by_package(deps)
+
+  for allow_prerelease in [False, True]:
+    expected = depdata.elaborate_dependencies(deps, versions_by_package,
+        allow_prerelease=allow_prerelease)
+    result = vectorized_elaboration.elaborate_dependencies_vectorized(deps,
+        versions_by_package, allow_prerelease=allow_prerelease)
+    assert expected == result
+
+  print("test_elaborate_dependencies_vectorized(): All tests OK.")
+
+
+
+
+
+if __name__ == '__main__':
+  main()